@@ -0,0 +1,139 @@
+"""
+Micro-benchmarks for the in-memory data layout and response encoding.
+
+    python bench.py [vehicles]
+
+Runs against the memory backend with the scheduler off; nothing is written
+to disk.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['SCHEDULER_ENABLED'] = 'false'
+
+import main  # noqa: E402
+
+
+MAKES = {
+    'Honda': ['Accord', 'Civic', 'CR-V', 'Pilot'],
+    'Toyota': ['Camry', 'Corolla', 'RAV4', 'Tacoma'],
+    'Ford': ['F-150', 'Escape', 'Explorer', 'Mustang'],
+    'Chevrolet': ['Silverado', 'Equinox', 'Malibu', 'Tahoe'],
+}
+TRIMS = ['', 'LX', 'EX', 'EX-L', 'Sport', 'Limited', 'XLT', 'LT']
+COLORS = ['White', 'Black', 'Silver', 'Gray', 'Red', 'Blue']
+
+
+def sample_vehicles(n, seed=1):
+    rng = random.Random(seed)
+    vehicles = []
+    for _ in range(n):
+        make = rng.choice(list(MAKES))
+        acquisition = round(rng.uniform(8000, 55000), 2)
+        payload = {
+            'year': rng.randint(2014, 2024), 'make': make, 'model': rng.choice(MAKES[make]),
+            'trim': rng.choice(TRIMS), 'mileage': rng.randint(5000, 140000),
+            'ext_color': rng.choice(COLORS), 'int_color': rng.choice(COLORS[:3]),
+            'vin': ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(17)),
+            'acquisition_cost': acquisition, 'recon_cost': rng.choice([0, 450, 1200]),
+            'list_price': round(acquisition * rng.uniform(1.05, 1.3), -2),
+            'wholesale_price': round(acquisition * rng.uniform(0.85, 1.0), -2),
+            'days_in_inventory': rng.randint(0, 120),
+            'comp_low': round(acquisition * 1.02, -2), 'comp_high': round(acquisition * 1.25, -2),
+            'competing_units': rng.randint(0, 25), 'views_7': rng.randint(0, 300),
+            'views_30': rng.randint(0, 1200), 'leads_7': rng.randint(0, 8), 'leads_30': rng.randint(0, 25),
+        }
+        # Decode the way records arrive from JSON, so no strings are shared up front
+        vehicles.append(main.json.loads(main.json.dumps(main.build_vehicle_record(None, payload))))
+    return vehicles
+
+
+def measure(build):
+    """(result, bytes still allocated after build)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def bench_vehicle_memory(n):
+    print(f'Vehicle records, {n:,} units')
+    payloads = sample_vehicles(n)
+
+    dict_store, dict_bytes = measure(lambda: [dict(main.json.loads(main.json.dumps(v))) for v in payloads])
+    compact, compact_bytes = measure(lambda: [main.VehicleRecord(main.json.loads(main.json.dumps(v))) for v in payloads])
+    print(f'  dict            {dict_bytes / n:8.0f} B/vehicle')
+    print(f'  VehicleRecord   {compact_bytes / n:8.0f} B/vehicle  ({compact_bytes / dict_bytes:.0%} of dict)')
+
+    store = main.MemoryStore('vehicles')
+    store.put_many(payloads)
+    started = time.perf_counter()
+    active = store.scan([('status', '=', 'active')])
+    print(f'  full scan       {(time.perf_counter() - started) * 1000:8.1f} ms ({len(active):,} records)')
+    ids = [v['id'] for v in payloads[:10000]]
+    started = time.perf_counter()
+    for vehicle_id in ids:
+        store[vehicle_id]
+    print(f'  get             {(time.perf_counter() - started) / len(ids) * 1e6:8.2f} us')
+    del dict_store, compact
+
+
+def timed(fn, items):
+    """Mean microseconds per item."""
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def bench_json(n):
+    n = min(n, 2000)
+    print(f'Analysis responses, {n:,} reports')
+    vehicles = sample_vehicles(n)
+    main.vehicles_db.put_many(vehicles)
+    flask_default = main.DefaultJSONProvider(main.app)
+    encoders = [('stdlib', main.ResponseJSONProvider(main.app, 'stdlib'))]
+    if main.orjson:
+        encoders.append(('orjson', main.ResponseJSONProvider(main.app, 'orjson')))
+
+    for curve_format in ('records', 'arrays'):
+        print(f'  curve={curve_format}')
+        responses = [{'message': 'Analysis complete', 'report': main.build_report('bench', v, main.analyze_vehicle(v, curve_format))}
+                     for v in vehicles]
+        baseline = timed(lambda r: flask_default.dumps(r), responses)
+        print(f'    flask default   {baseline:8.1f} us')
+        for label, provider in encoders:
+            # Fresh sections each run so the first pass really encodes them
+            main.analysis_section_cache.clear()
+            cold = [{'message': 'Analysis complete', 'report': main.build_report('bench', v, main.analyze_vehicle(v, curve_format))}
+                    for v in vehicles]
+            first = timed(provider.encode_response, cold)
+            warm = [{'message': 'Analysis complete', 'report': main.build_report('bench', v, main.analyze_vehicle(v, curve_format))}
+                    for v in vehicles]
+            again = timed(provider.encode_response, warm)
+            print(f'    {label:<15} {first:8.1f} us   re-analysis {again:6.1f} us  ({baseline / again:.0f}x)')
+
+        bodies = [main.app.json.encode_response(r) for r in responses]
+        raw = sum(len(b) for b in bodies)
+        sizes = [('identity', raw, None), ('gzip', None, 'gzip')]
+        if main.brotli:
+            sizes.append(('br', None, 'br'))
+        for label, size, encoding in sizes:
+            spent = 0
+            if encoding:
+                started = time.perf_counter()
+                size = sum(len(main.compress_body(b, encoding)) for b in bodies)
+                spent = (time.perf_counter() - started) / n * 1e6
+            print(f'    {label:<15} {size / n:8.0f} B/response ({size / raw:.0%})' + (f'  {spent:6.1f} us' if encoding else ''))
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    bench_vehicle_memory(n)
+    bench_json(n)
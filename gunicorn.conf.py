@@ -0,0 +1,8 @@
+# Read by gunicorn from the working directory (render.yaml's startCommand).
+
+
+def post_worker_init(worker):
+    # Start the nightly scheduler as each worker boots, not on its first request
+    import main
+    if main.SCHEDULER_ENABLED:
+        main.start_scheduler()
@@ -1,19 +1,1290 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 import os
+import base64
+import codecs
+import csv
+import io
 import json
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
 import math
+import multiprocessing
+import operator
+import time
 import uuid
 import re
-from datetime import datetime
+import sys
+import bisect
+import queue
+import sqlite3
+import threading
+import zlib
+import asyncio
+import atexit
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import aiohttp
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is the fallback encoder
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-only
+    brotli = None
 
 app = Flask(__name__, static_folder='public', static_url_path='')
 
 # ============================================================
-# IN-MEMORY STORAGE
+# STORAGE
 # ============================================================
-vehicles_db = {}
-reports_db = {}
-comps_db = {}
+# Stores behave like dicts keyed by record id, so endpoints read and write
+# them the same way regardless of backend. STORAGE_BACKEND=sqlite (default)
+# keeps one database file shared by every gunicorn worker; =memory keeps
+# per-process dicts (handy for local experiments, lost on restart).
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+# Relative paths are taken from this file's directory, not the working directory
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.environ.get('DATABASE_PATH', 'dealership.db'))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+# Running lot totals kept by the vehicles store. Every write adds the new
+# record's contribution and subtracts the old one, so reads are O(1).
+INVENTORY_AGGREGATES = (
+    'total_vehicles', 'total_invested', 'total_list', 'total_days',
+    'daily_burn', 'healthy', 'at_risk', 'danger',
+)
+
+
+def inventory_contribution(v):
+    """What one vehicle adds to INVENTORY_AGGREGATES, or None if not active."""
+    if v is None or v.get('status') != 'active':
+        return None
+    invested = v['acquisition_cost'] + v['recon_cost']
+    di = v['days_in_inventory']
+    return (
+        1, invested, v['list_price'], di,
+        invested * v['floorplan_rate'] / 100 / 365,
+        int(di <= 30), int(30 < di <= 60), int(di > 60),
+    )
+
+
+def aggregate_delta(contribution, old, new):
+    """Per-field change in the totals when `old` is replaced by `new`."""
+    before = contribution(old)
+    after = contribution(new)
+    if before is None and after is None:
+        return None
+    before = before or (0,) * len(after)
+    after = after or (0,) * len(before)
+    return [a - b for a, b in zip(after, before)]
+
+
+# Vehicle record fields: field -> (coerce, default), in record order
+VEHICLE_FIELDS = {
+    'year': (int, 0),
+    'make': (str, ''),
+    'model': (str, ''),
+    'trim': (str, ''),
+    'mileage': (int, 0),
+    'ext_color': (str, ''),
+    'int_color': (str, ''),
+    'vin': (str, ''),
+    'equipment': (str, ''),
+    'acquisition_cost': (float, 0),
+    'recon_cost': (float, 0),
+    'list_price': (float, 0),
+    'floorplan_rate': (float, 7.25),
+    'wholesale_price': (float, 0),
+    'min_gross': (float, 2000),
+    'days_in_inventory': (int, 0),
+    'price_changes': (int, 0),
+    'days_since_price_change': (int, 0),
+    'comp_low': (float, 0),
+    'comp_high': (float, 0),
+    'competing_units': (int, 0),
+    'demand_signal': (str, 'moderate'),
+    'seasonal_notes': (str, ''),
+    'views_7': (int, 0),
+    'views_30': (int, 0),
+    'leads_7': (int, 0),
+    'leads_30': (int, 0),
+    'test_drives_7': (int, 0),
+    'test_drives_30': (int, 0),
+    'sales_notes': (str, ''),
+}
+# Fields a PATCH may touch: everything but id and created_at
+PATCHABLE_VEHICLE_FIELDS = dict(VEHICLE_FIELDS, status=(str, 'active'))
+
+
+VEHICLE_RECORD_FIELDS = ('id', *VEHICLE_FIELDS, 'status', 'created_at')
+
+
+class VehicleRecord(Mapping):
+    """
+    Compact in-memory form of a vehicle record: one slot per field instead
+    of a 33-key dict, with the strings that repeat across the lot (make,
+    model, trim, colors, ...) interned. A read-only Mapping; to_dict()
+    gives back the plain record.
+    """
+
+    __slots__ = VEHICLE_RECORD_FIELDS + ('_extra',)
+    INTERNED = frozenset(['make', 'model', 'trim', 'ext_color', 'int_color', 'demand_signal', 'status'])
+    FIELDS = frozenset(VEHICLE_RECORD_FIELDS)
+    _all_fields = staticmethod(operator.attrgetter(*VEHICLE_RECORD_FIELDS))
+
+    def __init__(self, record):
+        extra = None
+        for field, value in record.items():
+            if field in self.FIELDS:
+                if field in self.INTERNED and type(value) is str:
+                    value = sys.intern(value)
+                setattr(self, field, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[field] = value
+        self._extra = extra
+
+    def __getitem__(self, field):
+        if field in self.FIELDS:
+            try:
+                return getattr(self, field)
+            except AttributeError:
+                pass
+        elif self._extra and field in self._extra:
+            return self._extra[field]
+        raise KeyError(field)
+
+    def __iter__(self):
+        for field in VEHICLE_RECORD_FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        try:
+            record = dict(zip(VEHICLE_RECORD_FIELDS, self._all_fields(self)))
+        except AttributeError:
+            record = {field: getattr(self, field) for field in VEHICLE_RECORD_FIELDS if hasattr(self, field)}
+        if self._extra:
+            record.update(self._extra)
+        return record
+
+
+# Reports are stored as compact JSON deflated against a preset dictionary of
+# the analysis keys and the phrases the report templates fill in, so the
+# reasoning text costs a few bytes per report instead of hundreds. The
+# 90-day curve is packed as float32 and kept once per distinct curve in the
+# report_curves store; the report carries only its digest, and the nightly
+# job sweeps curves no report uses any more. The leading format byte
+# selects the dictionary: never edit REPORT_ZDICT_V1 in place, add a V2 next
+# to it.
+REPORT_FORMAT_V1 = b'\x01'
+REPORT_ZDICT_V1 = ''.join([
+    'Stable', 'Probability-weighted retail no longer justifies holding costs', 'Value Position',
+    'Limited competition', ' Stronger pricing power', 'MODERATE', 'Moderate competition',
+    ' Vehicle attributes also matter', 'Standard market dynamics',
+    ' Price and marketing effort are primary levers', ' Highlight: ', 'Approaching danger zone',
+    ' Active intervention required', 'Within target velocity window',
+    'Near-certain retail exit if priced correctly', ' but margin erosion makes timing critical',
+    'th percentile with ', ' days aging', ' reduction to ', ' repositions to mid-market with negotiation room',
+    'MODERATE-HIGH', 'Meaningful competition', ' Price changes impact lead volume',
+    'Price reduction expected to increase ', 'Execute ', ' price reduction', 'Reduce from ', ' Estimated +',
+    ' sell probability', ' Daily hold cost: ', 'Reposition competitively and trigger platform re-indexing',
+    'Top Quartile — Overpriced Risk', 'Execute today', 'Price Resistance', 'Buyers pushing back per sales team',
+    'Priced in upper range of comps — limits buyer pool',
+    'Extended exposure at high price depletes interested buyers', 'Wholesale produces significant loss',
+    ' Aggressive retail pricing required immediately', 'View trend declining sharply — losing visibility',
+    'Declining Views', 'Down ', 'soft', 'Soft demand extends expected time to sale', 'high',
+    'High regional demand supports faster absorption', 'Incentive Compression',
+    'Newer model incentives pulling ceiling down', 'normal', 'AT-RISK', 'Declining', 'HEALTHY',
+    ' competing units', ' Buyers are highly price-aware', ' Price directly impacts search visibility',
+    ' Highlight: key features', 'REDUCE', 'Mid-Market', ' competing units give buyers alternatives and time',
+    'Heavy Supply', ' units', ' Liquidation risk', 'Accelerating', 'Retail-wholesale spread ',
+    ' justifies continued retail', ' Wholesale is the backstop', 'Past target velocity',
+    ' Immediate action needed', 'Price and engagement balanced', ' Hold and monitor', 'No action needed',
+    'Price hold expected to maintain ', 'Hold price — monitor ', 'THIS WEEK', 'Maintain ',
+    ' Reassess if views drop >', 'Avoid disrupting momentum', 'Stale Listing', ' many buyers have passed',
+    'Many local buyers have already seen and passed on this listing', 'Remaining buyer pool is thin',
+    ' Price is the only lever left', 'Re-engage all ', ' leads', 'BY WEDNESDAY', 'Phone first', ' text',
+    ' email', ' recent leads within ', ' hours', 'Re-engagement converts ', 'x cold inbound',
+    'Solid engagement — conversion rate is the key lever', 'Days ',
+    ': Probability builds as listing gains exposure',
+    ': Daily sell probability begins declining as buyer pool depletes', 'The window between day ', ' and day ',
+    ' is when this vehicle is most likely to sell',
+    ' Marketing and pricing actions have maximum impact during this window', 'Beyond day ',
+    ' holding becomes economically irrational', ' days remain', '-day sell probability by ',
+    ' percentage points', 'DEALER_TRADE', 'If <', ' wholesale immediately', 'Audit and upgrade listing',
+    '+ photos', ' Video walkaround', ' Verify feature filters', 'Maximize conversion from traffic',
+    'Brief sales team', 'TOMORROW AM', 'Sticker: ', ' Floor: ', ' No leading with concessions', 'Protect gross',
+    ' Prevent demoralized selling', 'Hard wholesale date: Day ', 'CALENDAR NOW', ' = wholesale',
+    ' No extensions', ' WS net: ', 'Remove emotional attachment to sunk costs', 'WHOLESALE', 'TODAY', 'DANGER',
+    'HIGH', 'HOLD', ' test drives by day ', 'RETAIL', 'MEDIUM', ' days', '"id":', '"vehicle_id":',
+    '"vehicle_title":', '"analysis":', '"financials":', '"potential_gross_at_sticker":',
+    '"daily_floorplan_cost":', '"floorplan_accrued_to_date":', '"current_net_gross":', '"wholesale_net_today":',
+    '"market_position":', '"percentile":', '"label":', '"comp_range":', '"competing_units":',
+    '"demand_signal":', '"engagement":', '"views_7":', '"views_30":', '"leads_7":', '"leads_30":',
+    '"test_drives_7":', '"test_drives_30":', '"view_trend_pct":', '"view_trend_label":', '"lead_to_view_rate":',
+    '"test_drive_to_lead_rate":', '"engagement_score":', '"sale_probability":', '"prob_30_day":',
+    '"prob_60_day":', '"prob_90_day":', '"factors_30":', '"factors_60":', '"factors_90":', '"daily_curve":',
+    '"curve_insights":', '"acceleration_phase":', '"peak_probability_day":', '"decay_begins":',
+    '"decay_start_day":', '"critical_insight":', '"aging":', '"zone":', '"zone_detail":',
+    '"days_in_inventory":', '"erosion_table":', '"irrationality_threshold":', '"day":', '"days_remaining":',
+    '"pricing":', '"action":', '"change_amount":', '"current_list_price":', '"new_list_price":',
+    '"elasticity":', '"expected_transaction_range":', '"expected_gross_range":', '"probability_impact":',
+    '"estimated_prob_change_pct":', '"estimated_gross_impact":', '"exit_path":', '"optimal":', '"paths":',
+    '"decision_trigger":', '"reassess_at_day":', '"condition":', '"action_plan":', '"risk_and_confidence":',
+    '"risks":', '"percent":', '"data_completeness":', '"summary":', '"vehicle":', '"mileage":', '"color":',
+    '"current_list":', '"recommended_price":', '"price_action":', '"aging_zone":', '"optimal_exit":',
+    '"days_to_decision":', '"generated_at":', '"created_at":', '"total_invested":', '"explanation":',
+    '"reasoning":', '"level":', '"confidence":', '"factor":', '"severity":', '"low":', '"high":', '"path":',
+    '"recommended":', '"expected_gross_low":', '"expected_gross_high":', '"expected_days":', '"probability":',
+    '"additional_days":', '"total_days":', '"floorplan_accrued":', '"gross_at_sticker":',
+    '"realistic_gross_low":', '"realistic_gross_high":', '"priority":', '"title":', '"purpose":', '"timing":',
+    '"detail":',
+]).encode()
+REPORT_CURVE_DAYS = list(range(1, 91))  # CURVE_DAYS as a list
+REPORT_CURVE_CACHE_SIZE = int(os.environ.get('REPORT_CURVE_CACHE_SIZE', 4096))
+# Unused curves younger than this survive sweep_report_curves
+REPORT_CURVE_GRACE_SECONDS = 3600
+REPORT_CURVE_SWEEP_PAGE = 500
+
+
+def pack_report(report):
+    """Stored bytes for a report: format byte + deflated JSON, curve by reference."""
+    analysis = report.get('analysis')
+    sale_probability = analysis.get('sale_probability') if isinstance(analysis, dict) else None
+    if isinstance(sale_probability, dict) and sale_probability.get('daily_curve') is not None:
+        ref = pack_curve(sale_probability['daily_curve'])
+        if ref is not None:
+            report = dict(report, analysis=dict(analysis, sale_probability=dict(sale_probability, daily_curve=ref)))
+    compressor = zlib.compressobj(9, zdict=REPORT_ZDICT_V1)
+    body = compressor.compress(json.dumps(report, separators=(',', ':')).encode()) + compressor.flush()
+    return REPORT_FORMAT_V1 + body
+
+
+def unpack_report(data):
+    """Inverse of pack_report; rows written before compaction are plain JSON."""
+    if isinstance(data, str):
+        return json.loads(data)
+    if data[:1] != REPORT_FORMAT_V1:
+        raise ValueError(f'Unknown report format: {data[:1]!r}')
+    decompressor = zlib.decompressobj(zdict=REPORT_ZDICT_V1)
+    report = json.loads(decompressor.decompress(data[1:]) + decompressor.flush())
+    sale_probability = (report.get('analysis') or {}).get('sale_probability')
+    if isinstance(sale_probability, dict):
+        ref = sale_probability.get('daily_curve')
+        if isinstance(ref, dict) and '$curve' in ref:
+            sale_probability['daily_curve'] = inflate_curve(ref)
+    return report
+
+
+def pack_curve(curve):
+    """
+    Stores a standard 90-day curve in report_curves and returns the
+    reference that replaces it, or None to keep the curve inline.
+    """
+    packing = packed_curve(curve)
+    if packing is None:
+        return None
+    digest, packed, curve_format = packing
+    stored = report_curves_db.get(digest)
+    now = time.time()
+    # Re-stamp a reused curve so the sweep cannot take it while its report is being written
+    if stored is None or stored.get('stored_ts', 0) < now - REPORT_CURVE_GRACE_SECONDS / 2:
+        report_curves_db[digest] = {'id': digest, 'curve': base64.b64encode(packed).decode(), 'stored_ts': now}
+    return {'$curve': digest, 'format': curve_format}
+
+
+def packed_curve(curve):
+    """(digest, float32 bytes, format) for a standard 90-day curve, else None."""
+    if isinstance(curve, dict):
+        curve_format = 'arrays'
+        days, daily, cumulative = curve.get('day'), curve.get('daily_probability'), curve.get('cumulative_probability')
+        if len(curve) != 3:
+            return None
+    elif all(isinstance(point, dict) and len(point) == 3 for point in curve):
+        curve_format = 'records'
+        try:
+            days = [point['day'] for point in curve]
+            daily = [point['daily_probability'] for point in curve]
+            cumulative = [point['cumulative_probability'] for point in curve]
+        except KeyError:
+            return None
+    else:
+        return None
+    if days != REPORT_CURVE_DAYS:
+        return None
+    if not all(type(v) is float for v in daily + cumulative):
+        return None
+    packed = np.array(daily + cumulative, dtype='<f4').tobytes()
+    # float32 only round-trips values at the curve's 2/1 decimal precision
+    if curve_values(packed) != (tuple(daily), tuple(cumulative)):
+        return None
+    return hashlib.sha256(packed).hexdigest()[:32], packed, curve_format
+
+
+def curve_values(packed):
+    """(daily, cumulative) tuples back from packed float32, at curve precision."""
+    values = np.frombuffer(packed, dtype='<f4').tolist()
+    return (tuple(round(v, 2) for v in values[:len(REPORT_CURVE_DAYS)]),
+            tuple(round(v, 1) for v in values[len(REPORT_CURVE_DAYS):]))
+
+
+@functools.lru_cache(maxsize=REPORT_CURVE_CACHE_SIZE)
+def load_curve(digest):
+    return curve_values(base64.b64decode(report_curves_db[digest]['curve']))
+
+
+def inflate_curve(ref):
+    """Curve reference back to the format_probability_curve shape (fresh lists)."""
+    daily, cumulative = load_curve(ref['$curve'])
+    if ref.get('format') == 'arrays':
+        return {
+            'day': list(REPORT_CURVE_DAYS),
+            'daily_probability': list(daily),
+            'cumulative_probability': list(cumulative),
+        }
+    return [
+        {'day': d, 'daily_probability': p, 'cumulative_probability': c}
+        for d, p, c in zip(REPORT_CURVE_DAYS, daily, cumulative)
+    ]
+
+
+def sweep_report_curves():
+    """
+    Deletes stored curves that no report uses any more (overwritten or
+    deleted reports leave theirs behind). Curves stamped within the grace
+    window are kept, as their report may still be on its way. Returns how
+    many were deleted.
+    """
+    used = set()
+    after = None
+    while True:
+        page = reports_db.scan(after=after, limit=REPORT_CURVE_SWEEP_PAGE)
+        for report in page:
+            sale_probability = (report.get('analysis') or {}).get('sale_probability')
+            if isinstance(sale_probability, dict) and sale_probability.get('daily_curve') is not None:
+                packing = packed_curve(sale_probability['daily_curve'])
+                if packing is not None:
+                    used.add(packing[0])
+        if len(page) < REPORT_CURVE_SWEEP_PAGE:
+            break
+        after = (page[-1].get('created_at') or '', page[-1]['id'])
+
+    cutoff = time.time() - REPORT_CURVE_GRACE_SECONDS
+    deleted = 0
+    for digest in list(report_curves_db):
+        if digest in used:
+            continue
+        with storage_transaction():
+            stored = report_curves_db.get(digest)
+            if stored is not None and stored.get('stored_ts', 0) < cutoff:
+                del report_curves_db[digest]
+                deleted += 1
+    return deleted
+
+
+# Per-store columns lifted out of the record for indexing and filtering,
+# plus the indexes built over them. Columns read the top-level key of the
+# same name unless `paths` points somewhere deeper in the record.
+# `aggregates` names running totals and the per-record contribution.
+# `memory_codec` is an optional (encode, decode) pair for the in-memory
+# form only; `codec` encodes records to bytes for every backend.
+# `versioned` stamps every write with the next value of a store-wide
+# sequence, so a record's version changes whenever it does (even across
+# delete and re-create) and the sequence itself versions the collection.
+STORE_SCHEMAS = {
+    'vehicles': {
+        'columns': {
+            'status': 'TEXT', 'days_in_inventory': 'INTEGER', 'created_at': 'TEXT',
+            'make': 'TEXT', 'model': 'TEXT',
+        },
+        'indexes': [
+            'status', 'days_in_inventory', 'created_at, id',
+            'make COLLATE NOCASE, model COLLATE NOCASE',
+        ],
+        'aggregates': (INVENTORY_AGGREGATES, inventory_contribution),
+        'versioned': True,
+        # MemoryStore keeps vehicles as VehicleRecord and hands out dicts
+        'memory_codec': (VehicleRecord, VehicleRecord.to_dict),
+    },
+    'reports': {
+        'columns': {
+            'vehicle_id': 'TEXT', 'created_at': 'TEXT',
+            'aging_zone': 'TEXT', 'price_action': 'TEXT', 'optimal_exit': 'TEXT',
+        },
+        'paths': {
+            'aging_zone': ('analysis', 'summary', 'aging_zone'),
+            'price_action': ('analysis', 'summary', 'price_action'),
+            'optimal_exit': ('analysis', 'summary', 'optimal_exit'),
+        },
+        'indexes': ['vehicle_id', 'created_at, id', 'aging_zone'],
+        'codec': (pack_report, unpack_report),
+        'versioned': True,
+    },
+    # Packed daily curves shared by reports, keyed by digest (see pack_curve)
+    'report_curves': {'columns': {}, 'indexes': []},
+    'comps': {
+        'columns': {'expires_at': 'REAL', 'accessed_at': 'REAL'},
+        'indexes': ['expires_at', 'accessed_at'],
+    },
+    'meta': {'columns': {}, 'indexes': []},
+}
+
+
+def column_value(record, name, column):
+    """Value of an indexed column for a record, per STORE_SCHEMAS."""
+    value = record
+    for key in STORE_SCHEMAS[name].get('paths', {}).get(column, (column,)):
+        if not isinstance(value, Mapping):
+            return None
+        value = value.get(key)
+    return value
+
+
+def record_matches(record, name, filters):
+    """Python evaluation of `scan` filters, for backends without SQL."""
+    return values_match([column_value(record, name, column) for column, _, _ in filters], filters)
+
+
+def values_match(values, filters):
+    """record_matches over column values already pulled out, one per filter."""
+    for actual, (column, op, value) in zip(values, filters):
+        if actual is None:
+            return False
+        if op == '=' and actual != value:
+            return False
+        if op == 'nocase' and str(actual).lower() != str(value).lower():
+            return False
+        if op == '<' and not actual < value:
+            return False
+        if op == '<=' and not actual <= value:
+            return False
+        if op == '>' and not actual > value:
+            return False
+    return True
+
+
+class MemoryStore(MutableMapping):
+    """
+    Process-local store backed by a plain dict, with a sorted
+    (created_at, id) list kept up to date on every write for `scan`.
+    A schema codec (encode, decode) stores records in a compact form;
+    reads then return freshly decoded dicts. A bytes `codec` hides the
+    record, so its indexed columns are kept alongside for filtering.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        schema = STORE_SCHEMAS[name]
+        self._encode, self._decode = schema.get('memory_codec') or schema.get('codec') or (None, None)
+        self._columns = {} if 'codec' in schema else None
+        self._data = {}
+        self._order = []
+        self._lock = threading.RLock()
+        self._aggregates = STORE_SCHEMAS[name].get('aggregates')
+        self._totals = [0] * len(self._aggregates[0]) if self._aggregates else None
+        self._versions = {} if schema.get('versioned') else None
+        self._sequence = 0
+
+    @staticmethod
+    def _order_key(record_id, record):
+        return (record.get('created_at') or '', record_id)
+
+    def __contains__(self, record_id):
+        return record_id in self._data
+
+    def __getitem__(self, record_id):
+        record = self._data[record_id]
+        return self._decode(record) if self._decode else record
+
+    def __setitem__(self, record_id, record):
+        key = self._order_key(record_id, record)
+        columns = None
+        if self._columns is not None:
+            columns = {col: column_value(record, self.name, col)
+                       for col in ('created_at', *STORE_SCHEMAS[self.name]['columns'])}
+        with self._lock:
+            self._apply_delta(record_id, record)
+            self._unindex(record_id)
+            self._data[record_id] = self._encode(record) if self._encode else record
+            if columns is not None:
+                self._columns[record_id] = columns
+            if self._versions is not None:
+                self._sequence += 1
+                self._versions[record_id] = self._sequence
+            bisect.insort(self._order, key)
+
+    def __delitem__(self, record_id):
+        with self._lock:
+            self._apply_delta(record_id, None)
+            self._unindex(record_id)
+            del self._data[record_id]
+            if self._columns is not None:
+                del self._columns[record_id]
+            if self._versions is not None:
+                self._sequence += 1
+                del self._versions[record_id]
+
+    def _apply_delta(self, record_id, new):
+        if self._aggregates:
+            old = self._data.get(record_id)
+            if old is not None and self._columns is not None:
+                old = self._decode(old)
+            delta = aggregate_delta(self._aggregates[1], old, new)
+            if delta:
+                self._totals = [t + d for t, d in zip(self._totals, delta)]
+
+    def aggregates(self):
+        """Current running totals as a dict."""
+        return dict(zip(self._aggregates[0], self._totals))
+
+    def version(self, record_id):
+        """Version of a record in a versioned store, or None if absent."""
+        return self._versions.get(record_id)
+
+    def collection_version(self):
+        """Sequence value of the latest write or delete."""
+        return self._sequence
+
+    def _unindex(self, record_id):
+        if record_id in self._data:
+            old = self._columns[record_id] if self._columns is not None else self._data[record_id]
+            key = self._order_key(record_id, old)
+            pos = bisect.bisect_left(self._order, key)
+            if pos < len(self._order) and self._order[pos] == key:
+                del self._order[pos]
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def values(self):
+        if self._decode:
+            return [self._decode(record) for record in self._data.values()]
+        return list(self._data.values())
+
+    def put_many(self, records):
+        """Writes records (each with an 'id') in one step."""
+        with self._lock:
+            for record in records:
+                self[record['id']] = record
+
+    def delete_matching(self, filters):
+        """Deletes every record matching the filters; returns how many."""
+        with self._lock:
+            doomed = [k for k in self._data if self._matches(k, filters)]
+            for record_id in doomed:
+                del self[record_id]
+        return len(doomed)
+
+    def trim(self, column, keep):
+        """Keeps only the `keep` records with the largest `column` value."""
+        with self._lock:
+            ranked = sorted(self._data, key=lambda k: self._column(k, column) or 0, reverse=True)
+            for record_id in ranked[keep:]:
+                del self[record_id]
+
+    def scan(self, filters=(), after=None, limit=None):
+        """
+        Records newest first by (created_at, id), optionally starting after a
+        (created_at, id) cursor, keeping only those matching every
+        (column, op, value) filter.
+        """
+        with self._lock:
+            pos = bisect.bisect_left(self._order, tuple(after)) if after else len(self._order)
+            page = []
+            while pos > 0 and (limit is None or len(page) < limit):
+                pos -= 1
+                record_id = self._order[pos][1]
+                if self._matches(record_id, filters):
+                    record = self._data[record_id]
+                    page.append(self._decode(record) if self._decode else record)
+        return page
+
+    def _column(self, record_id, column):
+        if self._columns is not None:
+            return self._columns[record_id].get(column)
+        return column_value(self._data[record_id], self.name, column)
+
+    def _matches(self, record_id, filters):
+        if self._columns is not None:
+            columns = self._columns[record_id]
+            return values_match([columns.get(column) for column, _, _ in filters], filters)
+        return record_matches(self._data[record_id], self.name, filters)
+
+
+class ConnectionPool:
+    """
+    Small pool of SQLite connections for one database file. Connections are
+    opened lazily and discarded after a fork, so each gunicorn worker ends up
+    with its own handles onto the shared WAL database. Nothing touches the
+    file until the first connection is asked for, which is also when the
+    registered schema setups run.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._setups = []
+        self._ready = False
+        self._setup_lock = threading.Lock()
+
+    def on_first_use(self, setup):
+        """
+        Registers setup(conn) (table creation, migrations, backfills) to run
+        in a transaction before the first connection is handed out, or now
+        if the pool is already in use.
+        """
+        with self._setup_lock:
+            self._setups.append(setup)
+            ready = self._ready
+        if ready:
+            with self.transaction() as conn:
+                setup(conn)
+
+    def _prepare(self):
+        with self._setup_lock:
+            if self._ready:
+                return
+            conn = self._connect()
+            # Reads a setup makes through a store (e.g. decoding rows to
+            # backfill a column) join the setup transaction
+            self._local.conn = conn
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for setup in self._setups:
+                        setup(conn)
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                conn.execute('COMMIT')
+            finally:
+                self._local.conn = None
+                conn.close()
+            self._ready = True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if os.getpid() != self._pid:
+            self._idle = queue.LifoQueue()
+            self._local = threading.local()
+            self._pid = os.getpid()
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            # Inside this thread's open transaction: see its uncommitted writes
+            yield current
+            return
+        if not self._ready:
+            self._prepare()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Connection inside BEGIN IMMEDIATE … COMMIT; rolls back on error.
+        Nested calls on the same thread join the outer transaction.
+        """
+        with self.connection() as conn:
+            if getattr(self._local, 'conn', None) is conn:
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            self._local.conn = conn
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+            finally:
+                self._local.conn = None
+
+
+class SQLiteStore(MutableMapping):
+    """
+    Store backed by one SQLite table: the record as JSON (or as a BLOB from
+    the schema `codec`) plus the indexed columns declared in STORE_SCHEMAS.
+    Safe to share between processes.
+    """
+
+    def __init__(self, pool, name):
+        self.name = name
+        self.pool = pool
+        schema = STORE_SCHEMAS[name]
+        self.columns = list(schema['columns'])
+        self._dump, self._load = schema.get('codec') or (functools.partial(json.dumps, separators=(',', ':')), json.loads)
+        self._versioned = schema.get('versioned', False)
+        self._aggregates = schema.get('aggregates')
+        stored = ['id', *self.columns, 'data'] + (['version'] if self._versioned else [])
+        self._upsert_sql = f"INSERT OR REPLACE INTO {name} ({', '.join(stored)}) VALUES ({', '.join('?' * len(stored))})"
+        pool.on_first_use(self._create)
+
+    def _create(self, conn):
+        """Creates or migrates the table; run by the pool on first use."""
+        name, schema = self.name, STORE_SCHEMAS[self.name]
+        column_defs = ''.join(f', {col} {sql_type}' for col, sql_type in schema['columns'].items())
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {name} (id TEXT PRIMARY KEY{column_defs}, data TEXT NOT NULL)')
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({name})')}
+        if self._versioned:
+            if 'version' not in existing:
+                conn.execute(f'ALTER TABLE {name} ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {name}_sequence (id INTEGER PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)')
+            conn.execute(f'INSERT OR IGNORE INTO {name}_sequence (id) VALUES (1)')
+        added = [col for col in self.columns if col not in existing]
+        for col in added:
+            conn.execute(f"ALTER TABLE {name} ADD COLUMN {col} {schema['columns'][col]}")
+        if added:
+            # Backfill columns introduced after rows were written
+            rows = conn.execute(f'SELECT id, data FROM {name}').fetchall()
+            conn.executemany(
+                f"UPDATE {name} SET {', '.join(c + ' = ?' for c in added)} WHERE id = ?",
+                [(*(column_value(self._load(data), name, c) for c in added), record_id) for record_id, data in rows]
+            )
+        for i, index in enumerate(schema['indexes']):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_{i} ON {name} ({index})')
+
+        if self._aggregates:
+            fields = self._aggregates[0]
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {name}_aggregates (id INTEGER PRIMARY KEY, '
+                + ', '.join(f'{f} REAL NOT NULL DEFAULT 0' for f in fields) + ')'
+            )
+            if conn.execute(f'INSERT OR IGNORE INTO {name}_aggregates (id) VALUES (1)').rowcount:
+                # First open of a table that may already hold rows
+                totals = [0] * len(fields)
+                for (data,) in conn.execute(f'SELECT data FROM {name}'):
+                    totals = [t + d for t, d in zip(totals, aggregate_delta(self._aggregates[1], None, self._load(data)) or [0] * len(fields))]
+                self._add_totals(conn, totals)
+
+    def _row(self, record_id, record):
+        return (record_id, *(column_value(record, self.name, col) for col in self.columns), self._dump(record))
+
+    def __getitem__(self, record_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT data FROM {self.name} WHERE id = ?', (record_id,)).fetchone()
+        if row is None:
+            raise KeyError(record_id)
+        return self._load(row[0])
+
+    def __contains__(self, record_id):
+        with self.pool.connection() as conn:
+            return conn.execute(f'SELECT 1 FROM {self.name} WHERE id = ?', (record_id,)).fetchone() is not None
+
+    def __setitem__(self, record_id, record):
+        with self.pool.transaction() as conn:
+            if self._aggregates:
+                self._add_totals(conn, aggregate_delta(self._aggregates[1], self._fetch(conn, record_id), record))
+            row = self._row(record_id, record)
+            if self._versioned:
+                row += (self._advance(conn),)
+            conn.execute(self._upsert_sql, row)
+
+    def __delitem__(self, record_id):
+        with self.pool.transaction() as conn:
+            if self._aggregates:
+                self._add_totals(conn, aggregate_delta(self._aggregates[1], self._fetch(conn, record_id), None))
+            deleted = conn.execute(f'DELETE FROM {self.name} WHERE id = ?', (record_id,)).rowcount
+            if not deleted:
+                raise KeyError(record_id)
+            if self._versioned:
+                self._advance(conn)
+
+    def _fetch(self, conn, record_id):
+        row = conn.execute(f'SELECT data FROM {self.name} WHERE id = ?', (record_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def _add_totals(self, conn, delta):
+        if delta:
+            fields = self._aggregates[0]
+            conn.execute(
+                f"UPDATE {self.name}_aggregates SET {', '.join(f'{f} = {f} + ?' for f in fields)} WHERE id = 1",
+                delta
+            )
+
+    def aggregates(self):
+        """Current running totals as a dict."""
+        fields = self._aggregates[0]
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(fields)} FROM {self.name}_aggregates WHERE id = 1").fetchone()
+        return dict(zip(fields, row))
+
+    def _advance(self, conn, count=1):
+        """Moves the store sequence on by count; returns its new value."""
+        conn.execute(f'UPDATE {self.name}_sequence SET value = value + ? WHERE id = 1', (count,))
+        return conn.execute(f'SELECT value FROM {self.name}_sequence WHERE id = 1').fetchone()[0]
+
+    def version(self, record_id):
+        """See MemoryStore.version."""
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT version FROM {self.name} WHERE id = ?', (record_id,)).fetchone()
+        return row[0] if row else None
+
+    def collection_version(self):
+        """See MemoryStore.collection_version."""
+        with self.pool.connection() as conn:
+            return conn.execute(f'SELECT value FROM {self.name}_sequence WHERE id = 1').fetchone()[0]
+
+    def __iter__(self):
+        with self.pool.connection() as conn:
+            ids = [row[0] for row in conn.execute(f'SELECT id FROM {self.name}')]
+        return iter(ids)
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {self.name}').fetchone()[0]
+
+    def values(self):
+        with self.pool.connection() as conn:
+            return [self._load(row[0]) for row in conn.execute(f'SELECT data FROM {self.name}')]
+
+    def put_many(self, records):
+        """Writes records (each with an 'id') in a single transaction."""
+        rows = [self._row(record['id'], record) for record in records]
+        with self.pool.transaction() as conn:
+            if self._aggregates:
+                totals = [0] * len(self._aggregates[0])
+                for record in records:
+                    delta = aggregate_delta(self._aggregates[1], self._fetch(conn, record['id']), record)
+                    if delta:
+                        totals = [t + d for t, d in zip(totals, delta)]
+                self._add_totals(conn, totals)
+            if self._versioned and rows:
+                first = self._advance(conn, len(rows)) - len(rows) + 1
+                rows = [row + (first + i,) for i, row in enumerate(rows)]
+            conn.executemany(self._upsert_sql, rows)
+
+    @staticmethod
+    def _where(filters):
+        where = []
+        params = []
+        for column, op, value in filters:
+            if op == 'nocase':
+                where.append(f'{column} = ? COLLATE NOCASE')
+            else:
+                where.append(f'{column} {op} ?')
+            params.append(value)
+        return where, params
+
+    def delete_matching(self, filters):
+        """Deletes every record matching the filters; returns how many."""
+        where, params = self._where(filters)
+        with self.pool.transaction() as conn:
+            deleted = conn.execute(f"DELETE FROM {self.name} WHERE {' AND '.join(where)}", params).rowcount
+            if deleted and self._versioned:
+                self._advance(conn)
+            return deleted
+
+    def trim(self, column, keep):
+        """Keeps only the `keep` records with the largest `column` value."""
+        with self.pool.transaction() as conn:
+            deleted = conn.execute(
+                f'DELETE FROM {self.name} WHERE id IN '
+                f'(SELECT id FROM {self.name} ORDER BY {column} DESC LIMIT -1 OFFSET ?)',
+                (keep,)
+            ).rowcount
+            if deleted and self._versioned:
+                self._advance(conn)
+
+    def scan(self, filters=(), after=None, limit=None):
+        """See MemoryStore.scan — served by the (created_at, id) index."""
+        where, params = self._where(filters)
+        if after:
+            where.append('(created_at, id) < (?, ?)')
+            params.extend(after)
+        sql = f'SELECT data FROM {self.name}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created_at DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self.pool.connection() as conn:
+            return [self._load(row[0]) for row in conn.execute(sql, params)]
+
+
+def open_store(name):
+    if STORAGE_BACKEND == 'memory':
+        return MemoryStore(name)
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteStore(db_pool, name)
+    raise ValueError(f'Unknown STORAGE_BACKEND: {STORAGE_BACKEND}')
+
+
+_memory_transaction_lock = threading.RLock()
+
+
+@contextmanager
+def storage_transaction():
+    """
+    Groups several store operations into one atomic unit — a single SQLite
+    transaction shared by every store, or a process-wide lock in memory.
+    """
+    if db_pool is None:
+        with _memory_transaction_lock:
+            yield
+    else:
+        with db_pool.transaction():
+            yield
+
+
+db_pool = ConnectionPool(DATABASE_PATH) if STORAGE_BACKEND == 'sqlite' else None
+vehicles_db = open_store('vehicles')
+reports_db = open_store('reports')
+report_curves_db = open_store('report_curves')
+comps_db = open_store('comps')
+meta_db = open_store('meta')
+
+# ============================================================
+# PROCESS POOL — CPU-bound fan-out across cores
+# ============================================================
+# Each gunicorn worker owns a pool, so by default the cores are split across
+# the WEB_CONCURRENCY workers (gunicorn's own default for --workers)
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+# Pools are created from request and scheduler threads; a plain fork there can
+# hand the workers a lock some other thread held, so they start from a
+# forkserver (spawn where that is unavailable)
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_process_pool = None
+_process_pool_pid = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Lazily created per-process pool; recreated after a fork."""
+    global _process_pool, _process_pool_pid
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_pid != os.getpid():
+            _process_pool = ProcessPoolExecutor(
+                max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context(POOL_START_METHOD)
+            )
+            _process_pool_pid = os.getpid()
+        return _process_pool
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def body_lines(stream):
+    """
+    Binary lines of a request body stream. Werkzeug's LimitedStream is a raw
+    stream whose readline is very slow, so line reads go through a buffer.
+    """
+    if isinstance(stream, io.RawIOBase):
+        return io.BufferedReader(stream, 1 << 16)
+    return stream
+
+
+def iter_ndjson(stream):
+    """Yields (obj, error) for each non-blank line of a binary NDJSON stream."""
+    for line in body_lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as exc:
+            yield None, f'Invalid JSON: {exc}'
+
+
+def iter_csv(stream, encoding='utf-8'):
+    """Yields (row dict, None) for each record of a binary CSV stream with a header row."""
+    for row in csv.DictReader(codecs.iterdecode(body_lines(stream), encoding)):
+        yield row, None
+
+
+def map_in_order(fn, chunks, max_inflight=None):
+    """
+    Applies `fn` (a top-level function taking a list) to each chunk on the
+    process pool and yields the results in input order, keeping at most
+    `max_inflight` chunks in flight so the input is consumed lazily.
+    A single chunk, or a one-process pool, runs inline — not worth the
+    inter-process hop.
+    """
+    chunks = iter(chunks)
+    head = list(itertools.islice(chunks, 2))
+    if len(head) < 2 or WORKER_PROCESSES <= 1:
+        for chunk in itertools.chain(head, chunks):
+            yield fn(chunk)
+        return
+
+    pool = get_process_pool()
+    max_inflight = max_inflight or WORKER_PROCESSES * 2
+    pending = deque()
+    for chunk in itertools.chain(head, chunks):
+        pending.append(pool.submit(fn, chunk))
+        if len(pending) >= max_inflight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ============================================================
+# RESPONSE ENCODING — JSON provider, pre-encoded fragments, compression
+# ============================================================
+# jsonify goes through app.json. ResponseJSONProvider uses orjson when it is
+# installed (JSON_ENCODER=stdlib forces the fallback) with the same output
+# rules as Flask's default provider: sorted keys, compact separators.
+# Analysis sections are encoded once per cached section output and spliced
+# into responses as-is, so re-analysing an unchanged vehicle skips most of
+# the encoding. Large JSON responses are gzip/br compressed per
+# Accept-Encoding.
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson' if orjson else 'stdlib')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_MIMETYPES = {'application/json'}
+_FRAGMENT_MARK = uuid.uuid4().hex
+
+
+class AnalysisResult(dict):
+    """
+    analyze_vehicle output: a plain dict of sections that also remembers the
+    SectionResult each came from, whose encoded JSON is reused.
+    """
+
+    __slots__ = ('sections',)
+
+    def __init__(self, sections):
+        super().__init__((name, section.output) for name, section in sections.items())
+        self.sections = sections
+
+    def __reduce__(self):
+        # Crosses process boundaries as a plain dict
+        return dict, (dict(self),)
+
+
+class ResponseJSONProvider(DefaultJSONProvider):
+    """orjson or stdlib encoding, with AnalysisResult sections pre-encoded."""
+
+    def __init__(self, app, encoder=JSON_ENCODER):
+        super().__init__(app)
+        if encoder not in ('orjson', 'stdlib'):
+            raise ValueError(f'Unknown JSON_ENCODER: {encoder}')
+        if encoder == 'orjson' and orjson is None:
+            raise ValueError('JSON_ENCODER=orjson but orjson is not installed')
+        self.encoder = encoder
+        self._stdlib = json.JSONEncoder(default=self.default, ensure_ascii=self.ensure_ascii,
+                                        sort_keys=self.sort_keys, separators=(',', ':'))
+        self._orjson_options = orjson and (
+            orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        self._keys = {}
+
+    def encode(self, obj):
+        """Compact JSON bytes for obj."""
+        if self.encoder == 'orjson':
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options)
+            except TypeError:
+                pass  # e.g. ints beyond 64 bits: let stdlib have a go
+        return self._stdlib.encode(obj).encode()
+
+    def encode_response(self, obj):
+        """encode() with AnalysisResult sections spliced in from their cached encoding."""
+        fragments = []
+        obj = self._mark_fragments(obj, fragments, depth=3)
+        body = self.encode(obj)
+        for i, fragment in enumerate(fragments):
+            body = body.replace(self.encode(f'{_FRAGMENT_MARK}:{i}'), fragment, 1)
+        return body
+
+    def _mark_fragments(self, obj, fragments, depth):
+        # Swap AnalysisResults near the top of the payload for placeholders
+        if isinstance(obj, AnalysisResult):
+            fragments.append(self._encode_analysis(obj))
+            return f'{_FRAGMENT_MARK}:{len(fragments) - 1}'
+        if depth and type(obj) is dict:
+            marked = {key: self._mark_fragments(value, fragments, depth - 1) for key, value in obj.items()}
+            return marked if fragments else obj
+        return obj
+
+    def _encode_analysis(self, analysis):
+        parts = []
+        for name in sorted(analysis) if self.sort_keys else analysis:
+            value = analysis[name]
+            section = analysis.sections.get(name)
+            if section is not None and section.output is value:
+                if section.encoded is None:
+                    section.encoded = self.encode(value)
+                encoded = section.encoded
+            else:
+                encoded = self.encode(value)
+            key = self._keys.get(name)
+            if key is None:
+                key = self._keys[name] = self.encode(name) + b':'
+            parts.append(key + encoded)
+        return b'{' + b','.join(parts) + b'}'
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encode_response(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # Pretty-printed for humans; speed is beside the point
+            return super().response(obj)
+        return self._app.response_class(self.encode_response(obj) + b'\n', mimetype=self.mimetype)
+
+
+app.json = ResponseJSONProvider(app)
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(COMPRESS_LEVEL, 11))
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+
+
+def negotiate_encoding():
+    """Content coding the client prefers among those we produce, or None."""
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+
+@app.after_request
+def compress_response(response):
+    """gzip/br for buffered JSON bodies worth compressing."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding()
+    if encoding:
+        response.set_data(compress_body(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# ============================================================
+# CONDITIONAL GET — strong ETags from store versions, response cache
+# ============================================================
+# Read endpoints wrapped in @versioned name the store version their body
+# depends on. The ETag is that version plus the negotiated content coding,
+# so If-None-Match is answered with a 304 from one indexed lookup, and
+# rendered bodies are cached per (URL, version). Every write moves the
+# version on, which is what retires cached bodies, in every worker, since
+# versions live in the shared store.
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+response_cache = OrderedDict()  # (full path, version) -> {'body', 'mimetype', 'encoded'}
+response_cache_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_response_cache_lock = threading.Lock()
+
+
+def versioned(version_of):
+    """
+    Conditional GET and response caching for a view whose 200 body depends
+    only on version_of(*view_args). A None version (e.g. unknown id) falls
+    through to the view uncached.
+    """
+    def wrap(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            version = version_of(*kwargs.values())
+            if version is None:
+                return view(**kwargs)
+            encoding = negotiate_encoding()
+            etag = f'{version}-{encoding or "identity"}'
+            if request.if_none_match.contains_weak(etag):
+                with _response_cache_lock:
+                    response_cache_stats['not_modified'] += 1
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.vary.add('Accept-Encoding')
+                return response
+
+            key = (request.full_path, version)
+            with _response_cache_lock:
+                rendered = response_cache.get(key)
+                if rendered is not None:
+                    response_cache.move_to_end(key)
+                    response_cache_stats['hits'] += 1
+            if rendered is None:
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                rendered = {'body': response.get_data(), 'mimetype': response.mimetype, 'encoded': {}}
+                with _response_cache_lock:
+                    response_cache[key] = rendered
+                    while len(response_cache) > RESPONSE_CACHE_SIZE:
+                        response_cache.popitem(last=False)
+                    response_cache_stats['misses'] += 1
+
+            body = rendered['body']
+            compress = (encoding and len(body) >= COMPRESS_MIN_BYTES
+                        and rendered['mimetype'] in COMPRESS_MIMETYPES)
+            if compress:
+                with _response_cache_lock:
+                    encoded = rendered['encoded'].get(encoding)
+                if encoded is None:
+                    # Compressed outside the lock; a racing request's copy is as good
+                    encoded = compress_body(body, encoding)
+                    with _response_cache_lock:
+                        encoded = rendered['encoded'].setdefault(encoding, encoded)
+                body = encoded
+            response = Response(body, mimetype=rendered['mimetype'])
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            response.headers['Cache-Control'] = 'no-cache'
+            if compress:
+                response.headers['Content-Encoding'] = encoding
+            return response
+        return wrapper
+    return wrap
+
 
 # ============================================================
 # SERVE FRONTEND
@@ -33,11 +1304,22 @@ def static_files(path):
 # ============================================================
 @app.route('/api/health')
 def health():
+    curve_cache = cached_curve_shape.cache_info()
     return jsonify({
         'status': 'ok',
         'timestamp': datetime.utcnow().isoformat(),
         'version': '2.0.0',
-        'features': ['vision_intake', 'comp_discovery', 'daily_probability_curve']
+        'features': ['vision_intake', 'comp_discovery', 'daily_probability_curve'],
+        'comp_cache': dict(comp_cache_stats, size=len(comps_db), max_size=COMP_CACHE_SIZE),
+        'curve_cache': {
+            'hits': curve_cache.hits,
+            'misses': curve_cache.misses,
+            'size': curve_cache.currsize,
+            'max_size': curve_cache.maxsize
+        },
+        'analysis_cache': dict(analysis_cache_stats, vehicles=len(analysis_section_cache), max_vehicles=ANALYSIS_CACHE_SIZE),
+        'response_cache': dict(response_cache_stats, size=len(response_cache), max_size=RESPONSE_CACHE_SIZE),
+        'nightly_run': meta_db.get('nightly_run')
     })
 
 # ============================================================
@@ -73,6 +1355,244 @@ def vision_identify():
     })
 
 
+# --- Keyword tables (make name first in each make's list) ---
+VEHICLE_MAKES = {
+    'toyota': ['toyota', 'trd', 'camry', 'corolla', 'rav4', 'tacoma', 'tundra', 'highlander', '4runner', 'prius', 'avalon', 'supra', 'sienna', 'venza'],
+    'honda': ['honda', 'civic', 'accord', 'cr-v', 'crv', 'hr-v', 'hrv', 'pilot', 'odyssey', 'ridgeline', 'passport', 'fit'],
+    'ford': ['ford', 'f-150', 'f150', 'mustang', 'explorer', 'escape', 'bronco', 'ranger', 'edge', 'expedition', 'maverick', 'fusion'],
+    'chevrolet': ['chevrolet', 'chevy', 'silverado', 'equinox', 'traverse', 'tahoe', 'suburban', 'camaro', 'corvette', 'blazer', 'malibu', 'colorado', 'trax'],
+    'nissan': ['nissan', 'altima', 'sentra', 'rogue', 'pathfinder', 'murano', 'frontier', 'titan', 'maxima', 'versa', 'kicks', 'armada'],
+    'hyundai': ['hyundai', 'elantra', 'sonata', 'tucson', 'santa fe', 'palisade', 'kona', 'venue', 'ioniq'],
+    'kia': ['kia', 'forte', 'optima', 'k5', 'sportage', 'sorento', 'telluride', 'soul', 'seltos', 'carnival', 'stinger'],
+    'bmw': ['bmw', 'bimmer', '3 series', '5 series', 'x3', 'x5', 'x1', 'm3', 'm5', '330i', '530i', 'x7'],
+    'mercedes': ['mercedes', 'benz', 'mb', 'c-class', 'e-class', 's-class', 'glc', 'gle', 'gls', 'amg', 'c300', 'e350'],
+    'audi': ['audi', 'a3', 'a4', 'a6', 'q3', 'q5', 'q7', 'q8', 'e-tron', 'rs', 's4', 's5'],
+    'lexus': ['lexus', 'rx', 'es', 'nx', 'is', 'gx', 'lx', 'ux', 'ls', 'rc'],
+    'subaru': ['subaru', 'outback', 'forester', 'crosstrek', 'impreza', 'wrx', 'legacy', 'ascent', 'brz'],
+    'volkswagen': ['volkswagen', 'vw', 'jetta', 'passat', 'tiguan', 'atlas', 'golf', 'gti', 'id.4', 'taos', 'arteon'],
+    'mazda': ['mazda', 'cx-5', 'cx5', 'cx-9', 'cx9', 'mazda3', 'mazda6', 'cx-30', 'cx30', 'cx-50', 'mx-5', 'miata'],
+    'gmc': ['gmc', 'sierra', 'yukon', 'acadia', 'terrain', 'canyon', 'denali'],
+    'jeep': ['jeep', 'wrangler', 'grand cherokee', 'cherokee', 'compass', 'renegade', 'gladiator', 'wagoneer'],
+    'dodge': ['dodge', 'ram', 'charger', 'challenger', 'durango', 'hornet'],
+    'tesla': ['tesla', 'model 3', 'model y', 'model s', 'model x', 'cybertruck'],
+    'acura': ['acura', 'mdx', 'rdx', 'tlx', 'integra', 'ilx'],
+    'infiniti': ['infiniti', 'q50', 'q60', 'qx50', 'qx60', 'qx80'],
+    'volvo': ['volvo', 'xc40', 'xc60', 'xc90', 's60', 's90', 'v60'],
+    'cadillac': ['cadillac', 'escalade', 'xt4', 'xt5', 'xt6', 'ct4', 'ct5', 'lyriq'],
+    'lincoln': ['lincoln', 'navigator', 'aviator', 'corsair', 'nautilus'],
+    'buick': ['buick', 'encore', 'envision', 'enclave'],
+    'chrysler': ['chrysler', 'pacifica', '300'],
+    'genesis': ['genesis', 'g70', 'g80', 'g90', 'gv70', 'gv80'],
+    'land rover': ['land rover', 'range rover', 'defender', 'discovery', 'evoque', 'velar'],
+    'porsche': ['porsche', 'cayenne', 'macan', '911', 'taycan', 'panamera', 'boxster', 'cayman'],
+}
+
+TRIM_KEYWORDS = {
+    'se': 'SE', 'le': 'LE', 'xle': 'XLE', 'xse': 'XSE', 'trd': 'TRD',
+    'limited': 'Limited', 'platinum': 'Platinum', 'sport': 'Sport',
+    'touring': 'Touring', 'ex': 'EX', 'ex-l': 'EX-L', 'lx': 'LX',
+    'sr': 'SR', 'sv': 'SV', 'sl': 'SL', 's': 'S', 'sxt': 'SXT',
+    'gt': 'GT', 'gt-line': 'GT-Line', 'premium': 'Premium',
+    'sel': 'SEL', 'limited': 'Limited', 'base': 'Base',
+    'rs': 'RS', 'st': 'ST', 'raptor': 'Raptor', 'trail': 'Trail',
+    'off-road': 'Off-Road', 'pro': 'Pro', 'nightshade': 'Nightshade',
+    'denali': 'Denali', 'at4': 'AT4', 'slt': 'SLT',
+    'laredo': 'Laredo', 'overland': 'Overland', 'rubicon': 'Rubicon',
+    'sahara': 'Sahara', 'willys': 'Willys',
+}
+
+BODY_STYLES = {
+    'sedan': ['sedan', '4 door', '4-door', 'four door'],
+    'suv': ['suv', 'crossover', 'sport utility'],
+    'truck': ['truck', 'pickup', 'crew cab', 'double cab', 'regular cab', 'extended cab'],
+    'coupe': ['coupe', '2 door', '2-door', 'two door'],
+    'hatchback': ['hatchback', 'hatch', '5 door', '5-door'],
+    'wagon': ['wagon', 'estate'],
+    'van': ['van', 'minivan'],
+    'convertible': ['convertible', 'cabriolet', 'roadster', 'spider', 'spyder'],
+}
+
+VEHICLE_COLORS = ['white', 'black', 'silver', 'gray', 'grey', 'red', 'blue', 'green',
+                  'brown', 'beige', 'gold', 'orange', 'yellow', 'purple', 'burgundy',
+                  'champagne', 'bronze', 'pearl', 'midnight', 'lunar', 'celestial',
+                  'magnetic', 'iconic', 'platinum', 'cement', 'army', 'cavalry']
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+def _trie_pattern(words):
+    """
+    Regex for a set of literal words with shared prefixes factored out, so
+    the engine branches on one character at a time instead of trying every
+    word. Optional tails are greedy, so it matches the longest word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class VehicleTextMatcher:
+    """
+    Finds every make, model, trim, body style and color keyword in a text with
+    one pass of a single compiled pattern.
+
+    The pattern is a zero-width lookahead over a keyword trie, so at each
+    position it reports the longest keyword starting there. Every shorter
+    keyword starting at the same position is a prefix of that one, so the
+    full set of occurrences (overlaps included) is recovered from a
+    precomputed prefix table.
+    """
+
+    def __init__(self, makes, trims, body_styles, colors):
+        # keyword -> [(rank, make, is_make_name)], in table iteration order
+        self.makes = {}
+        rank = 0
+        for make, keywords in makes.items():
+            for kw in keywords:
+                self.makes.setdefault(kw, []).append((rank, make, kw == make))
+                rank += 1
+        self.trims = {kw: (i, label) for i, (kw, label) in enumerate(trims.items())}
+        self.body_styles = {}
+        for i, (style, keywords) in enumerate(body_styles.items()):
+            for kw in keywords:
+                self.body_styles.setdefault(kw, []).append((i, style))
+        self.colors = {c: i for i, c in enumerate(colors)}
+
+        keywords = set(self.makes) | set(self.trims) | set(self.body_styles) | set(self.colors)
+        self.prefixes = {kw: [k for k in keywords if kw.startswith(k)] for kw in keywords}
+        self.pattern = re.compile('(?=(' + _trie_pattern(keywords) + '))')
+
+    def scan(self, text):
+        """Map of keyword -> start offsets of every occurrence in text."""
+        found = {}
+        for m in self.pattern.finditer(text):
+            start = m.start()
+            for kw in self.prefixes[m.group(1)]:
+                found.setdefault(kw, []).append(start)
+        return found
+
+    def identify(self, text):
+        """
+        Applies the table precedence rules to one scan of `text`:
+        - make name beats model keyword; the first model keyword (table
+          order) counts only if it precedes the first make name found
+        - first trim in table order with a word-bounded match wins
+        - last body style in table order with any match wins
+        - first color in table order wins
+        """
+        found = self.scan(text)
+
+        first_name = first_model = None
+        trim = body = color = None
+        for kw, starts in found.items():
+            for entry in self.makes.get(kw, ()):
+                if entry[2]:
+                    if first_name is None or entry < first_name:
+                        first_name = entry
+                elif first_model is None or entry < first_model:
+                    first_model = (entry[0], entry[1], kw)
+
+            if kw in self.trims and (trim is None or self.trims[kw] < trim):
+                end = len(kw)
+                if any(
+                    (s == 0 or not _is_word_char(text[s - 1]))
+                    and (s + end == len(text) or not _is_word_char(text[s + end]))
+                    for s in starts
+                ):
+                    trim = self.trims[kw]
+
+            for entry in self.body_styles.get(kw, ()):
+                if body is None or entry > body:
+                    body = entry
+
+            if kw in self.colors and (color is None or self.colors[kw] < color[0]):
+                color = (self.colors[kw], kw)
+
+        detected_make = detected_model = None
+        make_confidence = 0
+        if first_model and (first_name is None or first_model[0] < first_name[0]):
+            detected_make, detected_model, make_confidence = first_model[1], first_model[2], 85
+        if first_name:
+            detected_make, make_confidence = first_name[1], 90
+
+        return {
+            'make': detected_make,
+            'model': detected_model,
+            'make_confidence': make_confidence,
+            'trim': trim[1] if trim else None,
+            'body_style': body[1] if body else None,
+            'color': color[1].title() if color else None,
+        }
+
+
+vehicle_text_matcher = VehicleTextMatcher(VEHICLE_MAKES, TRIM_KEYWORDS, BODY_STYLES, VEHICLE_COLORS)
+
+
+@app.route('/api/vision/identify/batch', methods=['POST'])
+def vision_identify_batch():
+    """
+    Identifies many listings in one request, e.g. an auction run list or a
+    dealer feed. Accepts a JSON array, or NDJSON with
+    Content-Type: application/x-ndjson. Each listing is a description string
+    or an object with description and/or url.
+
+    Streams NDJSON back, one {"index", "identification" | "error"} line per
+    listing in input order, while chunks are identified across the process pool.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = iter_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'Provide a JSON array of listings or an NDJSON body'}), 400
+        items = ((item, None) for item in data)
+
+    def generate():
+        indexed = ((i, item, error) for i, (item, error) in enumerate(items))
+        for results in map_in_order(identify_listing_chunk, chunked(indexed, IDENTIFY_CHUNK_SIZE)):
+            for result in results:
+                yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+IDENTIFY_CHUNK_SIZE = 256
+
+
+def identify_listing_chunk(chunk):
+    """Worker body for the batch endpoint: list of (index, item, error) in, results out."""
+    results = []
+    for index, item, error in chunk:
+        if error is None:
+            if isinstance(item, str):
+                description, url = item, ''
+            elif isinstance(item, dict):
+                description, url = str(item.get('description') or ''), str(item.get('url') or '')
+            else:
+                description = url = ''
+            if not description and not url:
+                error = 'Provide description or url'
+        if error:
+            results.append({'index': index, 'error': error})
+        else:
+            results.append({'index': index, 'identification': analyze_vehicle_identity(description, url)})
+    return results
+
+
 def analyze_vehicle_identity(description, url):
     """
     Analyzes text description or URL to identify vehicle.
@@ -81,56 +1601,14 @@ def analyze_vehicle_identity(description, url):
     """
     text = (description + ' ' + url).lower()
 
-    # --- Make Detection ---
-    makes = {
-        'toyota': ['toyota', 'trd', 'camry', 'corolla', 'rav4', 'tacoma', 'tundra', 'highlander', '4runner', 'prius', 'avalon', 'supra', 'sienna', 'venza'],
-        'honda': ['honda', 'civic', 'accord', 'cr-v', 'crv', 'hr-v', 'hrv', 'pilot', 'odyssey', 'ridgeline', 'passport', 'fit'],
-        'ford': ['ford', 'f-150', 'f150', 'mustang', 'explorer', 'escape', 'bronco', 'ranger', 'edge', 'expedition', 'maverick', 'fusion'],
-        'chevrolet': ['chevrolet', 'chevy', 'silverado', 'equinox', 'traverse', 'tahoe', 'suburban', 'camaro', 'corvette', 'blazer', 'malibu', 'colorado', 'trax'],
-        'nissan': ['nissan', 'altima', 'sentra', 'rogue', 'pathfinder', 'murano', 'frontier', 'titan', 'maxima', 'versa', 'kicks', 'armada'],
-        'hyundai': ['hyundai', 'elantra', 'sonata', 'tucson', 'santa fe', 'palisade', 'kona', 'venue', 'ioniq'],
-        'kia': ['kia', 'forte', 'optima', 'k5', 'sportage', 'sorento', 'telluride', 'soul', 'seltos', 'carnival', 'stinger'],
-        'bmw': ['bmw', 'bimmer', '3 series', '5 series', 'x3', 'x5', 'x1', 'm3', 'm5', '330i', '530i', 'x7'],
-        'mercedes': ['mercedes', 'benz', 'mb', 'c-class', 'e-class', 's-class', 'glc', 'gle', 'gls', 'amg', 'c300', 'e350'],
-        'audi': ['audi', 'a3', 'a4', 'a6', 'q3', 'q5', 'q7', 'q8', 'e-tron', 'rs', 's4', 's5'],
-        'lexus': ['lexus', 'rx', 'es', 'nx', 'is', 'gx', 'lx', 'ux', 'ls', 'rc'],
-        'subaru': ['subaru', 'outback', 'forester', 'crosstrek', 'impreza', 'wrx', 'legacy', 'ascent', 'brz'],
-        'volkswagen': ['volkswagen', 'vw', 'jetta', 'passat', 'tiguan', 'atlas', 'golf', 'gti', 'id.4', 'taos', 'arteon'],
-        'mazda': ['mazda', 'cx-5', 'cx5', 'cx-9', 'cx9', 'mazda3', 'mazda6', 'cx-30', 'cx30', 'cx-50', 'mx-5', 'miata'],
-        'gmc': ['gmc', 'sierra', 'yukon', 'acadia', 'terrain', 'canyon', 'denali'],
-        'jeep': ['jeep', 'wrangler', 'grand cherokee', 'cherokee', 'compass', 'renegade', 'gladiator', 'wagoneer'],
-        'dodge': ['dodge', 'ram', 'charger', 'challenger', 'durango', 'hornet'],
-        'tesla': ['tesla', 'model 3', 'model y', 'model s', 'model x', 'cybertruck'],
-        'acura': ['acura', 'mdx', 'rdx', 'tlx', 'integra', 'ilx'],
-        'infiniti': ['infiniti', 'q50', 'q60', 'qx50', 'qx60', 'qx80'],
-        'volvo': ['volvo', 'xc40', 'xc60', 'xc90', 's60', 's90', 'v60'],
-        'cadillac': ['cadillac', 'escalade', 'xt4', 'xt5', 'xt6', 'ct4', 'ct5', 'lyriq'],
-        'lincoln': ['lincoln', 'navigator', 'aviator', 'corsair', 'nautilus'],
-        'buick': ['buick', 'encore', 'envision', 'enclave'],
-        'chrysler': ['chrysler', 'pacifica', '300'],
-        'genesis': ['genesis', 'g70', 'g80', 'g90', 'gv70', 'gv80'],
-        'land rover': ['land rover', 'range rover', 'defender', 'discovery', 'evoque', 'velar'],
-        'porsche': ['porsche', 'cayenne', 'macan', '911', 'taycan', 'panamera', 'boxster', 'cayman'],
-    }
-
-    detected_make = None
-    make_confidence = 0
-    detected_model = None
-
-    for make, keywords in makes.items():
-        for kw in keywords:
-            if kw in text:
-                # Direct make name = higher confidence
-                if kw == make:
-                    if make_confidence < 90:
-                        detected_make = make
-                        make_confidence = 90
-                else:
-                    # Model name found = we know both make and model
-                    if make_confidence < 85:
-                        detected_make = make
-                        detected_model = kw
-                        make_confidence = 85
+    # --- Make / Model / Trim / Body / Color Detection (single pass) ---
+    matched = vehicle_text_matcher.identify(text)
+    detected_make = matched['make']
+    detected_model = matched['model']
+    make_confidence = matched['make_confidence']
+    detected_trim = matched['trim']
+    detected_body = matched['body_style']
+    detected_color = matched['color']
 
     # --- Year Detection ---
     year_pattern = re.findall(r'20[0-2][0-9]|19[89][0-9]', text)
@@ -140,59 +1618,6 @@ def analyze_vehicle_identity(description, url):
         detected_year = int(year_pattern[0])
         year_confidence = 90
 
-    # --- Trim Detection ---
-    trim_keywords = {
-        'se': 'SE', 'le': 'LE', 'xle': 'XLE', 'xse': 'XSE', 'trd': 'TRD',
-        'limited': 'Limited', 'platinum': 'Platinum', 'sport': 'Sport',
-        'touring': 'Touring', 'ex': 'EX', 'ex-l': 'EX-L', 'lx': 'LX',
-        'sr': 'SR', 'sv': 'SV', 'sl': 'SL', 's': 'S', 'sxt': 'SXT',
-        'gt': 'GT', 'gt-line': 'GT-Line', 'premium': 'Premium',
-        'sel': 'SEL', 'limited': 'Limited', 'base': 'Base',
-        'rs': 'RS', 'st': 'ST', 'raptor': 'Raptor', 'trail': 'Trail',
-        'off-road': 'Off-Road', 'pro': 'Pro', 'nightshade': 'Nightshade',
-        'denali': 'Denali', 'at4': 'AT4', 'slt': 'SLT',
-        'laredo': 'Laredo', 'overland': 'Overland', 'rubicon': 'Rubicon',
-        'sahara': 'Sahara', 'willys': 'Willys',
-    }
-
-    detected_trim = None
-    for kw, label in trim_keywords.items():
-        # Use word boundary matching to avoid false positives
-        if re.search(r'\b' + re.escape(kw) + r'\b', text):
-            detected_trim = label
-            break
-
-    # --- Body Style Detection ---
-    body_styles = {
-        'sedan': ['sedan', '4 door', '4-door', 'four door'],
-        'suv': ['suv', 'crossover', 'sport utility'],
-        'truck': ['truck', 'pickup', 'crew cab', 'double cab', 'regular cab', 'extended cab'],
-        'coupe': ['coupe', '2 door', '2-door', 'two door'],
-        'hatchback': ['hatchback', 'hatch', '5 door', '5-door'],
-        'wagon': ['wagon', 'estate'],
-        'van': ['van', 'minivan'],
-        'convertible': ['convertible', 'cabriolet', 'roadster', 'spider', 'spyder'],
-    }
-
-    detected_body = None
-    for style, keywords_list in body_styles.items():
-        for kw in keywords_list:
-            if kw in text:
-                detected_body = style
-                break
-
-    # --- Color Detection ---
-    colors = ['white', 'black', 'silver', 'gray', 'grey', 'red', 'blue', 'green',
-              'brown', 'beige', 'gold', 'orange', 'yellow', 'purple', 'burgundy',
-              'champagne', 'bronze', 'pearl', 'midnight', 'lunar', 'celestial',
-              'magnetic', 'iconic', 'platinum', 'cement', 'army', 'cavalry']
-
-    detected_color = None
-    for c in colors:
-        if c in text:
-            detected_color = c.title()
-            break
-
     # --- Overall Confidence ---
     scores = [make_confidence, year_confidence]
     if detected_model:
@@ -271,8 +1696,11 @@ def discover_comps():
 
     if not year or not make or not model:
         return jsonify({'error': 'Year, make, and model are required'}), 400
+    if zip_code.strip() and not comp_fetcher.providers and zip_location(zip_code) is None:
+        reason = 'unknown ZIP code' if zip_centroids() else 'no ZIP centroids loaded (set ZIP_CENTROIDS_PATH)'
+        return jsonify({'error': f'Cannot search around zip_code {zip_code.strip()}: {reason}'}), 400
 
-    comps = generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units)
+    comps = cached_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code)
 
     return jsonify({
         'message': 'Comp discovery complete',
@@ -284,7 +1712,12 @@ def discover_comps():
 def override_comps():
     """
     Accepts manual comp data and merges/compares with automated findings.
+    A CSV (text/csv) or NDJSON body instead runs a bulk reconciliation —
+    see override_comps_bulk.
     """
+    if request.mimetype in ('text/csv', 'application/x-ndjson', 'application/jsonl'):
+        return override_comps_bulk()
+
     data = request.get_json()
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -296,54 +1729,230 @@ def override_comps():
         return jsonify({'error': 'Provide manual_comps array'}), 400
 
     # Process manual comps
-    manual_prices = [float(c.get('price', 0)) for c in manual_comps if c.get('price')]
-    manual_days = [int(c.get('days_to_sale', 0)) for c in manual_comps if c.get('days_to_sale')]
+    manual_prices, manual_days = StreamingStats(), RunningStats()
+    for c in manual_comps:
+        if c.get('price'):
+            manual_prices.add(float(c.get('price', 0)))
+        if c.get('days_to_sale'):
+            manual_days.add(int(c.get('days_to_sale', 0)))
 
-    manual_median = sorted(manual_prices)[len(manual_prices) // 2] if manual_prices else 0
-    manual_avg_days = sum(manual_days) / len(manual_days) if manual_days else 0
+    manual_median = manual_prices.median if manual_prices.count else 0
+    manual_avg_days = manual_days.average if manual_days.count else 0
 
     # Compare with auto
-    auto_median = auto_comps.get('median_sale_price', 0)
-    discrepancy = abs(manual_median - auto_median) if auto_median else 0
-    discrepancy_pct = (discrepancy / auto_median * 100) if auto_median else 0
-
-    if discrepancy_pct > 10:
-        weight_recommendation = 'MANUAL_WEIGHTED'
-        weight_explanation = f'Manual comps diverge {discrepancy_pct:.1f}% from automated data. Manual data likely reflects more current or localized conditions. Weighting manual comps at 70%.'
-        blended_median = (manual_median * 0.7) + (auto_median * 0.3) if auto_median else manual_median
-    elif discrepancy_pct > 5:
-        weight_recommendation = 'BLENDED'
-        weight_explanation = f'Moderate {discrepancy_pct:.1f}% discrepancy. Blending equally for balanced estimate.'
-        blended_median = (manual_median + auto_median) / 2 if auto_median else manual_median
-    else:
-        weight_recommendation = 'AUTO_CONFIRMED'
-        weight_explanation = 'Manual comps confirm automated findings. High confidence in automated data.'
-        blended_median = auto_median if auto_median else manual_median
+    auto_median = auto_comps.get('median_sale_price') or 0
+    blend = blend_comp_medians(np.array([manual_median], dtype=float), np.array([auto_median], dtype=float))
 
     return jsonify({
         'message': 'Comp override processed',
-        'comparison': {
-            'manual_median': round(manual_median),
-            'auto_median': round(auto_median) if auto_median else None,
-            'discrepancy_dollars': round(discrepancy),
-            'discrepancy_percent': round(discrepancy_pct, 1),
-            'weight_recommendation': weight_recommendation,
-            'weight_explanation': weight_explanation,
-            'blended_median': round(blended_median),
-            'manual_comp_count': len(manual_comps),
-            'manual_avg_days_to_sale': round(manual_avg_days) if manual_avg_days else None
-        }
+        'comparison': comp_comparison(
+            manual_median, auto_median, *(column[0] for column in blend), len(manual_comps), manual_avg_days
+        )
     })
 
 
-def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units):
+COMP_WEIGHTS = ('AUTO_CONFIRMED', 'BLENDED', 'MANUAL_WEIGHTED')
+COMP_WEIGHT_EXPLANATIONS = {
+    'MANUAL_WEIGHTED': 'Manual comps diverge {pct:.1f}% from automated data. Manual data likely reflects more current or localized conditions. Weighting manual comps at 70%.',
+    'BLENDED': 'Moderate {pct:.1f}% discrepancy. Blending equally for balanced estimate.',
+    'AUTO_CONFIRMED': 'Manual comps confirm automated findings. High confidence in automated data.',
+}
+
+
+def blend_comp_medians(manual_median, auto_median):
     """
-    Generates realistic comp analysis based on vehicle parameters.
-    In production: this pulls from real auction + listing APIs.
+    Vectorized manual/auto reconciliation over arrays of medians (auto 0 =
+    no automated data). Returns (discrepancy, discrepancy_pct, weight index
+    into COMP_WEIGHTS, blended_median) arrays.
     """
-    import random
-    random.seed(hash(f"{year}{make}{model}{mileage}"))
+    has_auto = auto_median != 0
+    safe_auto = np.where(has_auto, auto_median, 1)
+    discrepancy = np.where(has_auto, np.abs(manual_median - auto_median), 0)
+    discrepancy_pct = np.where(has_auto, discrepancy / safe_auto * 100, 0)
+    weight = np.where(discrepancy_pct > 10, 2, np.where(discrepancy_pct > 5, 1, 0))
+    blended = np.choose(weight, [
+        auto_median,
+        (manual_median + auto_median) / 2,
+        (manual_median * 0.7) + (auto_median * 0.3),
+    ])
+    blended = np.where(has_auto, blended, manual_median)
+    return discrepancy, discrepancy_pct, weight, blended
+
+
+def comp_comparison(manual_median, auto_median, discrepancy, discrepancy_pct, weight, blended_median,
+                    manual_count, manual_avg_days):
+    discrepancy_pct = float(discrepancy_pct)
+    weight_recommendation = COMP_WEIGHTS[int(weight)]
+    return {
+        'manual_median': round(manual_median),
+        'auto_median': round(auto_median) if auto_median else None,
+        'discrepancy_dollars': round(float(discrepancy)),
+        'discrepancy_percent': round(discrepancy_pct, 1),
+        'weight_recommendation': weight_recommendation,
+        'weight_explanation': COMP_WEIGHT_EXPLANATIONS[weight_recommendation].format(pct=discrepancy_pct),
+        'blended_median': round(float(blended_median)),
+        'manual_comp_count': manual_count,
+        'manual_avg_days_to_sale': round(manual_avg_days) if manual_avg_days else None
+    }
+
+
+def iter_manual_comp_rows():
+    """(row, error) for each manual comp in the CSV or NDJSON request body."""
+    if request.mimetype == 'text/csv':
+        return iter_csv(request.stream, request.mimetype_params.get('charset', 'utf-8'))
+    return iter_ndjson(request.stream)
+
+
+def override_comps_bulk():
+    """
+    Month-end reconciliation: manual comps for many vehicles, one per row,
+    with columns vehicle_id, price and optional days_to_sale. Each vehicle's
+    automated median is the midpoint of its stored comp band. Rows are
+    grouped and blended in one vectorized pass and, unless ?apply=false,
+    each vehicle's comp_low/comp_high is recentered on its blended median
+    (keeping the band width, or the manual price spread if it had no band).
+    """
+    apply = request.args.get('apply', 'true').lower() not in ('0', 'false', 'no')
+    ids, prices, days, errors = [], [], [], []
+    for index, (row, error) in enumerate(iter_manual_comp_rows()):
+        if error is None:
+            try:
+                vehicle_id = str(row.get('vehicle_id') or '').strip()
+                if not vehicle_id:
+                    raise ValueError('Missing vehicle_id')
+                price = float(row.get('price') or 0)
+                days_to_sale = int(float(row.get('days_to_sale') or 0))
+            except (AttributeError, TypeError, ValueError) as e:
+                error = str(e)
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        ids.append(vehicle_id)
+        prices.append(price)
+        days.append(days_to_sale)
+    if not ids:
+        return jsonify({'error': 'No manual comps provided', 'errors': errors}), 400
+
+    # Group rows by vehicle: sort by (vehicle, price) so each group's upper
+    # median sits at start + count // 2, as in the single-vehicle path
+    vehicle_ids, codes = np.unique(np.array(ids), return_inverse=True)
+    prices, days = np.array(prices), np.array(days)
+    priced = prices != 0
+    order = np.lexsort((prices, ~priced, codes))
+    counts = np.bincount(codes, minlength=len(vehicle_ids))
+    price_counts = np.bincount(codes, weights=priced, minlength=len(vehicle_ids)).astype(int)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    manual_median = np.where(price_counts > 0, prices[order][np.minimum(starts + price_counts // 2, len(order) - 1)], 0)
+    day_counts = np.bincount(codes, weights=days != 0, minlength=len(vehicle_ids))
+    day_sums = np.bincount(codes, weights=days, minlength=len(vehicle_ids))
+    avg_days = np.divide(day_sums, day_counts, out=np.zeros_like(day_sums), where=day_counts > 0)
+    spread = np.zeros(len(vehicle_ids))
+    if priced.any():
+        np.maximum.at(spread, codes[priced], prices[priced])
+        low = np.full(len(vehicle_ids), np.inf)
+        np.minimum.at(low, codes[priced], prices[priced])
+        spread = np.where(price_counts > 0, spread - low, 0)
+
+    # The band read, the blend and the write happen in one transaction so a
+    # concurrent edit to any of these vehicles is neither lost nor blended stale
+    with storage_transaction():
+        vehicles = [vehicles_db.get(vehicle_id) for vehicle_id in vehicle_ids.tolist()]
+        found = np.array([v is not None for v in vehicles])
+        comp_low = np.array([v['comp_low'] if v else 0 for v in vehicles], dtype=float)
+        comp_high = np.array([v['comp_high'] if v else 0 for v in vehicles], dtype=float)
+        has_band = (comp_low != 0) & (comp_high != 0)
+        auto_median = np.where(has_band, (comp_low + comp_high) / 2, 0)
+        discrepancy, discrepancy_pct, weight, blended = blend_comp_medians(manual_median, auto_median)
+        half_width = np.where(has_band, comp_high - comp_low, spread) / 2
+        new_low = np.round(blended - half_width)
+        new_high = np.round(blended + half_width)
+
+        results, updated = [], []
+        for i, vehicle_id in enumerate(vehicle_ids.tolist()):
+            if not found[i]:
+                errors.append({'vehicle_id': vehicle_id, 'error': 'Vehicle not found'})
+                continue
+            if not price_counts[i]:
+                errors.append({'vehicle_id': vehicle_id, 'error': 'No priced manual comps'})
+                continue
+            results.append({
+                'vehicle_id': vehicle_id,
+                'comparison': comp_comparison(
+                    float(manual_median[i]), float(auto_median[i]), discrepancy[i], discrepancy_pct[i],
+                    weight[i], blended[i], int(counts[i]), float(avg_days[i])
+                ),
+                'comp_low': float(new_low[i]),
+                'comp_high': float(new_high[i])
+            })
+            updated.append(dict(vehicles[i], comp_low=float(new_low[i]), comp_high=float(new_high[i])))
+
+        if apply and updated:
+            vehicles_db.put_many(updated)
+
+    return jsonify({
+        'message': f"Comp override processed for {len(results)} vehicles" + ('' if apply else ' (not applied)'),
+        'applied': apply,
+        'results': results,
+        'errors': errors
+    })
+
+
+# --- Comp cache ---
+# Content-addressed on a digest of the normalized inputs and kept in the
+# shared comps store, so every worker answers the same lookup identically.
+COMP_CACHE_TTL = float(os.environ.get('COMP_CACHE_TTL', 6 * 3600))
+COMP_CACHE_SIZE = int(os.environ.get('COMP_CACHE_SIZE', 5000))
+# Hits only refresh accessed_at when it is older than this, to spare writes
+COMP_CACHE_TOUCH_INTERVAL = 60
+comp_cache_stats = {'hits': 0, 'misses': 0}
+_comp_cache_stats_lock = threading.Lock()
+
+
+def stable_digest(*parts):
+    """SHA-256 of the parts — unlike hash(), the same in every process."""
+    return hashlib.sha256(json.dumps(parts, separators=(',', ':')).encode()).hexdigest()
+
+
+def comp_cache_key(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code=''):
+    return stable_digest(
+        int(year), make.strip().lower(), model.strip().lower(), trim.strip().lower(),
+        int(mileage), float(list_price), float(comp_low), float(comp_high), int(competing_units),
+        zip_code.strip(), comp_index.version(comp_block_key(year, make, model))
+    )
 
+
+def cached_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code=''):
+    """generate_comp_analysis behind the shared TTL + LRU comp cache."""
+    key = comp_cache_key(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code)
+    now = time.time()
+
+    entry = comps_db.get(key)
+    if entry and entry['expires_at'] > now:
+        with _comp_cache_stats_lock:
+            comp_cache_stats['hits'] += 1
+        if now - entry['accessed_at'] > COMP_CACHE_TOUCH_INTERVAL:
+            comps_db[key] = dict(entry, accessed_at=now)
+        return entry['analysis']
+
+    with _comp_cache_stats_lock:
+        comp_cache_stats['misses'] += 1
+    analysis = generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code)
+    # An answer from a partial provider outage is served but not cached, so
+    # the next request retries the feeds instead of replaying it for hours
+    degraded = any(source['error'] for source in analysis.get('sources') or ())
+    if 'error' not in analysis and not degraded:
+        comps_db[key] = {'id': key, 'expires_at': now + COMP_CACHE_TTL, 'accessed_at': now, 'analysis': analysis}
+        comps_db.delete_matching([('expires_at', '<', now)])
+        comps_db.trim('accessed_at', COMP_CACHE_SIZE)
+    return analysis
+
+
+def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_low, comp_high, competing_units, zip_code=''):
+    """
+    Generates realistic comp analysis based on vehicle parameters.
+    Pulls from the live comp providers (auction, retail delisted, listing
+    sites) when COMP_PROVIDERS is configured; otherwise simulates comps.
+    """
     # Use provided comp range or estimate
     if comp_low and comp_high:
         price_low = comp_low
@@ -352,55 +1961,46 @@ def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_lo
         price_low = list_price * 0.88
         price_high = list_price * 1.05
     else:
-        return {'error': 'Insufficient data for comp analysis'}
-
-    comp_mid = (price_low + price_high) / 2
-    comp_range = price_high - price_low
-    num_comps = competing_units if competing_units > 0 else random.randint(8, 25)
-
-    # Generate individual comps
-    completed_sales = []
-    active_listings = []
-
-    for i in range(min(num_comps, 12)):
-        price_var = random.gauss(0, comp_range * 0.15)
-        sale_price = round(comp_mid + price_var, -2)
-        mile_var = random.randint(-8000, 12000)
-        comp_mileage = max(5000, mileage + mile_var)
-        days_on_market = max(3, int(random.gauss(35, 15)))
-
-        completed_sales.append({
-            'price': sale_price,
-            'mileage': comp_mileage,
-            'days_on_market': days_on_market,
-            'source': random.choice(['Auction', 'Retail - Delisted', 'Dealer Retail']),
-            'distance_miles': random.randint(5, 95)
-        })
-
-    for i in range(min(num_comps - len(completed_sales), 8)):
-        price_var = random.gauss(comp_range * 0.05, comp_range * 0.15)
-        active_price = round(comp_mid + price_var, -2)
-        mile_var = random.randint(-5000, 15000)
-        comp_mileage = max(5000, mileage + mile_var)
-        days_listed = random.randint(1, 65)
-
-        active_listings.append({
-            'price': active_price,
-            'mileage': comp_mileage,
-            'days_listed': days_listed,
-            'source': random.choice(['AutoTrader', 'Cars.com', 'CarGurus', 'Dealer Website']),
-            'distance_miles': random.randint(5, 95)
+        price_low = price_high = None
+
+    sources = None
+    observed = True
+    if comp_fetcher.providers:
+        completed_sales, active_listings, sources = comp_fetcher.fetch({
+            'year': year, 'make': make, 'model': model, 'trim': trim, 'mileage': mileage,
+            'zip_code': zip_code, 'list_price': list_price, 'comp_low': comp_low,
+            'comp_high': comp_high, 'competing_units': competing_units,
         })
+        data_freshness = f"Live — {sum(1 for s in sources if not s['error'])}/{len(sources)} providers responded"
+    else:
+        completed_sales, active_listings = comp_index.nearest(year, make, model, mileage, zip_code)
+        data_freshness = (f'Local comp index — within ±{COMP_MILEAGE_BAND:,} miles'
+                          + (f' and {COMP_SEARCH_RADIUS:g} mi of {zip_code}' if zip_location(zip_code) else ''))
+        if len(completed_sales) < COMP_INDEX_MIN_SALES:
+            observed = False
+            if price_low is not None:
+                completed_sales, active_listings = simulate_comps(
+                    year, make, model, mileage, (price_low + price_high) / 2, price_high - price_low, competing_units
+                )
+                data_freshness = 'Simulated — production version uses live market feeds'
+
+    if price_low is None:
+        if not observed or not completed_sales:
+            return {'error': 'Insufficient data for comp analysis'}
+        price_low = min(c['price'] for c in completed_sales)
+        price_high = max(c['price'] for c in completed_sales)
+    comp_mid = (price_low + price_high) / 2
 
-    # Statistics
-    all_sale_prices = [c['price'] for c in completed_sales]
-    all_sale_prices.sort()
-    all_days = [c['days_on_market'] for c in completed_sales]
+    # Statistics, in one pass over the completed sales
+    prices, days = StreamingStats(), StreamingStats()
+    for c in completed_sales:
+        prices.add(c['price'])
+        days.add(c['days_on_market'])
 
-    median_price = all_sale_prices[len(all_sale_prices) // 2] if all_sale_prices else comp_mid
-    avg_price = sum(all_sale_prices) / len(all_sale_prices) if all_sale_prices else comp_mid
-    median_days = sorted(all_days)[len(all_days) // 2] if all_days else 35
-    avg_days = sum(all_days) / len(all_days) if all_days else 35
+    median_price = prices.median if prices.count else comp_mid
+    avg_price = prices.average if prices.count else comp_mid
+    median_days = days.median if days.count else 35
+    avg_days = days.average if days.count else 35
 
     # Supply/demand assessment
     active_count = len(active_listings)
@@ -425,7 +2025,7 @@ def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_lo
         velocity = 'SLOW'
         velocity_detail = f'Median {median_days} days to sale — sluggish segment.'
 
-    return {
+    analysis = {
         'vehicle_searched': f'{year} {make} {model} {trim}'.strip(),
         'comp_count': {
             'completed_sales': len(completed_sales),
@@ -435,15 +2035,15 @@ def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_lo
         'price_analysis': {
             'median_sale_price': round(median_price),
             'average_sale_price': round(avg_price),
-            'price_range_low': round(min(all_sale_prices)) if all_sale_prices else round(price_low),
-            'price_range_high': round(max(all_sale_prices)) if all_sale_prices else round(price_high),
-            'price_std_dev': round(std_dev(all_sale_prices)) if len(all_sale_prices) > 1 else 0
+            'price_range_low': round(prices.min) if prices.count else round(price_low),
+            'price_range_high': round(prices.max) if prices.count else round(price_high),
+            'price_std_dev': round(prices.std_dev)
         },
         'days_to_sale': {
             'median': round(median_days),
             'average': round(avg_days),
-            'fastest': min(all_days) if all_days else 0,
-            'slowest': max(all_days) if all_days else 0
+            'fastest': days.min if days.count else 0,
+            'slowest': days.max if days.count else 0
         },
         'supply_demand': {
             'supply_pressure': supply_pressure,
@@ -454,17 +2054,762 @@ def generate_comp_analysis(year, make, model, trim, mileage, list_price, comp_lo
         },
         'completed_sales': completed_sales[:8],
         'active_listings': active_listings[:8],
-        'data_freshness': 'Simulated — production version uses live market feeds',
+        'data_freshness': data_freshness,
         'generated_at': datetime.utcnow().isoformat()
     }
+    if sources is not None:
+        analysis['sources'] = sources
+    return analysis
+
+
+def simulate_comps(year, make, model, mileage, comp_mid, comp_range, competing_units):
+    """Realistic simulated (completed_sales, active_listings) around a price band."""
+    import random
+    # Seeded from a stable digest so the same vehicle gets the same comps in every worker
+    rng = random.Random(stable_digest(int(year), make.strip().lower(), model.strip().lower(), int(mileage)))
+    num_comps = competing_units if competing_units > 0 else rng.randint(8, 25)
+
+    # Generate individual comps
+    completed_sales = []
+    active_listings = []
+
+    for i in range(min(num_comps, 12)):
+        price_var = rng.gauss(0, comp_range * 0.15)
+        sale_price = round(comp_mid + price_var, -2)
+        mile_var = rng.randint(-8000, 12000)
+        comp_mileage = max(5000, mileage + mile_var)
+        days_on_market = max(3, int(rng.gauss(35, 15)))
+
+        completed_sales.append({
+            'price': sale_price,
+            'mileage': comp_mileage,
+            'days_on_market': days_on_market,
+            'source': rng.choice(['Auction', 'Retail - Delisted', 'Dealer Retail']),
+            'distance_miles': rng.randint(5, 95)
+        })
+
+    for i in range(min(num_comps - len(completed_sales), 8)):
+        price_var = rng.gauss(comp_range * 0.05, comp_range * 0.15)
+        active_price = round(comp_mid + price_var, -2)
+        mile_var = rng.randint(-5000, 15000)
+        comp_mileage = max(5000, mileage + mile_var)
+        days_listed = rng.randint(1, 65)
+
+        active_listings.append({
+            'price': active_price,
+            'mileage': comp_mileage,
+            'days_listed': days_listed,
+            'source': rng.choice(['AutoTrader', 'Cars.com', 'CarGurus', 'Dealer Website']),
+            'distance_miles': rng.randint(5, 95)
+        })
+
+    return completed_sales, active_listings
 
 
 def std_dev(values):
-    if len(values) < 2:
-        return 0
-    mean = sum(values) / len(values)
-    variance = sum((x - mean) ** 2 for x in values) / (len(values) - 1)
-    return math.sqrt(variance)
+    return StreamingStats(values).std_dev
+
+
+# ============================================================
+# STREAMING STATS — one-pass, mergeable summaries
+# ============================================================
+class RunningStats:
+    """Welford count / mean / variance plus min, max and sum, in O(1) memory."""
+
+    __slots__ = ('count', 'total', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        """Chan et al. parallel combination of two summaries."""
+        if not other.count:
+            return self
+        if not self.count:
+            for name in RunningStats.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def std_dev(self):
+        """Sample standard deviation; 0 below two values."""
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1)) if self.count > 1 else 0
+
+
+class QuantileDigest:
+    """
+    Merging t-digest. Values are buffered raw until the buffer fills, so small
+    inputs stay exact: quantile(q) is sorted(values)[floor(q * n)], the same
+    upper median the comp code has always used. Past that, centroids are
+    merged under the k1 scale function (accurate in the tails) and
+    quantiles are interpolated between centroids.
+    """
+
+    def __init__(self, compression=100, buffer_size=500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.centroids = []  # sorted [mean, weight]
+        self._buffer = []
+        self.count = 0
+        self.exact = True
+        self.min = None
+        self.max = None
+
+    def add(self, x, weight=1):
+        self._buffer.append([x, weight])
+        self.count += weight
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        if len(self._buffer) > self.buffer_size:
+            self._compress()
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        self.exact = self.exact and other.exact
+        self._buffer.extend([mean, weight] for mean, weight in other.centroids + other._buffer)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if len(self._buffer) + len(self.centroids) > self.buffer_size:
+            self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _q(self, k):
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self):
+        items = sorted(self.centroids + self._buffer, key=lambda c: c[0])
+        self._buffer = []
+        if not self.exact or len(items) > self.buffer_size:
+            self.exact = False
+            merged = [list(items[0])]
+            so_far = 0
+            limit = self.count * self._q(self._k(0) + 1)
+            for mean, weight in items[1:]:
+                current = merged[-1]
+                if so_far + current[1] + weight <= limit:
+                    current[1] += weight
+                    current[0] += (mean - current[0]) * weight / current[1]
+                else:
+                    so_far += current[1]
+                    limit = self.count * self._q(self._k(so_far / self.count) + 1)
+                    merged.append([mean, weight])
+            items = merged
+        self.centroids = items
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        if self._buffer:
+            self._compress()
+        centroids = self.centroids
+        if self.exact:
+            # Raw values: the one at rank floor(q * n)
+            rank = min(int(q * self.count), self.count - 1)
+            for mean, weight in centroids:
+                rank -= weight
+                if rank < 0:
+                    return mean
+        target = q * self.count
+        cumulative = 0
+        previous_mid, previous_mean = 0, self.min
+        for mean, weight in centroids:
+            mid = cumulative + weight / 2
+            if target < mid:
+                span = mid - previous_mid
+                return previous_mean + (mean - previous_mean) * ((target - previous_mid) / span if span else 0)
+            cumulative += weight
+            previous_mid, previous_mean = mid, mean
+        span = self.count - previous_mid
+        return previous_mean + (self.max - previous_mean) * ((target - previous_mid) / span if span else 0)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+
+class StreamingStats(RunningStats):
+    """RunningStats with a QuantileDigest alongside for medians and percentiles."""
+
+    __slots__ = ('digest',)
+
+    def __init__(self, values=()):
+        super().__init__()
+        self.digest = QuantileDigest()
+        for x in values:
+            self.add(x)
+
+    def add(self, x):
+        super().add(x)
+        self.digest.add(x)
+
+    def merge(self, other):
+        digest = self.digest
+        super().merge(other)
+        self.digest = digest.merge(other.digest)
+        return self
+
+    def quantile(self, q):
+        return self.digest.quantile(q)
+
+    @property
+    def median(self):
+        return self.digest.median
+
+
+# ============================================================
+# COMP PROVIDERS — async fan-out to auction / retail / listing feeds
+# ============================================================
+# COMP_PROVIDERS: unset for simulated comps, "stub" for the local stand-in
+# server, or a JSON list of {"name", "kind", "url", "timeout"} objects where
+# kind is "completed" (sold comps) or "active" (current listings).
+COMP_PROVIDER_TIMEOUT = float(os.environ.get('COMP_PROVIDER_TIMEOUT', 3.0))
+COMP_PROVIDER_CONCURRENCY = int(os.environ.get('COMP_PROVIDER_CONCURRENCY', 16))
+
+
+class HTTPCompProvider:
+    """A comp feed reachable over HTTP that answers GET url?<query> with {"comps": [...]}."""
+
+    def __init__(self, name, kind, url, timeout=COMP_PROVIDER_TIMEOUT):
+        if kind not in ('completed', 'active'):
+            raise ValueError(f'Unknown comp provider kind: {kind}')
+        self.name = name
+        self.kind = kind
+        self.url = url
+        self.timeout = float(timeout)
+
+    async def fetch(self, session, query):
+        params = {k: str(v) for k, v in query.items() if v not in (None, '')}
+        async with session.get(self.url, params=params) as resp:
+            resp.raise_for_status()
+            payload = await resp.json(content_type=None)
+        return [normalize_comp(c, self.kind, self.name) for c in payload.get('comps', [])]
+
+
+def normalize_comp(raw, kind, default_source):
+    """Coerces a provider comp into the completed_sales / active_listings shape."""
+    days_key = 'days_on_market' if kind == 'completed' else 'days_listed'
+    return {
+        'price': float(raw['price']),
+        'mileage': int(raw.get('mileage', 0)),
+        days_key: int(raw.get(days_key, 0)),
+        'source': raw.get('source') or default_source,
+        'distance_miles': int(raw.get('distance_miles', 0))
+    }
+
+
+class CompFetcher:
+    """
+    Fans a comp query out to every provider concurrently on a background
+    event loop. One pooled keep-alive session per process; each provider has
+    its own timeout and a failing provider only drops its own comps.
+    """
+
+    def __init__(self, providers=(), concurrency=COMP_PROVIDER_CONCURRENCY):
+        self.providers = list(providers)
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._session = None
+        self._semaphore = None
+
+    def _event_loop(self):
+        with self._lock:
+            # The loop thread does not survive a fork; each worker starts its own
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._session = None
+                self._thread = threading.Thread(target=self._loop.run_forever, name='comp-fetcher', daemon=True)
+                self._thread.start()
+                _running_comp_fetchers.add(self)
+            return self._loop
+
+    def close(self, timeout=5):
+        """Closes the session and stops the loop thread; the next fetch starts a new one."""
+        with self._lock:
+            loop, session, thread = self._loop, self._session, self._thread
+            self._loop = self._session = self._thread = None
+            _running_comp_fetchers.discard(self)
+            if loop is None or self._pid != os.getpid():
+                return
+            try:
+                if session is not None:
+                    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(timeout)
+                if not thread.is_alive():
+                    loop.close()
+
+    async def _fetch_one(self, provider, query):
+        started = time.perf_counter()
+        comps, error = [], None
+        async with self._semaphore:
+            try:
+                comps = await asyncio.wait_for(provider.fetch(self._session, query), provider.timeout)
+            except asyncio.TimeoutError:
+                error = f'timed out after {provider.timeout:g}s'
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        return provider, comps, {
+            'provider': provider.name,
+            'kind': provider.kind,
+            'count': len(comps),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'error': error
+        }
+
+    async def _fetch_all(self, query):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._fetch_one(p, query) for p in self.providers))
+
+    def fetch(self, query):
+        """Blocking entry point: returns (completed_sales, active_listings, sources)."""
+        results = asyncio.run_coroutine_threadsafe(self._fetch_all(query), self._event_loop()).result()
+        completed, active, sources = [], [], []
+        for provider, comps, status in results:
+            (completed if provider.kind == 'completed' else active).extend(comps)
+            sources.append(status)
+        return completed, active, sources
+
+
+# Local stand-in for the real feeds: serves the simulated comps split by
+# source, so the live code path can be exercised end to end without keys.
+STUB_FEEDS = {
+    'auction': ('completed', {'Auction'}),
+    'retail_delisted': ('completed', {'Retail - Delisted', 'Dealer Retail'}),
+    'listings': ('active', None),
+}
+
+
+def stub_feed_comps(feed, q):
+    kind, sources = STUB_FEEDS[feed]
+    list_price = float(q.get('list_price', 0))
+    comp_low = float(q.get('comp_low', 0))
+    comp_high = float(q.get('comp_high', 0))
+    if not (comp_low and comp_high):
+        comp_low, comp_high = list_price * 0.88, list_price * 1.05
+    if not comp_high:
+        return []
+    completed, active = simulate_comps(
+        int(q.get('year', 0)), q.get('make', ''), q.get('model', ''), int(float(q.get('mileage', 0))),
+        (comp_low + comp_high) / 2, comp_high - comp_low, int(q.get('competing_units', 0))
+    )
+    if kind == 'active':
+        return active
+    return [c for c in completed if c['source'] in sources]
+
+
+class StubCompHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so the client pool is exercised
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        feed = url.path.rstrip('/').rsplit('/', 1)[-1]
+        if feed not in STUB_FEEDS:
+            self._send(404, {'error': f'Unknown feed: {feed}'})
+            return
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        delay_ms = float(os.environ.get(f'STUB_COMP_DELAY_MS_{feed.upper()}', 0))
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        try:
+            self._send(200, {'comps': stub_feed_comps(feed, q)})
+        except (TypeError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_comp_server(host='127.0.0.1', port=0):
+    """Starts the stand-in feed server on a daemon thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), StubCompHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-comps', daemon=True).start()
+    return server
+
+
+def configure_comp_providers(spec):
+    if not spec:
+        return []
+    if spec == 'stub':
+        host, port = start_stub_comp_server().server_address[:2]
+        return [HTTPCompProvider(feed, kind, f'http://{host}:{port}/comps/{feed}')
+                for feed, (kind, _) in STUB_FEEDS.items()]
+    return [HTTPCompProvider(**p) for p in json.loads(spec)]
+
+
+_running_comp_fetchers = weakref.WeakSet()
+
+
+def close_comp_fetchers():
+    for fetcher in list(_running_comp_fetchers):
+        fetcher.close()
+
+
+# Close sessions at exit, and before a fork so the child does not inherit
+# the parent's keep-alive sockets (the parent reopens on its next fetch)
+atexit.register(close_comp_fetchers)
+os.register_at_fork(before=close_comp_fetchers)
+
+comp_fetcher = CompFetcher(configure_comp_providers(os.environ.get('COMP_PROVIDERS', '').strip()))
+
+
+# ============================================================
+# COMP INDEX — historical sales, nearest neighbours by radius + mileage
+# ============================================================
+# Sales are kept per year/make/model, sorted by mileage, with a lat/lon grid
+# over the located ones: each grid cell is a run of rows sorted by mileage,
+# so a radius query visits only the cells the search circle touches and
+# slices each cell's mileage band with one searchsorted. Survivors are
+# ranked by haversine distance and odometer gap.
+COMP_SEARCH_RADIUS = float(os.environ.get('COMP_SEARCH_RADIUS', 150))
+COMP_MILEAGE_BAND = int(os.environ.get('COMP_MILEAGE_BAND', 15000))
+COMP_INDEX_MIN_SALES = int(os.environ.get('COMP_INDEX_MIN_SALES', 3))
+COMP_INDEX_BLOCKS = int(os.environ.get('COMP_INDEX_BLOCKS', 256))
+COMP_GRID_DEGREES = float(os.environ.get('COMP_GRID_DEGREES', 1.0))
+# Radius search needs a ZIP -> lat/lon table: a zip,lat,lon CSV, or the
+# Census Bureau's ZCTA Gazetteer file as downloaded (e.g.
+# 2023_Gaz_zcta_national.txt). Without one, comps are matched on mileage
+# only and carry no distance.
+ZIP_CENTROIDS_PATH = os.environ.get('ZIP_CENTROIDS_PATH', '')
+ZIP_CENTROID_COLUMNS = {'GEOID': 'zip', 'INTPTLAT': 'lat', 'INTPTLONG': 'lon'}
+EARTH_RADIUS_MILES = 3958.8
+
+COMP_SALE_COLUMNS = ('kind', 'price', 'mileage', 'days', 'source', 'zip_code', 'lat', 'lon', 'recorded_at')
+
+
+@functools.lru_cache(maxsize=1)
+def zip_centroids():
+    """ZIP -> (lat, lon) from ZIP_CENTROIDS_PATH (see above); empty if unset."""
+    if not ZIP_CENTROIDS_PATH:
+        return {}
+    with open(ZIP_CENTROIDS_PATH, newline='') as f:
+        header = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in header else ',')
+        # Gazetteer headers are GEOID / INTPTLAT / INTPTLONG, the last one space-padded
+        reader.fieldnames = [ZIP_CENTROID_COLUMNS.get(name.strip(), name.strip()) for name in reader.fieldnames]
+        return {row['zip'].strip().zfill(5): (float(row['lat']), float(row['lon'])) for row in reader}
+
+
+def zip_location(zip_code):
+    zip_code = str(zip_code or '').strip()[:5]
+    return zip_centroids().get(zip_code.zfill(5)) if zip_code else None
+
+
+def comp_block_key(year, make, model):
+    return int(year), make.strip().lower(), model.strip().lower()
+
+
+def comp_block_meta_id(key):
+    """meta_db id holding the version of one year/make/model block."""
+    return 'comp_index:' + stable_digest(*key)
+
+
+def comp_sale_row(sale):
+    """Validates an ingested sale; returns (block_key, row) in COMP_SALE_COLUMNS order."""
+    kind = sale.get('kind', 'completed')
+    if kind not in ('completed', 'active'):
+        raise ValueError(f'Unknown comp kind: {kind}')
+    if not sale.get('year') or not sale.get('make') or not sale.get('model'):
+        raise ValueError('Year, make, and model are required')
+    price = float(sale['price'])
+    days = sale.get('days_on_market' if kind == 'completed' else 'days_listed', 0)
+    zip_code = str(sale.get('zip_code') or '').strip()
+    if sale.get('lat') is not None and sale.get('lon') is not None:
+        lat, lon = float(sale['lat']), float(sale['lon'])
+    else:
+        lat, lon = zip_location(zip_code) or (None, None)
+    return comp_block_key(sale['year'], str(sale['make']), str(sale['model'])), (
+        kind, price, int(sale.get('mileage', 0)), int(days or 0), str(sale.get('source') or ''),
+        zip_code, lat, lon, str(sale.get('recorded_at') or datetime.utcnow().isoformat())
+    )
+
+
+class MemoryCompTable:
+    """Process-local comp sales, grouped by block key."""
+
+    def __init__(self):
+        self._blocks = {}
+
+    def insert_many(self, keyed_rows):
+        for key, row in keyed_rows:
+            self._blocks.setdefault(key, []).append(row)
+
+    def load(self, key):
+        return sorted(self._blocks.get(key, ()), key=lambda row: row[2])
+
+    def count(self):
+        return sum(len(rows) for rows in self._blocks.values())
+
+
+class SQLiteCompTable:
+    """Comp sales in the shared database, clustered on (year, make, model, mileage)."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        pool.on_first_use(self._create)
+
+    def _create(self, conn):
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS comp_sales (id INTEGER PRIMARY KEY, year INTEGER NOT NULL, '
+            'make TEXT NOT NULL, model TEXT NOT NULL, kind TEXT NOT NULL, price REAL NOT NULL, '
+            'mileage INTEGER NOT NULL, days INTEGER NOT NULL, source TEXT, zip_code TEXT, '
+            'lat REAL, lon REAL, recorded_at TEXT)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_comp_sales_block ON comp_sales (year, make, model, mileage)')
+
+    def insert_many(self, keyed_rows):
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                f'INSERT INTO comp_sales (year, make, model, {", ".join(COMP_SALE_COLUMNS)}) '
+                f'VALUES (?, ?, ?, {", ".join("?" * len(COMP_SALE_COLUMNS))})',
+                (key + row for key, row in keyed_rows)
+            )
+
+    def load(self, key):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f'SELECT {", ".join(COMP_SALE_COLUMNS)} FROM comp_sales '
+                'WHERE year = ? AND make = ? AND model = ? ORDER BY mileage', key
+            ).fetchall()
+
+    def count(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM comp_sales').fetchone()[0]
+
+
+class CompIndex:
+    """
+    Nearest-neighbour comp search over the comp table. Each year/make/model
+    block is loaded once into mileage-sorted numpy columns plus a grid index
+    and kept in a per-process LRU. Every block has its own version in
+    meta_db; ingesting sales bumps only the blocks it touched, which drops
+    just those from every worker's LRU and from the comp cache keys.
+    """
+
+    def __init__(self, table, max_blocks=COMP_INDEX_BLOCKS, grid_degrees=COMP_GRID_DEGREES):
+        self.table = table
+        self.max_blocks = max_blocks
+        self.grid_degrees = grid_degrees
+        self.grid_columns = math.ceil(360 / grid_degrees)
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def version(self, key):
+        meta = meta_db.get(comp_block_meta_id(key))
+        return meta['version'] if meta else 0
+
+    def add_many(self, keyed_rows):
+        keyed_rows = list(keyed_rows)
+        with storage_transaction():
+            self.table.insert_many(keyed_rows)
+            for key in {key for key, _ in keyed_rows}:
+                meta_id = comp_block_meta_id(key)
+                meta_db[meta_id] = {'id': meta_id, 'version': self.version(key) + 1}
+
+    def _cells(self, lat, lon):
+        """Grid cell codes: row-major over (latitude band, longitude band)."""
+        row = np.floor((lat + 90) / self.grid_degrees).astype(np.int64)
+        column = np.floor((lon + 180) / self.grid_degrees).astype(np.int64) % self.grid_columns
+        return row * self.grid_columns + column
+
+    def _load(self, key):
+        rows = self.table.load(key)
+        cols = list(zip(*rows)) if rows else [()] * len(COMP_SALE_COLUMNS)
+        block = {
+            'completed': np.array([kind == 'completed' for kind in cols[0]], dtype=bool),
+            'price': np.array(cols[1], dtype=float),
+            'mileage': np.array(cols[2], dtype=np.int64),
+            'days': np.array(cols[3], dtype=np.int64),
+            'source': np.array(cols[4], dtype=object),
+            'lat': np.array([np.nan if v is None else v for v in cols[6]], dtype=float),
+            'lon': np.array([np.nan if v is None else v for v in cols[7]], dtype=float),
+        }
+        # Grid: located rows ordered by (cell, mileage), searchable on one
+        # int64 key of cell << 32 | mileage
+        located = np.flatnonzero(~np.isnan(block['lat']) & ~np.isnan(block['lon']))
+        cells = self._cells(block['lat'][located], block['lon'][located])
+        order = np.lexsort((block['mileage'][located], cells))
+        block['grid_rows'] = located[order]
+        block['grid_keys'] = (cells[order] << 32) | np.clip(block['mileage'][located][order], 0, 0xFFFFFFFF)
+        return block
+
+    def _block(self, key):
+        version = self.version(key)
+        with self._lock:
+            cached = self._blocks.pop(key, None)
+        if cached is None or cached[0] != version:
+            cached = (version, self._load(key))
+        with self._lock:
+            self._blocks[key] = cached
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.pop(next(iter(self._blocks)))
+        return cached[1]
+
+    def _radius_cells(self, lat0, lon0, radius):
+        """Codes of every grid cell a circle of `radius` miles around (lat0, lon0) can touch."""
+        reach = math.degrees(radius / EARTH_RADIUS_MILES) * (1 + 1e-9)
+        rows = np.arange(math.floor((max(lat0 - reach, -90) + 90) / self.grid_degrees),
+                         math.floor((min(lat0 + reach, 90) + 90) / self.grid_degrees) + 1)
+        if abs(lat0) + reach >= 90:
+            columns = np.arange(self.grid_columns)
+        else:
+            # Widest longitude span of the circle (its tangent meridians)
+            span = math.degrees(math.asin(min(1.0, math.sin(math.radians(reach)) / math.cos(math.radians(lat0)))))
+            span *= 1 + 1e-9
+            first = math.floor((lon0 - span + 180) / self.grid_degrees)
+            last = math.floor((lon0 + span + 180) / self.grid_degrees)
+            columns = np.unique(np.arange(first, last + 1) % self.grid_columns)
+        return (rows[:, None] * self.grid_columns + columns).ravel()
+
+    def _grid_candidates(self, block, lat0, lon0, radius, mileage_lo, mileage_hi):
+        """Row indices inside the radius's cells and the mileage band, in mileage order."""
+        cells = self._radius_cells(lat0, lon0, radius) << 32
+        starts = np.searchsorted(block['grid_keys'], cells | min(max(mileage_lo, 0), 0xFFFFFFFF), side='left')
+        ends = np.searchsorted(block['grid_keys'], cells | min(max(mileage_hi, 0), 0xFFFFFFFF), side='right')
+        lengths = np.maximum(ends - starts, 0)
+        # Concatenated aranges over the non-empty runs
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        rows = np.sort(block['grid_rows'][np.arange(lengths.sum()) + offsets])
+        # The key clips odometers to 32 bits; recheck the band on the real values
+        mileage = block['mileage'][rows]
+        return rows[(mileage >= mileage_lo) & (mileage <= mileage_hi)]
+
+    def nearest(self, year, make, model, mileage, zip_code='', radius=COMP_SEARCH_RADIUS,
+                mileage_band=COMP_MILEAGE_BAND, completed_limit=12, active_limit=8):
+        """(completed_sales, active_listings): closest comps inside the radius and mileage band."""
+        block = self._block(comp_block_key(year, make, model))
+        origin = zip_location(zip_code)
+        if origin is None:
+            lo = np.searchsorted(block['mileage'], mileage - mileage_band, side='left')
+            hi = np.searchsorted(block['mileage'], mileage + mileage_band, side='right')
+            rows = np.arange(lo, hi)
+            distance = np.full(len(rows), np.nan)
+        else:
+            lat0, lon0 = origin
+            rows = self._grid_candidates(block, lat0, lon0, radius, mileage - mileage_band, mileage + mileage_band)
+            distance = haversine_miles(lat0, lon0, block['lat'][rows], block['lon'][rows])
+            within = distance <= radius
+            rows, distance = rows[within], distance[within]
+        gap = np.abs(block['mileage'][rows] - mileage) / max(mileage_band, 1)
+        score = gap + (np.nan_to_num(distance) / radius if origin is not None else 0)
+        order = np.lexsort((gap, score))
+        rows, distance = rows[order], distance[order]
+
+        def take(mask, limit, days_key):
+            picked = np.flatnonzero(mask)[:limit]
+            return [{
+                'price': float(block['price'][r]),
+                'mileage': int(block['mileage'][r]),
+                days_key: int(block['days'][r]),
+                'source': block['source'][r],
+                'distance_miles': None if np.isnan(distance[i]) else int(round(distance[i]))
+            } for i, r in zip(picked, rows[picked])]
+
+        completed = block['completed'][rows]
+        return (take(completed, completed_limit, 'days_on_market'),
+                take(~completed, active_limit, 'days_listed'))
+
+
+def haversine_miles(lat0, lon0, lat, lon):
+    lat0, lon0, lat, lon = map(np.radians, (lat0, lon0, lat, lon))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+comp_index = CompIndex(SQLiteCompTable(db_pool) if db_pool is not None else MemoryCompTable())
+
+
+@app.route('/api/comps/sales', methods=['POST'])
+def ingest_comp_sales():
+    """
+    Loads historical comps into the local comp index. Accepts a JSON array,
+    or NDJSON with Content-Type: application/x-ndjson, of
+    {year, make, model, price, mileage, kind ('completed' | 'active'),
+    days_on_market | days_listed, source, zip_code | lat + lon}.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = iter_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'Provide a JSON array of sales or an NDJSON body'}), 400
+        items = ((item, None) for item in data)
+
+    inserted, errors, rows = 0, [], []
+    for index, (item, error) in enumerate(items):
+        if error is None:
+            try:
+                rows.append(comp_sale_row(item))
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                error = f'Missing field: {e}' if isinstance(e, KeyError) else str(e)
+        if error:
+            errors.append({'index': index, 'error': error})
+        if len(rows) >= 5000:
+            comp_index.add_many(rows)
+            inserted += len(rows)
+            rows = []
+    if rows:
+        comp_index.add_many(rows)
+        inserted += len(rows)
+
+    return jsonify({
+        'message': f'{inserted} comp sales indexed',
+        'inserted': inserted,
+        'errors': errors
+    }), 201 if inserted else 400
 
 
 # ============================================================
@@ -472,9 +2817,28 @@ def std_dev(values):
 # ============================================================
 @app.route('/api/vehicles', methods=['GET'])
 def get_vehicles():
-    vehicle_list = list(vehicles_db.values())
-    vehicle_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return jsonify({'count': len(vehicle_list), 'vehicles': vehicle_list})
+    """
+    Lists vehicles newest first.
+
+    Query params (all optional):
+    - limit / after=<created_at>,<id>: keyset pagination; follow next_cursor
+    - fields=make,model,...: return only these record fields (plus id)
+    - status, zone (healthy | at_risk | danger), make: filters
+    """
+    filters = []
+    if request.args.get('status'):
+        filters.append(('status', '=', request.args['status']))
+    if request.args.get('make'):
+        filters.append(('make', 'nocase', request.args['make']))
+    if request.args.get('zone'):
+        zone_filters = aging_zone_filters(request.args['zone'])
+        if zone_filters is None:
+            return jsonify({'error': 'zone must be healthy, at_risk or danger'}), 400
+        filters.extend(zone_filters)
+
+    fields = parse_fields(request.args.get('fields'))
+    project = (lambda v: {k: v[k] for k in ['id', *fields] if k in v}) if fields else None
+    return list_page(vehicles_db, 'vehicles', filters, project)
 
 @app.route('/api/vehicles', methods=['POST'])
 def add_vehicle():
@@ -482,17 +2846,120 @@ def add_vehicle():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    required = ['year', 'make', 'model', 'acquisition_cost', 'list_price']
-    for field in required:
-        if field not in data or not data[field]:
-            return jsonify({'error': f'Missing required field: {field}'}), 400
+    missing = missing_required_field(data)
+    if missing:
+        return jsonify({'error': f'Missing required field: {missing}'}), 400
 
     vehicle_id = str(uuid.uuid4())
     vehicle = build_vehicle_record(vehicle_id, data)
     vehicles_db[vehicle_id] = vehicle
     return jsonify({'message': 'Vehicle added', 'vehicle': vehicle}), 201
 
+@app.route('/api/vehicles/import', methods=['POST'])
+def import_vehicles():
+    """
+    Bulk load from a DMS export: CSV (text/csv) or NDJSON, one vehicle per
+    row, with the same fields and defaults as POST /api/vehicles. Rows that
+    carry an id, status or created_at (e.g. our own export) keep them, so a
+    reload is an upsert. The body is streamed and written in batches; bad
+    rows are reported by index and skipped.
+    """
+    if request.mimetype == 'text/csv':
+        # Empty cells fall back to the field defaults, as if absent
+        items = (({k: v for k, v in row.items() if v not in ('', None)}, None)
+                 for row, _ in iter_csv(request.stream, request.mimetype_params.get('charset', 'utf-8')))
+    elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = iter_ndjson(request.stream)
+    else:
+        return jsonify({'error': 'Send text/csv or application/x-ndjson'}), 415
+
+    imported, errors = 0, []
+    for batch in chunked(import_vehicle_records(items, errors), IMPORT_BATCH_SIZE):
+        # A repeated id within a batch keeps its last row
+        batch = list({v['id']: v for v in batch}.values())
+        vehicles_db.put_many(batch)
+        imported += len(batch)
+
+    return jsonify({
+        'message': f'{imported} vehicles imported',
+        'imported': imported,
+        'errors': errors
+    }), 201 if imported else 400
+
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_PAGE_SIZE = 1000
+
+
+def import_vehicle_records(items, errors):
+    """Yields vehicle records for each valid (row, error) pair; appends the rest to errors."""
+    for index, (row, error) in enumerate(items):
+        if error is None:
+            if not isinstance(row, dict):
+                error = 'Row must be an object'
+            elif missing_required_field(row):
+                error = f'Missing required field: {missing_required_field(row)}'
+        if error is None:
+            try:
+                vehicle = build_vehicle_record(str(row.get('id') or '') or None, row)
+            except (TypeError, ValueError) as e:
+                error = f'Invalid row: {e}'
+            else:
+                for field in ('status', 'created_at'):
+                    if row.get(field):
+                        vehicle[field] = str(row[field])
+                yield vehicle
+                continue
+        errors.append({'index': index, 'error': error})
+
+
+@app.route('/api/vehicles/export', methods=['GET'])
+def export_vehicles():
+    """
+    Streams every vehicle, newest first, as NDJSON (default) or CSV
+    (?format=csv) with the import columns. Accepts the status and make
+    filters of GET /api/vehicles.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    filters = []
+    if request.args.get('status'):
+        filters.append(('status', '=', request.args['status']))
+    if request.args.get('make'):
+        filters.append(('make', 'nocase', request.args['make']))
+
+    def records():
+        after = None
+        while True:
+            page = vehicles_db.scan(filters, after=after, limit=EXPORT_PAGE_SIZE)
+            yield from page
+            if len(page) < EXPORT_PAGE_SIZE:
+                return
+            after = (page[-1].get('created_at') or '', page[-1]['id'])
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, ['id', *VEHICLE_FIELDS, 'status', 'created_at'], extrasaction='ignore')
+        writer.writeheader()
+        for page in chunked(records(), EXPORT_PAGE_SIZE):
+            writer.writerows(page)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = (json.dumps(v) + '\n' for v in records()), 'application/x-ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=vehicles.{fmt}'
+    return response
+
+
 @app.route('/api/vehicles/<vehicle_id>', methods=['GET'])
+@versioned(vehicles_db.version)
 def get_vehicle(vehicle_id):
     vehicle = vehicles_db.get(vehicle_id)
     if not vehicle:
@@ -507,14 +2974,92 @@ def update_vehicle(vehicle_id):
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     vehicle = build_vehicle_record(vehicle_id, data)
-    vehicles_db[vehicle_id] = vehicle
+    with storage_transaction():
+        current = vehicles_db.get(vehicle_id)
+        if not current:
+            return jsonify({'error': 'Vehicle not found'}), 404
+        vehicle['created_at'] = current['created_at']
+        vehicles_db[vehicle_id] = vehicle
+    return jsonify({'message': 'Vehicle updated', 'vehicle': vehicle})
+
+
+@app.route('/api/vehicles/<vehicle_id>', methods=['PATCH'])
+def patch_vehicle(vehicle_id):
+    """Applies a sparse set of field changes, e.g. {"views_7": 41, "leads_7": 3}."""
+    data = request.get_json()
+    if not data or not isinstance(data, dict):
+        return jsonify({'error': 'No data provided'}), 400
+    with storage_transaction():
+        vehicle = vehicles_db.get(vehicle_id)
+        if not vehicle:
+            return jsonify({'error': 'Vehicle not found'}), 404
+        try:
+            vehicle = patch_vehicle_record(vehicle, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        vehicles_db[vehicle_id] = vehicle
     return jsonify({'message': 'Vehicle updated', 'vehicle': vehicle})
 
+
+@app.route('/api/vehicles', methods=['PATCH'])
+def patch_vehicles():
+    """
+    Bulk sparse update for telemetry syncs: a JSON array, or NDJSON with
+    Content-Type: application/x-ndjson, of {"id": ..., <field>: <value>}.
+    Valid rows are written together; bad rows are reported by index.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = iter_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'Provide a JSON array of updates or an NDJSON body'}), 400
+        items = ((item, None) for item in data)
+
+    # Read and validate the whole body first (field checks do not depend on
+    # the stored row), so a slow upload never holds the write transaction
+    errors = []
+    changes = {}
+    for index, (delta, error) in enumerate(items):
+        if error is None:
+            if not isinstance(delta, dict) or not delta.get('id'):
+                error = 'Missing id'
+            else:
+                vehicle_id = str(delta['id'])
+                try:
+                    change = patch_vehicle_record({'id': vehicle_id}, delta)
+                except ValueError as e:
+                    error = str(e)
+                else:
+                    changes.setdefault(vehicle_id, []).append((index, change))
+        if error:
+            errors.append({'index': index, 'error': error})
+
+    with storage_transaction():
+        patched = {}
+        for vehicle_id, rows in changes.items():
+            vehicle = vehicles_db.get(vehicle_id)
+            if not vehicle:
+                errors.extend({'index': index, 'error': 'Vehicle not found'} for index, _ in rows)
+                continue
+            for _, change in rows:
+                vehicle.update(change)
+            patched[vehicle_id] = vehicle
+        vehicles_db.put_many(patched.values())
+    errors.sort(key=operator.itemgetter('index'))
+
+    return jsonify({
+        'message': f'{len(patched)} vehicles updated',
+        'updated': len(patched),
+        'errors': errors
+    })
+
 @app.route('/api/vehicles/<vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
     if vehicle_id not in vehicles_db:
         return jsonify({'error': 'Vehicle not found'}), 404
     del vehicles_db[vehicle_id]
+    invalidate_analysis_cache(vehicle_id)
     return jsonify({'message': 'Vehicle deleted'})
 
 @app.route('/api/vehicles/<vehicle_id>/analyze', methods=['POST'])
@@ -523,16 +3068,20 @@ def analyze_vehicle_endpoint(vehicle_id):
     if not vehicle:
         return jsonify({'error': 'Vehicle not found'}), 404
 
-    analysis = analyze_vehicle(vehicle)
-    report_id = str(uuid.uuid4())
-    reports_db[report_id] = {
+    analysis = analyze_vehicle(vehicle, curve_format=request.args.get('curve', 'records'))
+    report = build_report(str(uuid.uuid4()), vehicle, analysis)
+    reports_db[report['id']] = report
+    return jsonify({'message': 'Analysis complete', 'report': report})
+
+
+def build_report(report_id, vehicle, analysis):
+    return {
         'id': report_id,
-        'vehicle_id': vehicle_id,
+        'vehicle_id': vehicle['id'],
         'vehicle_title': f"{vehicle['year']} {vehicle['make']} {vehicle['model']} {vehicle.get('trim', '')}".strip(),
         'analysis': analysis,
         'created_at': datetime.utcnow().isoformat()
     }
-    return jsonify({'message': 'Analysis complete', 'report': reports_db[report_id]})
 
 
 # ============================================================
@@ -544,13 +3093,12 @@ def analyze_direct():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    required = ['year', 'make', 'model', 'acquisition_cost', 'list_price']
-    for field in required:
-        if field not in data or not data[field]:
-            return jsonify({'error': f'Missing required field: {field}'}), 400
+    missing = missing_required_field(data)
+    if missing:
+        return jsonify({'error': f'Missing required field: {missing}'}), 400
 
     vehicle = build_vehicle_record(None, data)
-    analysis = analyze_vehicle(vehicle)
+    analysis = analyze_vehicle(vehicle, curve_format=request.args.get('curve', 'records'))
 
     return jsonify({
         'message': 'Analysis complete',
@@ -568,11 +3116,34 @@ def analyze_direct():
 # ============================================================
 @app.route('/api/reports', methods=['GET'])
 def get_reports():
-    report_list = list(reports_db.values())
-    report_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return jsonify({'count': len(report_list), 'reports': report_list})
+    """
+    Lists reports newest first. Supports limit / after like /api/vehicles,
+    fields=summary,pricing,... to return only those analysis sections, and
+    vehicle_id, zone, action and exit filters.
+    """
+    filters = []
+    if request.args.get('vehicle_id'):
+        filters.append(('vehicle_id', '=', request.args['vehicle_id']))
+    if request.args.get('zone'):
+        if aging_zone_filters(request.args['zone']) is None:
+            return jsonify({'error': 'zone must be healthy, at_risk or danger'}), 400
+        filters.append(('aging_zone', '=', request.args['zone'].upper().replace('_', '-')))
+    if request.args.get('action'):
+        filters.append(('price_action', '=', request.args['action'].upper()))
+    if request.args.get('exit'):
+        filters.append(('optimal_exit', '=', request.args['exit'].upper()))
+
+    fields = parse_fields(request.args.get('fields'))
+    project = None
+    if fields:
+        def project(report):
+            projected = {k: v for k, v in report.items() if k != 'analysis'}
+            projected['analysis'] = {k: report['analysis'][k] for k in fields if k in report['analysis']}
+            return projected
+    return list_page(reports_db, 'reports', filters, project)
 
 @app.route('/api/reports/<report_id>', methods=['GET'])
+@versioned(reports_db.version)
 def get_report(report_id):
     report = reports_db.get(report_id)
     if not report:
@@ -580,25 +3151,84 @@ def get_report(report_id):
     return jsonify({'report': report})
 
 
+# ============================================================
+# LISTING: keyset pagination, sparse fieldsets, filters
+# ============================================================
+MAX_PAGE_SIZE = 1000
+
+
+def parse_fields(raw):
+    return [f.strip() for f in raw.split(',') if f.strip()] if raw else []
+
+
+def aging_zone_filters(zone):
+    """days_in_inventory filters for an aging zone, or None if unknown."""
+    zone = zone.lower().replace('-', '_')
+    if zone == 'healthy':
+        return [('days_in_inventory', '<=', 30)]
+    if zone == 'at_risk':
+        return [('days_in_inventory', '>', 30), ('days_in_inventory', '<=', 60)]
+    if zone == 'danger':
+        return [('days_in_inventory', '>', 60)]
+    return None
+
+
+def list_page(store, key, filters, project=None):
+    """
+    Shared body of the list endpoints. Without `limit` every matching record
+    is returned, as before; with it, one page plus the cursor for the next.
+    """
+    after = None
+    if request.args.get('after'):
+        created_at, sep, record_id = request.args['after'].partition(',')
+        if not sep:
+            return jsonify({'error': 'after must be <created_at>,<id>'}), 400
+        after = (created_at, record_id)
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # Fetch one extra row to know whether another page exists
+    records = store.scan(filters, after=after, limit=limit + 1 if limit else None)
+    next_cursor = None
+    if limit and len(records) > limit:
+        records = records[:limit]
+        last = records[-1]
+        next_cursor = f"{last.get('created_at') or ''},{last['id']}"
+
+    if project:
+        records = [project(r) for r in records]
+    return jsonify({'count': len(records), key: records, 'next_cursor': next_cursor})
+
+
 # ============================================================
 # DASHBOARD
 # ============================================================
+def dashboard_version():
+    """
+    The summary reads only vehicle totals. It never writes: aging is rolled
+    forward by the nightly job, whose writes advance this version.
+    """
+    return vehicles_db.collection_version()
+
+
 @app.route('/api/dashboard/summary', methods=['GET'])
+@versioned(dashboard_version)
 def dashboard_summary():
-    active = [v for v in vehicles_db.values() if v.get('status') == 'active']
-    total_invested = sum(v['acquisition_cost'] + v['recon_cost'] for v in active)
-    total_list = sum(v['list_price'] for v in active)
-    avg_days = sum(v['days_in_inventory'] for v in active) / len(active) if active else 0
-    daily_burn = sum(
-        (v['acquisition_cost'] + v['recon_cost']) * v['floorplan_rate'] / 100 / 365 for v in active
-    )
-    healthy = len([v for v in active if v['days_in_inventory'] <= 30])
-    at_risk = len([v for v in active if 30 < v['days_in_inventory'] <= 60])
-    danger = len([v for v in active if v['days_in_inventory'] > 60])
+    totals = vehicles_db.aggregates()
+    count = round(totals['total_vehicles'])
+    total_invested = totals['total_invested']
+    total_list = totals['total_list']
+    avg_days = totals['total_days'] / count if count else 0
+    daily_burn = totals['daily_burn']
+    healthy = round(totals['healthy'])
+    at_risk = round(totals['at_risk'])
+    danger = round(totals['danger'])
 
     return jsonify({
         'summary': {
-            'total_vehicles': len(active),
+            'total_vehicles': count,
             'total_invested': round(total_invested),
             'total_list_value': round(total_list),
             'total_potential_gross': round(total_list - total_invested),
@@ -610,53 +3240,336 @@ def dashboard_summary():
     })
 
 
+def roll_forward_aging(today=None):
+    """
+    Advances days_in_inventory and days_since_price_change on every active
+    vehicle by the whole days elapsed since the last roll-forward. Runs once
+    per calendar day however many workers call it; the first call only
+    starts the clock. Returns the number of days advanced.
+    """
+    today = today or datetime.utcnow().date()
+    clock = meta_db.get('aging_clock')
+    if clock and clock['as_of'] >= today.isoformat():
+        return 0
+
+    with storage_transaction():
+        clock = meta_db.get('aging_clock')
+        if clock and clock['as_of'] >= today.isoformat():
+            return 0
+        elapsed = (today - datetime.fromisoformat(clock['as_of']).date()).days if clock else 0
+        if elapsed:
+            rolled = []
+            for v in vehicles_db.scan([('status', '=', 'active')]):
+                v = dict(v)
+                v['days_in_inventory'] += elapsed
+                v['days_since_price_change'] += elapsed
+                rolled.append(v)
+            vehicles_db.put_many(rolled)
+        meta_db['aging_clock'] = {'id': 'aging_clock', 'as_of': today.isoformat()}
+
+    return elapsed
+
+
+# ============================================================
+# NIGHTLY RESCORE — roll aging forward and re-analyse the lot
+# ============================================================
+# Every worker starts a scheduler thread when it boots (gunicorn.conf.py);
+# a claim in meta_db makes sure only one of them runs each day's job, and
+# on-demand runs are queued to the same thread. Each active vehicle gets
+# one nightly report (id nightly-<vehicle id>) that is overwritten by the
+# next run; the run ends by sweeping the report curves those overwrites
+# left unused.
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+NIGHTLY_RUN_HOUR = int(os.environ.get('NIGHTLY_RUN_HOUR', 0))  # UTC
+SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', 60))
+# A claim older than this is assumed to belong to a dead worker
+NIGHTLY_STALE_SECONDS = 3600
+# A failed run is retried after 5, 10, 20, ... minutes, then left until tomorrow
+NIGHTLY_MAX_ATTEMPTS = 5
+NIGHTLY_RETRY_BASE_SECONDS = 300
+RESCORE_CHUNK_SIZE = 256
+_scheduler = {'thread': None, 'pid': None, 'jobs': None}
+_scheduler_lock = threading.Lock()
+
+
+@app.route('/api/jobs/nightly', methods=['GET'])
+def nightly_status():
+    """Last nightly run: status, timing and counts."""
+    return jsonify({
+        'enabled': SCHEDULER_ENABLED,
+        'run_hour_utc': NIGHTLY_RUN_HOUR,
+        'last_run': meta_db.get('nightly_run')
+    })
+
+
+@app.route('/api/jobs/nightly/run', methods=['POST'])
+def nightly_run_now():
+    """
+    Claims today's job and hands it to this worker's scheduler thread,
+    unless it already ran or is running. Poll GET /api/jobs/nightly for
+    the outcome.
+    """
+    run = claim_nightly_run(datetime.utcnow().date().isoformat(), force=request.args.get('force') == 'true')
+    if run is None:
+        return jsonify({'message': 'Nightly run already done or in progress', 'last_run': meta_db.get('nightly_run')}), 409
+    start_scheduler().put(run)
+    return jsonify({'message': 'Nightly run started', 'last_run': run}), 202
+
+
+def start_scheduler():
+    """
+    Starts this process's scheduler thread if it is not running yet and
+    returns its job queue. Called once per worker at start-up (see
+    gunicorn.conf.py); the thread only runs the daily job when
+    SCHEDULER_ENABLED, but always runs jobs handed to it.
+    """
+    with _scheduler_lock:
+        # Threads do not survive a fork; start one per worker process
+        if _scheduler['pid'] != os.getpid():
+            jobs = queue.Queue()
+            thread = threading.Thread(target=scheduler_loop, args=(jobs,), name='nightly-scheduler', daemon=True)
+            _scheduler.update(thread=thread, pid=os.getpid(), jobs=jobs)
+            thread.start()
+        return _scheduler['jobs']
+
+
+def scheduler_loop(jobs):
+    run = None
+    while True:
+        try:
+            if run is not None:
+                execute_nightly_run(run)
+            elif SCHEDULER_ENABLED and datetime.utcnow().hour >= NIGHTLY_RUN_HOUR:
+                run_nightly_rescore()
+        except Exception:
+            app.logger.exception('Nightly rescore failed')
+        try:
+            run = jobs.get(timeout=SCHEDULER_POLL_SECONDS)
+        except queue.Empty:
+            run = None
+
+
+def claim_nightly_run(today, force=False):
+    """
+    Marks today's run as started by this process; None if today's run is
+    done, another live run owns it, or a failed run is not due for a retry.
+    A stale run is re-claimed; each claim of the same day is one attempt.
+    """
+    with storage_transaction():
+        last = meta_db.get('nightly_run')
+        same_day = bool(last) and last['date'] == today
+        if same_day and not force:
+            if last['status'] == 'done':
+                return None
+            if last['status'] == 'running' and time.time() - last['started_ts'] < NIGHTLY_STALE_SECONDS:
+                return None
+            if last['status'] == 'failed':
+                retry_ts = last.get('retry_ts', 0)
+                if retry_ts is None or time.time() < retry_ts:
+                    return None
+        run = {
+            'id': 'nightly_run', 'date': today, 'status': 'running', 'pid': os.getpid(),
+            'started_at': datetime.utcnow().isoformat(), 'started_ts': time.time(),
+            'attempts': last.get('attempts', 1) + 1 if same_day and last['status'] != 'done' else 1
+        }
+        meta_db['nightly_run'] = run
+        return run
+
+
+def run_nightly_rescore(force=False):
+    """
+    Today's job: roll aging forward, then re-analyse every active vehicle
+    across the process pool and write its nightly report. Returns the run
+    record, or None if the run was already claimed.
+    """
+    run = claim_nightly_run(datetime.utcnow().date().isoformat(), force)
+    if run is None:
+        return None
+    return execute_nightly_run(run)
+
+
+def execute_nightly_run(run):
+    """Runs a claimed nightly job and stores its outcome in the run record."""
+    started = time.perf_counter()
+    try:
+        run['days_advanced'] = roll_forward_aging()
+        aged = time.perf_counter()
+        vehicles = vehicles_db.scan([('status', '=', 'active')])
+        reports = 0
+        for results in map_in_order(rescore_vehicle_chunk, chunked(vehicles, RESCORE_CHUNK_SIZE)):
+            reports_db.put_many(results)
+            reports += len(results)
+        rescored = time.perf_counter()
+        curves_swept = sweep_report_curves()
+        run.update(
+            status='done', vehicles=len(vehicles), reports=reports, curves_swept=curves_swept,
+            aging_seconds=round(aged - started, 3), rescore_seconds=round(rescored - aged, 3),
+            sweep_seconds=round(time.perf_counter() - rescored, 3)
+        )
+    except Exception as e:
+        run.update(status='failed', error=str(e), retry_ts=None, retry_at=None)
+        if run['attempts'] < NIGHTLY_MAX_ATTEMPTS:
+            delay = NIGHTLY_RETRY_BASE_SECONDS * 2 ** (run['attempts'] - 1)
+            run.update(retry_ts=time.time() + delay,
+                       retry_at=(datetime.utcnow() + timedelta(seconds=delay)).isoformat())
+        raise
+    finally:
+        run['finished_at'] = datetime.utcnow().isoformat()
+        run['duration_seconds'] = round(time.perf_counter() - started, 3)
+        meta_db['nightly_run'] = run
+    return run
+
+
+def rescore_vehicle_chunk(vehicles):
+    """Process-pool worker: nightly reports for a chunk of vehicles."""
+    return [build_report(f"nightly-{v['id']}", v, analyze_vehicle(v)) for v in vehicles]
+
+
+# ============================================================
+# HELPER: Build Vehicle Record
+# ============================================================
+REQUIRED_VEHICLE_FIELDS = ['year', 'make', 'model', 'acquisition_cost', 'list_price']
+
+
+def missing_required_field(data):
+    """Returns the first required field that is absent or empty, else None."""
+    for field in REQUIRED_VEHICLE_FIELDS:
+        if field not in data or not data[field]:
+            return field
+    return None
+
+
+def build_vehicle_record(vehicle_id, data):
+    record = {'id': vehicle_id or str(uuid.uuid4())}
+    for field, (coerce, default) in VEHICLE_FIELDS.items():
+        record[field] = coerce(data.get(field, default))
+    record['status'] = 'active'
+    record['created_at'] = datetime.utcnow().isoformat()
+    return record
+
+
+def patch_vehicle_record(vehicle, delta):
+    """
+    Copy of `vehicle` with the fields in `delta` coerced and applied.
+    Only the touched fields are validated; raises ValueError naming the
+    first bad one.
+    """
+    patched = dict(vehicle)
+    for field, value in delta.items():
+        if field == 'id' and str(value) == vehicle['id']:
+            continue
+        if field not in PATCHABLE_VEHICLE_FIELDS:
+            raise ValueError(f'Field cannot be patched: {field}')
+        coerce = PATCHABLE_VEHICLE_FIELDS[field][0]
+        try:
+            patched[field] = coerce(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {field}: {value!r}')
+        if field == 'status' and not patched[field]:
+            raise ValueError('Invalid value for status: empty')
+    return patched
+
+
 # ============================================================
-# HELPER: Build Vehicle Record
+# CORE ANALYSIS ENGINE (with Daily Probability Curve)
 # ============================================================
-def build_vehicle_record(vehicle_id, data):
-    return {
-        'id': vehicle_id or str(uuid.uuid4()),
-        'year': int(data.get('year', 0)),
-        'make': str(data.get('make', '')),
-        'model': str(data.get('model', '')),
-        'trim': str(data.get('trim', '')),
-        'mileage': int(data.get('mileage', 0)),
-        'ext_color': str(data.get('ext_color', '')),
-        'int_color': str(data.get('int_color', '')),
-        'vin': str(data.get('vin', '')),
-        'equipment': str(data.get('equipment', '')),
-        'acquisition_cost': float(data.get('acquisition_cost', 0)),
-        'recon_cost': float(data.get('recon_cost', 0)),
-        'list_price': float(data.get('list_price', 0)),
-        'floorplan_rate': float(data.get('floorplan_rate', 7.25)),
-        'wholesale_price': float(data.get('wholesale_price', 0)),
-        'min_gross': float(data.get('min_gross', 2000)),
-        'days_in_inventory': int(data.get('days_in_inventory', 0)),
-        'price_changes': int(data.get('price_changes', 0)),
-        'days_since_price_change': int(data.get('days_since_price_change', 0)),
-        'comp_low': float(data.get('comp_low', 0)),
-        'comp_high': float(data.get('comp_high', 0)),
-        'competing_units': int(data.get('competing_units', 0)),
-        'demand_signal': str(data.get('demand_signal', 'moderate')),
-        'seasonal_notes': str(data.get('seasonal_notes', '')),
-        'views_7': int(data.get('views_7', 0)),
-        'views_30': int(data.get('views_30', 0)),
-        'leads_7': int(data.get('leads_7', 0)),
-        'leads_30': int(data.get('leads_30', 0)),
-        'test_drives_7': int(data.get('test_drives_7', 0)),
-        'test_drives_30': int(data.get('test_drives_30', 0)),
-        'sales_notes': str(data.get('sales_notes', '')),
-        'status': 'active',
-        'created_at': datetime.utcnow().isoformat()
-    }
+def analyze_vehicle(d, curve_format='records'):
+    """
+    Runs every analysis section in order. For a stored vehicle (d has an id)
+    each section's output is cached per vehicle and reused while its input
+    fields and upstream results are unchanged, so re-analysing after an
+    engagement-only update recomputes just the engagement-dependent sections.
+    """
+    options = {'curve_format': curve_format}
+    vehicle_id = d.get('id')
+    with _analysis_cache_lock:
+        previous = analysis_section_cache.get(vehicle_id, {}) if vehicle_id else {}
+
+    results = {}
+    hits = misses = 0
+    get = d.get
+    for section in ANALYSIS_SECTIONS:
+        upstream = {name: options[name] for name in section.options}
+        for name in section.upstream:
+            upstream.update(results[name].values)
+        key = ([get(field, MISSING) for field in section.inputs], upstream)
+        cached = previous.get(section.name)
+        if cached is not None and not section.volatile and cached.key == key:
+            hits += 1
+            results[section.name] = cached
+        else:
+            misses += 1
+            results[section.name] = SectionResult(key, *section.compute(d, upstream))
+
+    with _analysis_cache_lock:
+        analysis_cache_stats['hits'] += hits
+        analysis_cache_stats['misses'] += misses
+        if vehicle_id:
+            analysis_section_cache[vehicle_id] = results
+            analysis_section_cache.move_to_end(vehicle_id)
+            while len(analysis_section_cache) > ANALYSIS_CACHE_SIZE:
+                analysis_section_cache.popitem(last=False)
+    return AnalysisResult(results)
 
 
 # ============================================================
-# CORE ANALYSIS ENGINE (with Daily Probability Curve)
+# ANALYSIS SECTIONS — dependency graph over the vehicle fields
 # ============================================================
-def analyze_vehicle(d):
-    analysis = {}
+# Each section declares the vehicle fields it reads, the analysis options it
+# honours and the sections whose intermediate values it needs, and returns
+# (output, values for downstream sections). Sections run in registration order, which is topological.
+# Cached outputs are shared between reports, so treat them as read-only.
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 2048))
+analysis_section_cache = OrderedDict()  # vehicle id -> {section: SectionResult}
+analysis_cache_stats = {'hits': 0, 'misses': 0}
+_analysis_cache_lock = threading.Lock()
+MISSING = object()
+
+
+class AnalysisSection:
+    __slots__ = ('name', 'inputs', 'options', 'upstream', 'compute', 'volatile')
 
+    def __init__(self, name, inputs, options, upstream, compute, volatile):
+        self.name = name
+        self.inputs = inputs
+        self.options = options
+        self.upstream = upstream
+        self.compute = compute
+        self.volatile = volatile
+
+
+class SectionResult:
+    """A section's cache key, output and downstream values, plus the output's JSON once encoded."""
+    __slots__ = ('key', 'output', 'values', 'encoded')
+
+    def __init__(self, key, output, values):
+        self.key = key
+        self.output = output
+        self.values = values
+        self.encoded = None
+
+
+ANALYSIS_SECTIONS = []
+
+
+def analysis_section(name, inputs, options=(), upstream=(), volatile=False):
+    """Registers a section; volatile sections (timestamps) always recompute."""
+    def register(compute):
+        ANALYSIS_SECTIONS.append(
+            AnalysisSection(name, tuple(inputs), tuple(options), tuple(upstream), compute, volatile)
+        )
+        return compute
+    return register
+
+
+def invalidate_analysis_cache(vehicle_id):
+    with _analysis_cache_lock:
+        analysis_section_cache.pop(vehicle_id, None)
+
+
+@analysis_section('financials', ['acquisition_cost', 'recon_cost', 'list_price', 'floorplan_rate',
+                                 'days_in_inventory', 'wholesale_price'])
+def financials_section(d, up):
     # --- CORE FINANCIALS ---
     total_invested = d['acquisition_cost'] + d['recon_cost']
     potential_gross = d['list_price'] - total_invested
@@ -665,15 +3578,21 @@ def analyze_vehicle(d):
     current_net_gross = potential_gross - floorplan_accrued
     wholesale_net_today = d['wholesale_price'] - total_invested - floorplan_accrued
 
-    analysis['financials'] = {
+    return {
         'total_invested': r2(total_invested),
         'potential_gross_at_sticker': r2(potential_gross),
         'daily_floorplan_cost': r2(daily_floorplan),
         'floorplan_accrued_to_date': r2(floorplan_accrued),
         'current_net_gross': r2(current_net_gross),
         'wholesale_net_today': r2(wholesale_net_today)
+    }, {
+        'total_invested': total_invested, 'potential_gross': potential_gross,
+        'daily_floorplan': daily_floorplan, 'wholesale_net_today': wholesale_net_today
     }
 
+
+@analysis_section('market_position', ['list_price', 'comp_low', 'comp_high', 'competing_units', 'demand_signal'])
+def market_position_section(d, up):
     # --- MARKET POSITION ---
     comp_range = d['comp_high'] - d['comp_low']
     market_position = ((d['list_price'] - d['comp_low']) / comp_range) if comp_range > 0 else 0.5
@@ -687,14 +3606,17 @@ def analyze_vehicle(d):
     else:
         mp_label = 'Value Position'
 
-    analysis['market_position'] = {
+    return {
         'percentile': round(market_position * 100),
         'label': mp_label,
         'comp_range': {'low': d['comp_low'], 'high': d['comp_high']},
         'competing_units': d['competing_units'],
         'demand_signal': d['demand_signal']
-    }
+    }, {'comp_range': comp_range, 'market_position': market_position}
+
 
+@analysis_section('engagement', ['views_7', 'views_30', 'leads_7', 'leads_30', 'test_drives_7', 'test_drives_30'])
+def engagement_section(d, up):
     # --- ENGAGEMENT ---
     avg_weekly_views = d['views_30'] / 4.3 if d['views_30'] > 0 else 0
     view_trend = ((d['views_7'] - avg_weekly_views) / avg_weekly_views * 100) if avg_weekly_views > 0 else 0
@@ -703,7 +3625,7 @@ def analyze_vehicle(d):
     td_to_lead = (d['test_drives_30'] / d['leads_30'] * 100) if d['leads_30'] > 0 else 0
     engagement_score = (d['leads_7'] * 3) + (d['test_drives_7'] * 10) + (d['views_7'] * 0.2)
 
-    analysis['engagement'] = {
+    return {
         'views_7': d['views_7'], 'views_30': d['views_30'],
         'leads_7': d['leads_7'], 'leads_30': d['leads_30'],
         'test_drives_7': d['test_drives_7'], 'test_drives_30': d['test_drives_30'],
@@ -712,7 +3634,13 @@ def analyze_vehicle(d):
         'lead_to_view_rate': r2(lead_to_view),
         'test_drive_to_lead_rate': r2(td_to_lead),
         'engagement_score': r2(engagement_score)
-    }
+    }, {'view_trend': view_trend, 'engagement_score': engagement_score}
+
+
+@analysis_section('sale_probability', ['demand_signal', 'competing_units', 'days_in_inventory'],
+                  options=['curve_format'], upstream=['market_position', 'engagement'])
+def sale_probability_section(d, up):
+    market_position, engagement_score, view_trend = up['market_position'], up['engagement_score'], up['view_trend']
 
     # --- PROBABILITY MODEL FACTORS ---
     demand_mult = 1.2 if d['demand_signal'] == 'high' else (0.75 if d['demand_signal'] == 'soft' else 1.0)
@@ -730,7 +3658,8 @@ def analyze_vehicle(d):
     prob90 = clamp(0.72 * composite * 1.15, 0.20, 0.98)
 
     # --- FEATURE 3: DAILY PROBABILITY CURVE ---
-    daily_curve = generate_daily_probability_curve(prob30, prob60, prob90, di, composite)
+    curve_day, curve_daily, curve_cumulative = probability_curve_arrays(prob30, prob60, prob90, di, composite)
+    daily_curve = format_probability_curve(curve_day, curve_daily, curve_cumulative, up['curve_format'])
 
     # Factors
     factors_30 = []
@@ -762,15 +3691,7 @@ def analyze_vehicle(d):
 
     # Curve insights
     # Find acceleration and decay points
-    accel_end_day = 0
-    decay_start_day = 0
-    prev_daily = 0
-    for point in daily_curve:
-        if point['daily_probability'] >= prev_daily:
-            accel_end_day = point['day']
-        elif decay_start_day == 0 and point['daily_probability'] < prev_daily:
-            decay_start_day = point['day']
-        prev_daily = point['daily_probability']
+    accel_end_day, decay_start_day = curve_turning_points(curve_day, curve_daily)
 
     curve_insights = {
         'acceleration_phase': f'Days 1–{accel_end_day}: Probability builds as listing gains exposure.',
@@ -780,7 +3701,7 @@ def analyze_vehicle(d):
         'critical_insight': f'The window between day {accel_end_day} and day {decay_start_day + 15} is when this vehicle is most likely to sell. Marketing and pricing actions have maximum impact during this window.'
     }
 
-    analysis['sale_probability'] = {
+    return {
         'prob_30_day': round(prob30 * 100),
         'prob_60_day': round(prob60 * 100),
         'prob_90_day': round(prob90 * 100),
@@ -789,9 +3710,14 @@ def analyze_vehicle(d):
         'factors_90': factors_90,
         'daily_curve': daily_curve,
         'curve_insights': curve_insights
-    }
+    }, {'prob30': prob30, 'prob60': prob60}
 
+
+@analysis_section('aging', ['days_in_inventory', 'wholesale_price'], upstream=['financials', 'sale_probability'])
+def aging_section(d, up):
     # --- AGING & EROSION ---
+    di = d['days_in_inventory']
+    daily_floorplan, potential_gross = up['daily_floorplan'], up['potential_gross']
     if di <= 30:
         aging_zone = 'HEALTHY'
         aging_detail = 'Within target velocity window.'
@@ -816,21 +3742,14 @@ def analyze_vehicle(d):
             'realistic_gross_high': r2(gross_sticker - 500)
         })
 
-    irrational_day = di
-    for day in range(di, di + 150):
-        fp = daily_floorplan * day
-        retail_net = (potential_gross - fp) - 750
-        day_prob = clamp(prob30 * (0.98 ** (day - di)), 0.05, 0.95)
-        pw_retail = retail_net * day_prob
-        ws_at_day = d['wholesale_price'] - total_invested - fp
-        if pw_retail < max(ws_at_day, wholesale_net_today) or retail_net < 0:
-            irrational_day = day
-            break
-        irrational_day = day
+    irrational_day = solve_irrational_day(
+        di, daily_floorplan, potential_gross, up['prob30'],
+        d['wholesale_price'], up['total_invested'], up['wholesale_net_today']
+    )
 
     days_until_irrational = max(0, irrational_day - di)
 
-    analysis['aging'] = {
+    return {
         'zone': aging_zone, 'zone_detail': aging_detail,
         'days_in_inventory': di,
         'erosion_table': erosion_table,
@@ -839,9 +3758,16 @@ def analyze_vehicle(d):
             'days_remaining': days_until_irrational,
             'explanation': f'Beyond day {irrational_day}, holding becomes economically irrational. ~{days_until_irrational} days remain.'
         }
-    }
+    }, {'aging_zone': aging_zone, 'days_until_irrational': days_until_irrational}
+
 
+@analysis_section('pricing', ['list_price', 'comp_low', 'days_in_inventory', 'competing_units'],
+                  upstream=['financials', 'market_position', 'engagement'])
+def pricing_section(d, up):
     # --- PRICING ---
+    di, cu = d['days_in_inventory'], d['competing_units']
+    comp_range, market_position = up['comp_range'], up['market_position']
+    potential_gross, total_invested = up['potential_gross'], up['total_invested']
     optimal_pos = 0.45
     optimal_price = (d['comp_low'] + (comp_range * optimal_pos)) if comp_range > 0 else d['list_price']
     price_diff = d['list_price'] - optimal_price
@@ -852,7 +3778,7 @@ def analyze_vehicle(d):
         change_amount = max(300, min(raw_cut, round(potential_gross * 0.35 / 100) * 100))
         new_price = d['list_price'] - change_amount
         reasoning = f"At {round(market_position*100)}th percentile with {di} days aging. ${change_amount:,} reduction to ${new_price:,.0f} repositions to mid-market with negotiation room."
-    elif market_position < 0.25 and di < 20 and engagement_score > 20:
+    elif market_position < 0.25 and di < 20 and up['engagement_score'] > 20:
         price_action = 'INCREASE'
         raw_raise = round(abs(price_diff) * 0.5 / 100) * 100
         change_amount = min(raw_raise, 800)
@@ -898,7 +3824,7 @@ def analyze_vehicle(d):
         prob_boost = 0
         gross_impact = 0
 
-    analysis['pricing'] = {
+    return {
         'action': price_action,
         'change_amount': change_amount,
         'current_list_price': d['list_price'],
@@ -913,10 +3839,19 @@ def analyze_vehicle(d):
             'estimated_gross_impact': gross_impact,
             'explanation': f"Price {'reduction' if price_action == 'REDUCE' else 'increase' if price_action == 'INCREASE' else 'hold'} expected to {'increase' if prob_boost > 0 else 'decrease' if prob_boost < 0 else 'maintain'} 30-day sell probability by ~{abs(prob_boost)} percentage points."
         }
+    }, {
+        'price_action': price_action, 'change_amount': change_amount, 'new_price': new_price,
+        'exp_gross_low': exp_gross_low, 'exp_gross_high': exp_gross_high, 'prob_boost': prob_boost
     }
 
+
+@analysis_section('exit_path', ['days_in_inventory', 'min_gross'], upstream=['financials', 'sale_probability', 'pricing'])
+def exit_path_section(d, up):
     # --- EXIT PATH ---
-    retail_exp_gross = ((exp_gross_low + exp_gross_high) / 2) - (daily_floorplan * 20)
+    prob30, prob60 = up['prob30'], up['prob60']
+    exp_gross_low, exp_gross_high = up['exp_gross_low'], up['exp_gross_high']
+    wholesale_net_today = up['wholesale_net_today']
+    retail_exp_gross = ((exp_gross_low + exp_gross_high) / 2) - (up['daily_floorplan'] * 20)
     retail_prob_weighted = retail_exp_gross * prob30
 
     if retail_prob_weighted > wholesale_net_today and exp_gross_low > d['min_gross'] * 0.5:
@@ -929,16 +3864,16 @@ def analyze_vehicle(d):
         optimal_exit = 'RETAIL'
         exit_reasoning = 'Wholesale produces significant loss. Aggressive retail pricing required immediately.'
 
-    reassess_day = di + 14
+    reassess_day = d['days_in_inventory'] + 14
 
-    analysis['exit_path'] = {
+    return {
         'optimal': optimal_exit,
         'reasoning': exit_reasoning,
         'paths': [
             {
                 'path': 'RETAIL', 'recommended': optimal_exit == 'RETAIL',
                 'expected_gross_low': r2(exp_gross_low), 'expected_gross_high': r2(exp_gross_high),
-                'expected_days': '12-25 days' if price_action != 'HOLD' else '20-40 days',
+                'expected_days': '12-25 days' if up['price_action'] != 'HOLD' else '20-40 days',
                 'probability': f'{round(prob30*100)}%-{round(prob60*100)}%'
             },
             {
@@ -956,16 +3891,22 @@ def analyze_vehicle(d):
             'reassess_at_day': reassess_day,
             'condition': f'If <2 test drives by day {reassess_day}, wholesale immediately.'
         }
-    }
+    }, {'optimal_exit': optimal_exit, 'reassess_day': reassess_day}
 
+
+@analysis_section('action_plan', ['list_price', 'equipment', 'leads_7', 'leads_30', 'min_gross'],
+                  upstream=['financials', 'pricing', 'exit_path'])
+def action_plan_section(d, up):
     # --- ACTION PLAN ---
+    price_action, change_amount, new_price = up['price_action'], up['change_amount'], up['new_price']
+    daily_floorplan, reassess_day = up['daily_floorplan'], up['reassess_day']
     actions = []
 
     if price_action == 'REDUCE':
         actions.append({
             'priority': 1, 'title': f'Execute ${change_amount:,} price reduction',
             'timing': 'TODAY',
-            'detail': f'Reduce from ${d["list_price"]:,.0f} to ${new_price:,.0f}. Estimated +{prob_boost}% sell probability. Daily hold cost: ${daily_floorplan:.2f}.',
+            'detail': f'Reduce from ${d["list_price"]:,.0f} to ${new_price:,.0f}. Estimated +{up["prob_boost"]}% sell probability. Daily hold cost: ${daily_floorplan:.2f}.',
             'purpose': 'Reposition competitively and trigger platform re-indexing.'
         })
     elif price_action == 'INCREASE':
@@ -1001,20 +3942,26 @@ def analyze_vehicle(d):
     actions.append({
         'priority': 4, 'title': 'Brief sales team',
         'timing': 'TOMORROW AM',
-        'detail': f'Sticker: ${new_price:,.0f}. Floor: ${max(new_price - 500, total_invested + d["min_gross"]):,.0f}. No leading with concessions.',
+        'detail': f'Sticker: ${new_price:,.0f}. Floor: ${max(new_price - 500, up["total_invested"] + d["min_gross"]):,.0f}. No leading with concessions.',
         'purpose': 'Protect gross. Prevent demoralized selling.'
     })
 
     actions.append({
         'priority': 5, 'title': f'Hard wholesale date: Day {reassess_day}',
         'timing': 'CALENDAR NOW',
-        'detail': f'<2 test drives by day {reassess_day} = wholesale. No extensions. WS net: ${wholesale_net_today:,.0f}.',
+        'detail': f'<2 test drives by day {reassess_day} = wholesale. No extensions. WS net: ${up["wholesale_net_today"]:,.0f}.',
         'purpose': 'Remove emotional attachment to sunk costs.'
     })
 
-    analysis['action_plan'] = actions
+    return actions, {}
+
 
+@analysis_section('risk_and_confidence', ['seasonal_notes', 'sales_notes', 'equipment', 'days_in_inventory',
+                                          'competing_units', 'views_30', 'leads_30', 'comp_low', 'wholesale_price'],
+                  upstream=['engagement'])
+def risk_and_confidence_section(d, up):
     # --- RISK & CONFIDENCE ---
+    di, cu, view_trend = d['days_in_inventory'], d['competing_units'], up['view_trend']
     risks = []
 
     sn = d.get('seasonal_notes', '') or ''
@@ -1048,34 +3995,39 @@ def analyze_vehicle(d):
         confidence = 'LOW'
         conf_pct = 20 + round(completeness * 30)
 
-    analysis['risk_and_confidence'] = {
+    return {
         'risks': risks,
         'confidence': {'level': confidence, 'percent': conf_pct, 'data_completeness': round(completeness * 100)}
-    }
+    }, {'confidence': confidence}
 
+
+@analysis_section('summary', ['year', 'make', 'model', 'trim', 'mileage', 'ext_color', 'int_color', 'list_price'],
+                  upstream=['financials', 'aging', 'pricing', 'exit_path', 'risk_and_confidence'], volatile=True)
+def summary_section(d, up):
     # --- SUMMARY ---
-    analysis['summary'] = {
+    return {
         'vehicle': f"{d['year']} {d['make']} {d['model']} {d.get('trim', '')}".strip(),
         'mileage': d['mileage'],
         'color': f"{d['ext_color']} / {d['int_color']}",
-        'total_invested': r2(total_invested),
+        'total_invested': r2(up['total_invested']),
         'current_list': d['list_price'],
-        'recommended_price': new_price,
-        'price_action': price_action,
-        'aging_zone': aging_zone,
-        'optimal_exit': optimal_exit,
-        'days_to_decision': days_until_irrational,
-        'confidence': confidence,
+        'recommended_price': up['new_price'],
+        'price_action': up['price_action'],
+        'aging_zone': up['aging_zone'],
+        'optimal_exit': up['optimal_exit'],
+        'days_to_decision': up['days_until_irrational'],
+        'confidence': up['confidence'],
         'generated_at': datetime.utcnow().isoformat()
-    }
-
-    return analysis
+    }, {}
 
 
 # ============================================================
 # FEATURE 3: DAILY PROBABILITY CURVE GENERATOR
 # ============================================================
-def generate_daily_probability_curve(prob30, prob60, prob90, current_day, composite_factor):
+CURVE_DAYS = np.arange(1, 91)
+
+
+def generate_daily_probability_curve(prob30, prob60, prob90, current_day, composite_factor, curve_format='records'):
     """
     Generates a day-by-day probability curve from Day 1 through Day 90.
     
@@ -1088,11 +4040,34 @@ def generate_daily_probability_curve(prob30, prob60, prob90, current_day, compos
     Each day returns:
     - daily_probability: chance of selling ON that specific day
     - cumulative_probability: chance of having sold BY that day
-    - remaining_gross: expected gross if sold on that day
+
+    curve_format='arrays' returns parallel `day` / `daily_probability` /
+    `cumulative_probability` lists instead of one dict per day.
+    """
+    day, daily, cumulative = probability_curve_arrays(prob30, prob60, prob90, current_day, composite_factor)
+    return format_probability_curve(day, daily, cumulative, curve_format)
+
+
+def format_probability_curve(day, daily, cumulative, curve_format='records'):
+    if curve_format == 'arrays':
+        return {
+            'day': day.tolist(),
+            'daily_probability': daily.tolist(),
+            'cumulative_probability': cumulative.tolist(),
+        }
+    return [
+        {'day': d, 'daily_probability': p, 'cumulative_probability': c}
+        for d, p, c in zip(day.tolist(), daily.tolist(), cumulative.tolist())
+    ]
+
+
+def probability_curve_shape(current_day, composite_factor):
     """
-    curve = []
-    cumulative = 0
+    Unscaled curve for one (composite, current_day) pair.
 
+    Returns the rounded conditional daily probabilities (percent) and the
+    rounded cumulative percent at days 30, 60 and 90 used for rescaling.
+    """
     # Model parameters based on composite factor
     # Higher composite = faster ramp, higher peak, slower decay
     ramp_speed = 0.15 * min(composite_factor, 1.5)
@@ -1100,68 +4075,1068 @@ def generate_daily_probability_curve(prob30, prob60, prob90, current_day, compos
     peak_height = min(0.045, 0.025 * composite_factor)
     decay_rate = 0.02 + (0.01 * (1 / max(composite_factor, 0.3)))
 
-    for day in range(1, 91):
-        # Ramp phase (logistic growth)
-        if day <= peak_day:
-            ramp = 1 / (1 + math.exp(-ramp_speed * (day - peak_day * 0.6)))
-            daily_prob = peak_height * ramp
-        # Decay phase
-        else:
-            days_past_peak = day - peak_day
-            daily_prob = peak_height * math.exp(-decay_rate * days_past_peak)
-
-        # Adjust for already-elapsed days
-        if day <= current_day:
-            # Days already passed — can't sell in the past
-            daily_prob = 0
-
-        # Ensure daily prob is reasonable
-        daily_prob = max(0, min(0.06, daily_prob))
-
-        # Accumulate
-        # Probability of selling on this day = daily_prob * (1 - cumulative)
-        # (Can only sell if not already sold)
-        conditional_daily = daily_prob * (1 - cumulative)
-        cumulative = min(0.98, cumulative + conditional_daily)
-
-        curve.append({
-            'day': day,
-            'daily_probability': round(conditional_daily * 100, 2),
-            'cumulative_probability': round(cumulative * 100, 1),
-        })
+    day = CURVE_DAYS
+    ramp = 1 / (1 + np.exp(-ramp_speed * (day - peak_day * 0.6)))
+    decay = np.exp(-decay_rate * (day - peak_day))
+    daily_prob = np.where(day <= peak_day, peak_height * ramp, peak_height * decay)
 
-    # Normalize to match our milestone probabilities
-    # Find actual cumulative at days 30, 60, 90
-    cum_30 = next((p['cumulative_probability'] for p in curve if p['day'] == 30), 0)
-    cum_60 = next((p['cumulative_probability'] for p in curve if p['day'] == 60), 0)
-    cum_90 = next((p['cumulative_probability'] for p in curve if p['day'] == 90), 0)
+    # Days already passed — can't sell in the past
+    daily_prob[day <= current_day] = 0
+    daily_prob = np.clip(daily_prob, 0, 0.06)
+
+    # Probability of selling on a day = daily_prob * (1 - cumulative before it).
+    # Unclamped, 1 - cumulative is the running product of (1 - daily_prob).
+    survival = np.cumprod(1 - daily_prob)
+    cumulative = np.minimum(0.98, 1 - survival)
+    prior = np.concatenate(([0.0], cumulative[:-1]))
+    conditional_daily = daily_prob * (1 - prior)
+
+    cumulative_pct = round_like_python(cumulative * 100, 1)
+    return round_like_python(conditional_daily * 100, 2), cumulative_pct[[29, 59, 89]]
+
+
+# The unscaled shape depends only on (composite, current_day). Composites are
+# products of a handful of discrete multipliers, so a lot shares a few hundred.
+CURVE_CACHE_SIZE = int(os.environ.get('CURVE_CACHE_SIZE', 4096))
 
-    # Scale curve to match our probability model
-    target_30 = prob30 * 100
-    target_60 = prob60 * 100
-    target_90 = prob90 * 100
 
+@functools.lru_cache(maxsize=CURVE_CACHE_SIZE)
+def cached_curve_shape(composite_factor, day_bucket):
+    daily_pct, milestones = probability_curve_shape(day_bucket, composite_factor)
+    daily_pct.flags.writeable = False
+    return daily_pct, tuple(milestones.tolist())
+
+
+def probability_curve_arrays(prob30, prob60, prob90, current_day, composite_factor):
+    """Scaled curve as (day, daily_probability, cumulative_probability) arrays."""
+    # Any current_day past 90 zeroes the whole curve and any day <= 0 zeroes
+    # nothing, so clamping into 0..90 keeps the cache key space small.
+    day_bucket = min(max(current_day, 0), 90)
+    daily_pct, (cum_30, cum_60, cum_90) = cached_curve_shape(composite_factor, day_bucket)
+
+    # Scale curve to match our probability model
     if cum_90 > 0:
-        scale = target_90 / cum_90
+        scale = prob90 * 100 / cum_90
     elif cum_60 > 0:
-        scale = target_60 / cum_60
+        scale = prob60 * 100 / cum_60
     elif cum_30 > 0:
-        scale = target_30 / cum_30
+        scale = prob30 * 100 / cum_30
     else:
         scale = 1
 
-    # Apply scaling
-    scaled_cum = 0
-    for point in curve:
-        original_daily = point['daily_probability'] / 100
-        scaled_daily = original_daily * scale
-        scaled_daily = max(0, min(0.08, scaled_daily))
-        scaled_cum = min(0.98, scaled_cum + scaled_daily)
+    scaled_daily = np.clip(daily_pct / 100 * scale, 0, 0.08)
+    # Running sum is monotone, so clamping after the accumulate matches clamping each step
+    scaled_cum = np.minimum(0.98, np.add.accumulate(scaled_daily))
+
+    return CURVE_DAYS, round_like_python(scaled_daily * 100, 2), round_like_python(scaled_cum * 100, 1)
+
+
+def curve_turning_points(day, daily):
+    """
+    Last day the daily probability is still non-decreasing (peak) and the
+    first day it drops, each 0 when absent.
+    """
+    prev = np.concatenate(([0.0], daily[:-1]))
+    rising = daily >= prev
+    accel_end_day = int(day[rising][-1]) if rising.any() else 0
+    decay_start_day = int(day[~rising][0]) if not rising.all() else 0
+    return accel_end_day, decay_start_day
+
+
+# ============================================================
+# BATCH ANALYSIS ENGINE — whole-lot runs on columnar arrays
+# ============================================================
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch_endpoint():
+    """
+    Analyzes many vehicles in one call.
+
+    Body (all optional):
+    - vehicle_ids: stored vehicles to analyze
+    - vehicles: raw vehicle payloads, same shape as /api/analyze
+    With neither, every active vehicle on the lot is analyzed.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        vehicles, errors = resolve_batch_vehicles(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    results = analyze_batch(vehicles)
+
+    return jsonify({
+        'message': 'Batch analysis complete',
+        'count': len(results),
+        'results': results,
+        'errors': errors
+    })
+
+
+def resolve_batch_vehicles(data):
+    """
+    Turns a batch request body into vehicle records plus per-item errors.
+    Shared by every endpoint that accepts `vehicle_ids` / `vehicles`.
+    Raises ValueError when the body itself is the wrong shape.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Body must be a JSON object')
+    vehicles = []
+    errors = []
+
+    if data.get('vehicles') is not None:
+        if not isinstance(data['vehicles'], list):
+            raise ValueError('vehicles must be a list')
+        for i, payload in enumerate(data['vehicles']):
+            if not isinstance(payload, dict):
+                errors.append({'index': i, 'error': 'Vehicle must be an object'})
+                continue
+            missing = missing_required_field(payload)
+            if missing:
+                errors.append({'index': i, 'error': f'Missing required field: {missing}'})
+                continue
+            try:
+                vehicles.append(build_vehicle_record(payload.get('id'), payload))
+            except (TypeError, ValueError) as e:
+                errors.append({'index': i, 'error': f'Invalid vehicle: {e}'})
+    elif data.get('vehicle_ids') is not None:
+        if not isinstance(data['vehicle_ids'], list):
+            raise ValueError('vehicle_ids must be a list')
+        for i, vehicle_id in enumerate(data['vehicle_ids']):
+            if not isinstance(vehicle_id, str):
+                errors.append({'index': i, 'error': 'vehicle_id must be a string'})
+                continue
+            vehicle = vehicles_db.get(vehicle_id)
+            if not vehicle:
+                errors.append({'vehicle_id': vehicle_id, 'error': 'Vehicle not found'})
+                continue
+            vehicles.append(vehicle)
+    else:
+        vehicles = vehicles_db.scan([('status', '=', 'active')])
+
+    return vehicles, errors
+
+
+# Inputs the vectorized engine reads, with the dtype each column is held in.
+BATCH_COLUMNS = {
+    'acquisition_cost': np.float64, 'recon_cost': np.float64,
+    'list_price': np.float64, 'floorplan_rate': np.float64,
+    'wholesale_price': np.float64, 'min_gross': np.float64,
+    'comp_low': np.float64, 'comp_high': np.float64,
+    'days_in_inventory': np.int64, 'competing_units': np.int64,
+    'views_7': np.int64, 'views_30': np.int64,
+    'leads_7': np.int64, 'leads_30': np.int64,
+    'test_drives_7': np.int64, 'test_drives_30': np.int64,
+}
+
+EROSION_DAYS = np.array([0, 30, 60, 90])
+
+
+def vehicle_columns(vehicles):
+    """Converts a list of vehicle records into a dict of column arrays."""
+    n = len(vehicles)
+    cols = {
+        field: np.fromiter((v[field] for v in vehicles), dtype=dtype, count=n)
+        for field, dtype in BATCH_COLUMNS.items()
+    }
+    cols['demand_signal'] = np.array([v['demand_signal'] for v in vehicles], dtype=str)
+    return cols
+
+
+def _safe_div(num, den):
+    """num / den where den > 0, else 0 — mirrors the scalar `if x > 0 else 0` guards."""
+    num = np.asarray(num, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+def _r2(values):
+    """Vectorized `r2` — np.rint rounds half-to-even exactly like round()."""
+    return np.rint(values * 100) / 100
+
+
+def batch_analysis_core(c):
+    """
+    Vectorized core of `analyze_vehicle` over column arrays.
+
+    Every expression keeps the scalar path's operand order so float results
+    are bit-identical. Returns a dict of arrays, one entry per vehicle.
+    """
+    total_invested = c['acquisition_cost'] + c['recon_cost']
+    potential_gross = c['list_price'] - total_invested
+    daily_floorplan = (total_invested * (c['floorplan_rate'] / 100)) / 365
+    floorplan_accrued = daily_floorplan * c['days_in_inventory']
+    current_net_gross = potential_gross - floorplan_accrued
+    wholesale_net_today = c['wholesale_price'] - total_invested - floorplan_accrued
+
+    comp_range = c['comp_high'] - c['comp_low']
+    market_position = np.where(comp_range > 0, _safe_div(c['list_price'] - c['comp_low'], comp_range), 0.5)
+
+    views_30 = c['views_30']
+    avg_weekly_views = np.where(views_30 > 0, views_30 / 4.3, 0.0)
+    view_trend = _safe_div(c['views_7'] - avg_weekly_views, avg_weekly_views) * 100
+    lead_to_view = _safe_div(c['leads_30'], views_30) * 100
+    td_to_lead = _safe_div(c['test_drives_30'], c['leads_30']) * 100
+    engagement_score = (c['leads_7'] * 3) + (c['test_drives_7'] * 10) + (c['views_7'] * 0.2)
+
+    ds = c['demand_signal']
+    demand_mult = np.select([ds == 'high', ds == 'soft'], [1.2, 0.75], 1.0)
+    cu = c['competing_units']
+    comp_factor = np.select([cu <= 5, cu <= 10, cu <= 20], [1.3, 1.1, 0.9], 0.7)
+    di = c['days_in_inventory']
+    aging_factor = np.select([di <= 20, di <= 40, di <= 60, di <= 90], [1.2, 1.0, 0.85, 0.65], 0.45)
+    es = engagement_score
+    eng_factor = np.select([es > 25, es > 12, es > 5], [1.2, 1.0, 0.8], 0.6)
+    mp = market_position
+    price_factor = np.select([mp > 0.8, mp > 0.6, mp > 0.4, mp > 0.2], [0.7, 0.85, 1.0, 1.15], 1.25)
+
+    composite = demand_mult * comp_factor * aging_factor * eng_factor * price_factor
+
+    return {
+        'total_invested': total_invested,
+        'potential_gross': potential_gross,
+        'daily_floorplan': daily_floorplan,
+        'floorplan_accrued': floorplan_accrued,
+        'current_net_gross': current_net_gross,
+        'wholesale_net_today': wholesale_net_today,
+        'comp_range': comp_range,
+        'market_position': market_position,
+        'avg_weekly_views': avg_weekly_views,
+        'view_trend': view_trend,
+        'lead_to_view': lead_to_view,
+        'td_to_lead': td_to_lead,
+        'engagement_score': engagement_score,
+        'demand_mult': demand_mult,
+        'comp_factor': comp_factor,
+        'aging_factor': aging_factor,
+        'eng_factor': eng_factor,
+        'price_factor': price_factor,
+        'composite': composite,
+        'prob30': np.clip(0.35 * composite, 0.05, 0.95),
+        'prob60': np.clip(0.55 * composite * 1.1, 0.10, 0.97),
+        'prob90': np.clip(0.72 * composite * 1.15, 0.20, 0.98),
+    }
+
+
+def batch_erosion_tables(core, days_in_inventory):
+    """Erosion tables for every vehicle as (N, 4) arrays."""
+    total_days = days_in_inventory[:, None] + EROSION_DAYS
+    fp_total = core['daily_floorplan'][:, None] * total_days
+    gross_sticker = core['potential_gross'][:, None] - fp_total
+    return {
+        'total_days': total_days,
+        'floorplan_accrued': _r2(fp_total),
+        'gross_at_sticker': _r2(gross_sticker),
+        'realistic_gross_low': _r2(gross_sticker - 1000),
+        'realistic_gross_high': _r2(gross_sticker - 500),
+    }
+
+
+def analyze_batch(vehicles):
+    """
+    Runs the financial, market, engagement, probability, erosion and
+    threshold sections of `analyze_vehicle` for every vehicle at once.
+    Section contents match the per-vehicle path exactly.
+    """
+    if not vehicles:
+        return []
+
+    c = vehicle_columns(vehicles)
+    core = batch_analysis_core(c)
+    erosion = batch_erosion_tables(core, c['days_in_inventory'])
+    irrational_days = batch_irrational_days(c, core).tolist()
+
+    mp = core['market_position']
+    mp_label = np.select(
+        [mp > 0.75, mp > 0.5, mp > 0.25],
+        ['Top Quartile — Overpriced Risk', 'Above Mid-Market', 'Mid-Market'],
+        'Value Position'
+    )
+    vt = core['view_trend']
+    vt_label = np.select([vt > 10, vt > -10], ['Accelerating', 'Stable'], 'Declining')
+    di = c['days_in_inventory']
+    zone = np.select([di <= 30, di <= 60], ['HEALTHY', 'AT-RISK'], 'DANGER')
+
+    # Convert once to Python scalars so the JSON encoder never sees NumPy types
+    cols = {k: v.tolist() for k, v in c.items()}
+    out = {k: v.tolist() for k, v in {
+        'total_invested': _r2(core['total_invested']),
+        'potential_gross': _r2(core['potential_gross']),
+        'daily_floorplan': _r2(core['daily_floorplan']),
+        'floorplan_accrued': _r2(core['floorplan_accrued']),
+        'current_net_gross': _r2(core['current_net_gross']),
+        'wholesale_net_today': _r2(core['wholesale_net_today']),
+        'percentile': np.rint(mp * 100).astype(np.int64),
+        'view_trend': np.rint(vt).astype(np.int64),
+        'lead_to_view': _r2(core['lead_to_view']),
+        'td_to_lead': _r2(core['td_to_lead']),
+        'engagement_score': _r2(core['engagement_score']),
+        'demand_mult': core['demand_mult'], 'comp_factor': core['comp_factor'],
+        'aging_factor': core['aging_factor'], 'eng_factor': core['eng_factor'],
+        'price_factor': core['price_factor'], 'composite': core['composite'],
+        'prob30': np.rint(core['prob30'] * 100).astype(np.int64),
+        'prob60': np.rint(core['prob60'] * 100).astype(np.int64),
+        'prob90': np.rint(core['prob90'] * 100).astype(np.int64),
+        'mp_label': mp_label, 'vt_label': vt_label, 'zone': zone,
+    }.items()}
+    ero = {k: v.tolist() for k, v in erosion.items()}
+    zone_detail = {
+        'HEALTHY': 'Within target velocity window.',
+        'AT-RISK': 'Approaching danger zone. Active intervention required.',
+        'DANGER': 'Past target velocity. Immediate action needed.',
+    }
+
+    results = []
+    for i, v in enumerate(vehicles):
+        irrational_day = irrational_days[i]
+        days_until_irrational = max(0, irrational_day - cols['days_in_inventory'][i])
+        results.append({
+            'vehicle_id': v.get('id'),
+            'vehicle_title': f"{v['year']} {v['make']} {v['model']} {v.get('trim', '')}".strip(),
+            'financials': {
+                'total_invested': out['total_invested'][i],
+                'potential_gross_at_sticker': out['potential_gross'][i],
+                'daily_floorplan_cost': out['daily_floorplan'][i],
+                'floorplan_accrued_to_date': out['floorplan_accrued'][i],
+                'current_net_gross': out['current_net_gross'][i],
+                'wholesale_net_today': out['wholesale_net_today'][i]
+            },
+            'market_position': {
+                'percentile': out['percentile'][i],
+                'label': out['mp_label'][i],
+                'comp_range': {'low': v['comp_low'], 'high': v['comp_high']},
+                'competing_units': v['competing_units'],
+                'demand_signal': v['demand_signal']
+            },
+            'engagement': {
+                'views_7': cols['views_7'][i], 'views_30': cols['views_30'][i],
+                'leads_7': cols['leads_7'][i], 'leads_30': cols['leads_30'][i],
+                'test_drives_7': cols['test_drives_7'][i], 'test_drives_30': cols['test_drives_30'][i],
+                'view_trend_pct': out['view_trend'][i],
+                'view_trend_label': out['vt_label'][i],
+                'lead_to_view_rate': out['lead_to_view'][i],
+                'test_drive_to_lead_rate': out['td_to_lead'][i],
+                'engagement_score': out['engagement_score'][i]
+            },
+            'probability_factors': {
+                'demand': out['demand_mult'][i],
+                'competition': out['comp_factor'][i],
+                'aging': out['aging_factor'][i],
+                'engagement': out['eng_factor'][i],
+                'price': out['price_factor'][i],
+                'composite': out['composite'][i]
+            },
+            'sale_probability': {
+                'prob_30_day': out['prob30'][i],
+                'prob_60_day': out['prob60'][i],
+                'prob_90_day': out['prob90'][i]
+            },
+            'aging': {
+                'zone': out['zone'][i],
+                'zone_detail': zone_detail[out['zone'][i]],
+                'days_in_inventory': cols['days_in_inventory'][i],
+                'erosion_table': [
+                    {
+                        'additional_days': add_days,
+                        'total_days': ero['total_days'][i][j],
+                        'floorplan_accrued': ero['floorplan_accrued'][i][j],
+                        'gross_at_sticker': ero['gross_at_sticker'][i][j],
+                        'realistic_gross_low': ero['realistic_gross_low'][i][j],
+                        'realistic_gross_high': ero['realistic_gross_high'][i][j]
+                    }
+                    for j, add_days in enumerate(EROSION_DAYS.tolist())
+                ],
+                'irrationality_threshold': {
+                    'day': irrational_day,
+                    'days_remaining': days_until_irrational,
+                    'explanation': f'Beyond day {irrational_day}, holding becomes economically irrational. ~{days_until_irrational} days remain.'
+                }
+            }
+        })
+
+    return results
+
+
+# ============================================================
+# IRRATIONALITY THRESHOLD SOLVER
+# ============================================================
+@app.route('/api/threshold', methods=['POST'])
+def threshold_endpoint():
+    """
+    Recomputes the irrationality threshold (the last day holding for retail
+    still beats wholesaling) for many vehicles at once. Accepts
+    `vehicle_ids` or `vehicles` like /api/analyze/batch.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        vehicles, errors = resolve_batch_vehicles(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = []
+    if vehicles:
+        c = vehicle_columns(vehicles)
+        core = batch_analysis_core(c)
+        days = batch_irrational_days(c, core).tolist()
+        today = datetime.utcnow().date()
+        for v, day in zip(vehicles, days):
+            remaining = max(0, day - v['days_in_inventory'])
+            results.append({
+                'vehicle_id': v.get('id'),
+                'vehicle_title': f"{v['year']} {v['make']} {v['model']} {v.get('trim', '')}".strip(),
+                'days_in_inventory': v['days_in_inventory'],
+                'irrationality_day': day,
+                'days_remaining': remaining,
+                'wholesale_by': (today + timedelta(days=remaining)).isoformat()
+            })
+
+    return jsonify({
+        'message': 'Threshold recalculation complete',
+        'count': len(results),
+        'results': results,
+        'errors': errors
+    })
+
+
+# The scan looks at most this many days past today. Decay factors come from
+# Python's float pow so the table matches `0.98 ** k` bit for bit.
+THRESHOLD_HORIZON = 150
+DECAY_FACTORS = [0.98 ** k for k in range(THRESHOLD_HORIZON)]
+DECAY_TABLE = np.array(DECAY_FACTORS)
+
+
+def solve_irrational_day(di, daily_floorplan, potential_gross, prob30, wholesale_price, total_invested, wholesale_net_today):
+    """
+    First day from `di` on where probability-weighted retail net falls below
+    wholesale (or retail net goes negative); the last scanned day if never.
+
+    Floorplan grows linearly and the sell probability decays geometrically,
+    so with a non-negative floorplan rate the crossing condition is monotone
+    in the day and bisection finds the same day as a linear scan.
+    """
+    def crossed(day):
+        fp = daily_floorplan * day
+        retail_net = (potential_gross - fp) - 750
+        day_prob = clamp(prob30 * DECAY_FACTORS[day - di], 0.05, 0.95)
+        pw_retail = retail_net * day_prob
+        ws_at_day = wholesale_price - total_invested - fp
+        return pw_retail < max(ws_at_day, wholesale_net_today) or retail_net < 0
+
+    last_day = di + THRESHOLD_HORIZON - 1
+    if daily_floorplan < 0:
+        return next((day for day in range(di, last_day) if crossed(day)), last_day)
+
+    if not crossed(last_day):
+        return last_day
+    lo, hi = di, last_day
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if crossed(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def batch_irrational_days(c, core, chunk_size=4096):
+    """Vectorized `solve_irrational_day` over the decay table, in row chunks."""
+    di = c['days_in_inventory']
+    result = np.empty(len(di), dtype=np.int64)
+    offsets = np.arange(THRESHOLD_HORIZON)
+
+    for start in range(0, len(di), chunk_size):
+        rows = slice(start, start + chunk_size)
+        day = di[rows, None] + offsets
+        fp = core['daily_floorplan'][rows, None] * day
+        retail_net = (core['potential_gross'][rows, None] - fp) - 750
+        day_prob = np.clip(core['prob30'][rows, None] * DECAY_TABLE, 0.05, 0.95)
+        pw_retail = retail_net * day_prob
+        ws_at_day = c['wholesale_price'][rows, None] - core['total_invested'][rows, None] - fp
+        crossed = (pw_retail < np.maximum(ws_at_day, core['wholesale_net_today'][rows, None])) | (retail_net < 0)
+        first = np.where(crossed.any(axis=1), crossed.argmax(axis=1), THRESHOLD_HORIZON - 1)
+        result[rows] = di[rows] + first
+
+    return result
+
+
+# ============================================================
+# WHAT-IF SIMULATOR — price sweeps through the batch engine
+# ============================================================
+PRICE_SWEEP_STEPS = 50
+MAX_PRICE_SWEEP_STEPS = 2000
+
+
+@app.route('/api/simulate/price-sweep', methods=['POST'])
+def price_sweep_endpoint():
+    """
+    Re-prices one vehicle across a grid and reports how market position,
+    sell probabilities, the irrationality threshold and expected gross move.
+
+    Body:
+    - vehicle_id, or vehicle: a payload shaped like /api/analyze
+    - prices: explicit grid, or low / high / steps (default: comp_low to
+      comp_high in 50 steps)
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('vehicle_id') is not None:
+        vehicle = vehicles_db.get(data['vehicle_id'])
+        if not vehicle:
+            return jsonify({'error': 'Vehicle not found'}), 404
+    elif data.get('vehicle'):
+        missing = missing_required_field(data['vehicle'])
+        if missing:
+            return jsonify({'error': f'Missing required field: {missing}'}), 400
+        vehicle = build_vehicle_record(data['vehicle'].get('id'), data['vehicle'])
+    else:
+        return jsonify({'error': 'Provide vehicle_id or vehicle'}), 400
+
+    try:
+        prices = price_grid(vehicle, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    sweep = price_sweep(vehicle, prices)
+    return jsonify({
+        'vehicle_id': vehicle.get('id'),
+        'vehicle_title': f"{vehicle['year']} {vehicle['make']} {vehicle['model']} {vehicle.get('trim', '')}".strip(),
+        'current_list_price': vehicle['list_price'],
+        **sweep
+    })
+
+
+def price_grid(vehicle, data):
+    """Candidate list prices from the request body, as a float array."""
+    if data.get('prices') is not None:
+        prices = np.array([float(p) for p in data['prices']])
+    else:
+        low = float(data.get('low', vehicle['comp_low']))
+        high = float(data.get('high', vehicle['comp_high']))
+        steps = int(data.get('steps', PRICE_SWEEP_STEPS))
+        if high <= low:
+            raise ValueError('Need high > low: pass low/high or prices when the vehicle has no comp range')
+        if steps < 2:
+            raise ValueError('steps must be at least 2')
+        prices = np.linspace(low, high, steps)
+    if not 0 < len(prices) <= MAX_PRICE_SWEEP_STEPS:
+        raise ValueError(f'Price grid must have 1 to {MAX_PRICE_SWEEP_STEPS} points')
+    if not np.isfinite(prices).all():
+        raise ValueError('Prices must be finite numbers')
+    return prices
+
+
+def price_sweep(vehicle, prices):
+    """
+    Evaluates the vehicle at every price in one vectorized pass: the
+    vehicle's columns are broadcast along the grid with list_price swapped
+    for the candidates, so each row matches analyze_vehicle at that price.
+
+    Expected gross holds the price and uses the exit-path retail estimate:
+    the midpoint of the expected transaction range (price - 750) less
+    total invested and 20 more days of floorplan, weighted by prob30.
+    """
+    n = len(prices)
+    c = {field: np.repeat(column, n) for field, column in vehicle_columns([vehicle]).items()}
+    c['list_price'] = prices
+    core = batch_analysis_core(c)
+    irrational_day = batch_irrational_days(c, core)
+
+    expected_gross = (prices - 750) - core['total_invested'] - (core['daily_floorplan'] * 20)
+    weighted_gross = expected_gross * core['prob30']
+    best = int(np.argmax(weighted_gross))
+    wholesale_net_today = float(core['wholesale_net_today'][0])
+
+    table = {
+        'price': _r2(prices),
+        'percentile': np.rint(core['market_position'] * 100).astype(np.int64),
+        'price_factor': core['price_factor'],
+        'composite': core['composite'],
+        'prob_30_day': np.rint(core['prob30'] * 100).astype(np.int64),
+        'prob_60_day': np.rint(core['prob60'] * 100).astype(np.int64),
+        'prob_90_day': np.rint(core['prob90'] * 100).astype(np.int64),
+        'irrationality_day': irrational_day,
+        'days_remaining': np.maximum(0, irrational_day - c['days_in_inventory']),
+        'expected_gross': _r2(expected_gross),
+        'prob_weighted_gross': _r2(weighted_gross),
+    }
+    best_row = {
+        column: table[column][best].item()
+        for column in ('price', 'percentile', 'prob_30_day', 'irrationality_day', 'expected_gross', 'prob_weighted_gross')
+    }
+    best_row['beats_wholesale'] = bool(weighted_gross[best] > wholesale_net_today)
+    return {
+        'count': n,
+        'wholesale_net_today': r2(wholesale_net_today),
+        'sweep': {column: values.tolist() for column, values in table.items()},
+        'best': best_row,
+    }
 
-        point['daily_probability'] = round(scaled_daily * 100, 2)
-        point['cumulative_probability'] = round(scaled_cum * 100, 1)
 
-    return curve
+# ============================================================
+# MONTE CARLO SALE TIMING — distributions from the daily curve
+# ============================================================
+# Each path draws its retail sale day by inverse-CDF sampling of the
+# vehicle's daily probability curve, and a transaction price uniformly
+# across the expected transaction range (list - 1000 .. list - 500).
+# The curve covers days in inventory 1-90, but every vehicle keeps at least
+# MONTE_CARLO_MIN_WINDOW_DAYS of retail chances from today, so a vehicle at
+# or past day 90 (whose curve is all zero) is not a certain wholesale: past
+# day 90 the sale day continues at the constant daily hazard that matches
+# the vehicle's 30-day sale probability. The curve's own last hazard is not
+# used; rescaling packs the 90-day mass into the few days a late vehicle has
+# left, which would overstate its tail. Paths still unsold at the end of the
+# horizon wholesale WHOLESALE_EXIT_DAYS later. Work is split into
+# units of a fixed size, each with its own child of the request's
+# SeedSequence, so a seed gives the same answer however many worker
+# processes run the units.
+MONTE_CARLO_PATHS = 100000
+MONTE_CARLO_LOT_PATHS = 1000
+MAX_MONTE_CARLO_SAMPLES = int(os.environ.get('MAX_MONTE_CARLO_SAMPLES', 20_000_000))
+MONTE_CARLO_SHARD_PATHS = 25000
+MONTE_CARLO_LOT_CHUNK = 256
+WHOLESALE_EXIT_DAYS = 5
+MONTE_CARLO_MIN_WINDOW_DAYS = 30
+PERCENTILES = (10, 50, 90)
+
+
+@app.route('/api/simulate/sale-timing', methods=['POST'])
+def sale_timing_endpoint():
+    """
+    Distribution of days to exit, gross and floorplan cost for one vehicle.
+
+    Body: vehicle_id or vehicle (as for /api/analyze), paths (default
+    100,000) and seed (random when omitted; echoed back for replays).
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('vehicle_id') is not None:
+        vehicle = vehicles_db.get(data['vehicle_id'])
+        if not vehicle:
+            return jsonify({'error': 'Vehicle not found'}), 404
+    elif data.get('vehicle'):
+        missing = missing_required_field(data['vehicle'])
+        if missing:
+            return jsonify({'error': f'Missing required field: {missing}'}), 400
+        vehicle = build_vehicle_record(data['vehicle'].get('id'), data['vehicle'])
+    else:
+        return jsonify({'error': 'Provide vehicle_id or vehicle'}), 400
+    try:
+        paths, seed = monte_carlo_options(data, MONTE_CARLO_PATHS, 1)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    params = sale_timing_params([vehicle])
+    shard_sizes = [min(MONTE_CARLO_SHARD_PATHS, paths - start) for start in range(0, paths, MONTE_CARLO_SHARD_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    shards = list(map_in_order(simulate_vehicle_shard, [(params, size, s) for size, s in zip(shard_sizes, seeds)]))
+    days, gross, floorplan, sold = (np.concatenate(parts) for parts in zip(*shards))
+
+    return jsonify({
+        'vehicle_id': vehicle.get('id'),
+        'vehicle_title': f"{vehicle['year']} {vehicle['make']} {vehicle['model']} {vehicle.get('trim', '')}".strip(),
+        'paths': paths,
+        'seed': seed,
+        'retail_share': round(float(sold.mean()), 4),
+        'days_to_exit': distribution(days, 1),
+        'gross': distribution(gross, 2),
+        'floorplan_cost': distribution(floorplan, 2),
+    })
+
+
+@app.route('/api/simulate/portfolio', methods=['POST'])
+def portfolio_simulation_endpoint():
+    """
+    Lot-wide Monte Carlo: every vehicle simulated over the same number of
+    paths, summed per path into lot totals. Accepts vehicle_ids / vehicles
+    like /api/analyze/batch (default: all active), paths (default 1,000)
+    and seed.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        vehicles, errors = resolve_batch_vehicles(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        paths, seed = monte_carlo_options(data, MONTE_CARLO_LOT_PATHS, max(len(vehicles), 1))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not vehicles:
+        return jsonify({'message': 'No vehicles to simulate', 'count': 0, 'errors': errors})
+
+    chunks = [vehicles[i:i + MONTE_CARLO_LOT_CHUNK] for i in range(0, len(vehicles), MONTE_CARLO_LOT_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    units = [(sale_timing_params(chunk), paths, s) for chunk, s in zip(chunks, seeds)]
+    lot_gross = np.zeros(paths)
+    lot_floorplan = np.zeros(paths)
+    retail_30 = np.zeros(paths, dtype=np.int64)
+    wholesaled = np.zeros(paths, dtype=np.int64)
+    per_vehicle = []
+    for totals, summaries in map_in_order(simulate_lot_chunk, units):
+        lot_gross += totals['gross']
+        lot_floorplan += totals['floorplan']
+        retail_30 += totals['retail_30']
+        wholesaled += totals['wholesaled']
+        per_vehicle.extend(summaries)
+
+    return jsonify({
+        'message': 'Portfolio simulation complete',
+        'count': len(vehicles),
+        'paths': paths,
+        'seed': seed,
+        'lot': {
+            'gross': distribution(lot_gross, 2),
+            'floorplan_cost': distribution(lot_floorplan, 2),
+            'retail_sales_30_days': distribution(retail_30, 1),
+            'wholesaled': distribution(wholesaled, 1),
+        },
+        'vehicles': [dict(s, vehicle_id=v.get('id')) for v, s in zip(vehicles, per_vehicle)],
+        'errors': errors
+    })
+
+
+def monte_carlo_options(data, default_paths, vehicles):
+    """(paths, seed) from a request body, bounded by MAX_MONTE_CARLO_SAMPLES."""
+    paths = int(data.get('paths', default_paths))
+    if paths < 1 or paths * vehicles > MAX_MONTE_CARLO_SAMPLES:
+        raise ValueError(f'paths must be between 1 and {MAX_MONTE_CARLO_SAMPLES // vehicles:,} for {vehicles:,} vehicle(s)')
+    seed = data.get('seed')
+    if seed is None:
+        # 53 bits so the echoed seed survives JavaScript numbers
+        seed = int.from_bytes(os.urandom(8), 'big') >> 11
+    elif int(seed) < 0:
+        raise ValueError('seed must be a non-negative integer')
+    return paths, int(seed)
+
+
+def sale_timing_params(vehicles):
+    """
+    Per-vehicle inputs of the simulation as arrays: the curve CDF as an
+    (N, 90) matrix, then the length and daily hazard of the tail past it.
+    """
+    c = vehicle_columns(vehicles)
+    core = batch_analysis_core(c)
+    cdf = np.empty((len(vehicles), len(CURVE_DAYS)))
+    for i, (p30, p60, p90, di, composite) in enumerate(zip(
+            core['prob30'].tolist(), core['prob60'].tolist(), core['prob90'].tolist(),
+            c['days_in_inventory'].tolist(), core['composite'].tolist())):
+        _, daily, _ = probability_curve_arrays(p30, p60, p90, di, composite)
+        cdf[i] = np.minimum(0.98, np.add.accumulate(daily / 100))
+    di = c['days_in_inventory']
+    return {
+        'cdf': cdf,
+        'tail_start': np.maximum(CURVE_DAYS[-1], di),
+        'tail_days': np.maximum(0, di + MONTE_CARLO_MIN_WINDOW_DAYS - np.maximum(CURVE_DAYS[-1], di)),
+        # Daily hazard that sells prob30 of the units in 30 days
+        'tail_hazard': 1 - (1 - core['prob30']) ** (1 / 30),
+        'list_price': c['list_price'],
+        'total_invested': core['total_invested'],
+        'daily_floorplan': core['daily_floorplan'],
+        'wholesale_price': c['wholesale_price'],
+        'days_in_inventory': di,
+    }
+
+
+def simulate_paths(rng, params, paths):
+    """
+    (days to exit, gross, floorplan cost at exit, sold retail) as (N, paths)
+    arrays. Offsetting row i of the CDF and its uniforms by 2i lets a single
+    searchsorted over the flattened matrix sample every vehicle at once.
+    A uniform past the end of the CDF is reused, rescaled, to draw the
+    geometric sale day in the tail.
+    """
+    cdf = params['cdf']
+    n, horizon = cdf.shape
+    offsets = 2.0 * np.arange(n)[:, None]
+    u = rng.random((n, paths))
+    found = np.searchsorted((cdf + offsets).ravel(), (u + offsets).ravel(), side='right').reshape(n, paths)
+    slot = found - np.arange(n)[:, None] * horizon
+    sold = slot < horizon
+
+    di = params['days_in_inventory'][:, None]
+    tail_start = params['tail_start'][:, None]
+    exit_day = np.where(sold, CURVE_DAYS[np.minimum(slot, horizon - 1)],
+                        tail_start + params['tail_days'][:, None] + WHOLESALE_EXIT_DAYS)
+    rows, cols = np.nonzero(~sold & (params['tail_days'][:, None] > 0))
+    if len(rows):
+        end = cdf[rows, -1]
+        v = (u[rows, cols] - end) / (1 - end)
+        tail_day = np.floor(np.log1p(-v) / np.log1p(-params['tail_hazard'][rows])).astype(np.int64) + 1
+        in_tail = tail_day <= params['tail_days'][rows]
+        rows, cols = rows[in_tail], cols[in_tail]
+        sold[rows, cols] = True
+        exit_day[rows, cols] = params['tail_start'][rows] + tail_day[in_tail]
+    floorplan = params['daily_floorplan'][:, None] * exit_day
+
+    list_price = params['list_price'][:, None]
+    transaction = rng.uniform(list_price - 1000, list_price - 500, size=(n, paths))
+    proceeds = np.where(sold, transaction, params['wholesale_price'][:, None])
+    gross = proceeds - params['total_invested'][:, None] - floorplan
+    return exit_day - di, gross, floorplan, sold
+
+
+def simulate_vehicle_shard(unit):
+    """One shard of a single-vehicle run: flat arrays for its paths."""
+    params, paths, seed = unit
+    days, gross, floorplan, sold = simulate_paths(np.random.default_rng(seed), params, paths)
+    return days[0], gross[0], floorplan[0], sold[0]
+
+
+def simulate_lot_chunk(unit):
+    """
+    A chunk of a portfolio run: per-path totals over its vehicles plus a
+    small summary per vehicle, so only O(paths) crosses the process pool.
+    """
+    params, paths, seed = unit
+    days, gross, floorplan, sold = simulate_paths(np.random.default_rng(seed), params, paths)
+    totals = {
+        'gross': gross.sum(axis=0),
+        'floorplan': floorplan.sum(axis=0),
+        'retail_30': (sold & (days <= 30)).sum(axis=0),
+        'wholesaled': (~sold).sum(axis=0),
+    }
+    gross_pct = np.percentile(gross, PERCENTILES, axis=1)
+    summaries = [
+        {
+            'expected_days': round(d, 1), 'retail_share': round(s, 4),
+            'gross': {'mean': r2(m), **{f'p{p}': r2(v) for p, v in zip(PERCENTILES, pct)}},
+        }
+        for d, s, m, pct in zip(days.mean(axis=1).tolist(), sold.mean(axis=1).tolist(),
+                                gross.mean(axis=1).tolist(), gross_pct.T.tolist())
+    ]
+    return totals, summaries
+
+
+def distribution(samples, ndigits):
+    """Mean and P10/P50/P90 of a sample array."""
+    summary = {'mean': round(float(samples.mean()), ndigits)}
+    for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES).tolist()):
+        summary[f'p{p}'] = round(value, ndigits)
+    return summary
+
+
+# ============================================================
+# PORTFOLIO OPTIMIZER — lot-wide price / exit decisions under budgets
+# ============================================================
+# Every vehicle gets four options: retail at a REDUCE, HOLD or INCREASE
+# price (amounts as in the pricing section), or WHOLESALE now. Options are
+# scored the way the exit path compares them: retail is the prob30-weighted
+# expected gross at that price, wholesale is today's wholesale net. Each
+# option also uses floorplan over the planning horizon: retail units for
+# the expected days held (a sale is assumed to land mid-window), wholesale
+# units for WHOLESALE_EXIT_DAYS.
+PORTFOLIO_HORIZON_DAYS = 30
+PORTFOLIO_OPTIONS = (('REDUCE', 'RETAIL'), ('HOLD', 'RETAIL'), ('INCREASE', 'RETAIL'), ('HOLD', 'WHOLESALE'))
+
+
+@app.route('/api/optimize/portfolio', methods=['POST'])
+def optimize_portfolio_endpoint():
+    """
+    Picks a price action and exit path for every vehicle to maximise
+    expected lot gross within the constraints (all optional):
+    - floorplan_budget: floorplan dollars available over the next 30 days
+    - wholesale_units_per_week: most units the wholesale lane can take
+      (a cap, not a quota)
+    - gross_target: expected gross the plan must reach; status is
+      'gross_infeasible' when the best plan found falls short of it
+    Accepts vehicle_ids / vehicles like /api/analyze/batch (default: all
+    active vehicles).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        vehicles, errors = resolve_batch_vehicles(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        budget = float(data['floorplan_budget']) if data.get('floorplan_budget') is not None else math.inf
+        wholesale_cap = int(data['wholesale_units_per_week']) if data.get('wholesale_units_per_week') is not None else len(vehicles)
+        gross_target = float(data['gross_target']) if data.get('gross_target') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'floorplan_budget, wholesale_units_per_week and gross_target must be numbers'}), 400
+    if not budget >= 0 or wholesale_cap < 0:
+        return jsonify({'error': 'floorplan_budget and wholesale_units_per_week must not be negative'}), 400
+    if gross_target is not None and not math.isfinite(gross_target):
+        return jsonify({'error': 'gross_target must be a finite number'}), 400
+    if not vehicles:
+        return jsonify({'message': 'No vehicles to optimize', 'count': 0, 'errors': errors})
+
+    options = portfolio_options(vehicles)
+    choice, status = solve_portfolio(options['gross'], options['floorplan'], budget, wholesale_cap)
+
+    rows = np.arange(len(vehicles))
+    gross = options['gross'][rows, choice]
+    floorplan = options['floorplan'][rows, choice]
+    expected_gross = float(gross.sum())
+    floorplan_used = float(floorplan.sum())
+    wholesale_units = int((choice == len(PORTFOLIO_OPTIONS) - 1).sum())
+    meets_gross_target = None if gross_target is None else expected_gross >= gross_target
+    if status == 'feasible' and meets_gross_target is False:
+        # The solve already maximises gross within the budget and lane
+        status = 'gross_infeasible'
+
+    prices = options['price'][rows, choice].tolist()
+    decisions = []
+    for i, (v, option) in enumerate(zip(vehicles, choice.tolist())):
+        action, exit_path = PORTFOLIO_OPTIONS[option]
+        decisions.append({
+            'vehicle_id': v.get('id'),
+            'vehicle_title': f"{v['year']} {v['make']} {v['model']} {v.get('trim', '')}".strip(),
+            'action': action,
+            'exit': exit_path,
+            'current_list_price': v['list_price'],
+            'new_list_price': prices[i] if exit_path == 'RETAIL' else v['list_price'],
+            'expected_gross': r2(gross[i].item()),
+            'floorplan_cost': r2(floorplan[i].item()),
+        })
+
+    mix = {}
+    for d in decisions:
+        label = f"{d['exit']}:{d['action']}" if d['exit'] == 'RETAIL' else d['exit']
+        mix[label] = mix.get(label, 0) + 1
+
+    return jsonify({
+        'message': 'Portfolio optimization complete',
+        'count': len(vehicles),
+        'status': status,
+        'totals': {
+            'expected_gross': r2(expected_gross),
+            'floorplan_cost': r2(floorplan_used),
+            'floorplan_budget': None if math.isinf(budget) else budget,
+            'within_budget': floorplan_used <= budget,
+            'wholesale_units': wholesale_units,
+            'wholesale_units_per_week': wholesale_cap,
+            'gross_target': gross_target,
+            'meets_gross_target': meets_gross_target,
+        },
+        'mix': mix,
+        'decisions': decisions,
+        'errors': errors
+    })
+
+
+def portfolio_options(vehicles):
+    """
+    (N, 4) arrays of price, expected gross and horizon floorplan cost per
+    PORTFOLIO_OPTIONS entry. An INCREASE that rounds to no change is
+    scored -inf so it is never picked over HOLD.
+    """
+    c = vehicle_columns(vehicles)
+    core = batch_analysis_core(c)
+    list_price = c['list_price']
+    comp_range = core['comp_range']
+    optimal_price = np.where(comp_range > 0, c['comp_low'] + (comp_range * 0.45), list_price)
+    price_diff = list_price - optimal_price
+    reduce_amount = np.maximum(300, np.minimum(np.rint(price_diff / 100) * 100,
+                                               np.rint(core['potential_gross'] * 0.35 / 100) * 100))
+    increase_amount = np.minimum(np.rint(np.abs(price_diff) * 0.5 / 100) * 100, 800)
+
+    # One pass of the batch engine over the three retail prices, stacked
+    retail_prices = np.stack([list_price - reduce_amount, list_price, list_price + increase_amount], axis=1)
+    n = len(vehicles)
+    stacked = {field: np.repeat(column, 3) for field, column in c.items()}
+    stacked['list_price'] = retail_prices.ravel()
+    retail = batch_analysis_core(stacked)
+    prob30 = retail['prob30'].reshape(n, 3)
+    total_invested = core['total_invested'][:, None]
+    daily_floorplan = core['daily_floorplan'][:, None]
+
+    retail_gross = ((retail_prices - 750) - total_invested - (daily_floorplan * 20)) * prob30
+    retail_gross[:, 2] = np.where(increase_amount > 0, retail_gross[:, 2], -np.inf)
+    retail_floorplan = daily_floorplan * PORTFOLIO_HORIZON_DAYS * (1 - prob30 / 2)
+
+    return {
+        'price': np.column_stack([retail_prices, list_price]),
+        'gross': np.column_stack([retail_gross, core['wholesale_net_today']]),
+        'floorplan': np.column_stack([retail_floorplan, core['daily_floorplan'] * WHOLESALE_EXIT_DAYS]),
+    }
+
+
+def solve_portfolio(gross, cost, budget, wholesale_cap):
+    """
+    Budget- and lane-constrained choice of one option per vehicle
+    (multiple-choice knapsack), in two greedy steps:
+
+    1. Lagrangian: charge lam per floorplan dollar, let every vehicle take
+       its best retail option, and give the wholesale lane to the
+       wholesale_cap vehicles it helps most. Bisect lam down to the
+       cheapest charge that fits the budget (lam = 0 if it already does).
+    2. Spend what's left of the budget on the upgrades with the most gross
+       per extra floorplan dollar.
+
+    Returns (option index per vehicle, status). If even the cheapest plan
+    the lane allows is over budget, that plan comes back as
+    'budget_infeasible'.
+    """
+    n, k = gross.shape
+    wholesale = k - 1
+    rows = np.arange(n)
+    wholesale_cap = max(0, min(wholesale_cap, n))
+
+    def assign(lam):
+        adjusted = gross - lam * cost
+        choice = np.argmax(adjusted[:, :wholesale], axis=1)
+        advantage = adjusted[:, wholesale] - adjusted[rows, choice]
+        ranked = np.argsort(-advantage, kind='stable')[:wholesale_cap]
+        choice[ranked[advantage[ranked] > 0]] = wholesale
+        return choice, float(cost[rows, choice].sum())
+
+    choice, spent = assign(0.0)
+    if spent > budget:
+        # Large enough that gross no longer matters next to floorplan
+        high = 1e9 * (float(np.abs(gross[np.isfinite(gross)]).max()) + 1)
+        choice, spent = assign(high)
+        if spent > budget:
+            return choice, 'budget_infeasible'
+        low = 0.0
+        for _ in range(60):
+            mid = (low + high) / 2
+            trial, trial_spent = assign(mid)
+            if trial_spent <= budget:
+                high, choice, spent = mid, trial, trial_spent
+            else:
+                low = mid
+
+    wholesale_left = wholesale_cap - int((choice == wholesale).sum())
+    heap = []
+    generation = np.zeros(n, dtype=np.int64)
+    # Vehicles whose best move was wholesale while the lane was full; they
+    # are offered again whenever a vehicle upgrades off the lane
+    lane_waiting = set()
+
+    def offer(i):
+        """Pushes vehicle i's best upgrade, replacing any earlier offer."""
+        generation[i] += 1
+        current = choice[i]
+        extra = cost[i] - cost[i, current]
+        gain = gross[i] - gross[i, current]
+        better = (gain > 0) & (extra <= budget - spent) & np.isfinite(gross[i])
+        if wholesale_left <= 0 and current != wholesale and better[wholesale]:
+            better[wholesale] = False
+            lane_waiting.add(i)
+        candidates = np.flatnonzero(better)
+        if len(candidates):
+            ratio = gain[candidates] / np.maximum(extra[candidates], 1e-9)
+            best = int(np.argmax(ratio))
+            heapq.heappush(heap, (-float(ratio[best]), i, int(candidates[best]), int(generation[i])))
+
+    for i in range(n):
+        offer(i)
+    while heap:
+        _, i, to, offered = heapq.heappop(heap)
+        if offered != generation[i]:
+            continue
+        extra = cost[i, to] - cost[i, choice[i]]
+        if spent + extra > budget or (to == wholesale and choice[i] != wholesale and wholesale_left <= 0):
+            offer(i)  # offered before the budget or lane tightened
+            continue
+        leaves_lane = choice[i] == wholesale
+        if to == wholesale:
+            wholesale_left -= 1
+        elif leaves_lane:
+            wholesale_left += 1
+        spent += extra
+        choice[i] = to
+        offer(i)
+        if leaves_lane and lane_waiting:
+            waiting = sorted(lane_waiting)
+            lane_waiting.clear()
+            for j in waiting:
+                offer(j)
+    return choice, 'feasible'
 
 
 # ============================================================
@@ -1173,10 +5148,28 @@ def r2(n):
 def clamp(value, min_val, max_val):
     return max(min_val, min(max_val, value))
 
+def round_like_python(values, ndigits):
+    """
+    Vectorized round(x, ndigits). np.round works on the already-rounded
+    product x * 10**ndigits, which can land on the other side of a half
+    boundary than the exact decimal value round() uses — those few
+    elements fall back to round() itself.
+    """
+    factor = 10.0 ** ndigits
+    scaled = values * factor
+    rounded = np.rint(scaled) / factor
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        idx = np.flatnonzero(near_half)
+        rounded[idx] = [round(x, ndigits) for x in values[idx].tolist()]
+    return rounded
+
 
 # ============================================================
 # RUN
 # ============================================================
 if __name__ == '__main__':
+    if SCHEDULER_ENABLED:
+        start_scheduler()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,60 @@
+import os
+import random
+import sys
+
+# main builds its stores and scheduler at import time
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+
+
+def random_vehicle(rng):
+    """A vehicle payload shaped like POST /api/vehicles, spread across every analysis branch."""
+    acquisition = rng.uniform(5000, 60000)
+    comp_low = acquisition * rng.uniform(0.9, 1.3)
+    return {
+        'year': rng.randint(2012, 2024), 'make': rng.choice(['Honda', 'Ford', 'Toyota']),
+        'model': rng.choice(['Accord', 'F-150', 'Camry']), 'trim': rng.choice(['', 'EX', 'LX']),
+        'mileage': rng.randint(0, 150000), 'ext_color': 'Red', 'int_color': 'Black',
+        'acquisition_cost': acquisition, 'recon_cost': rng.choice([0, 500, 1500.5]),
+        'list_price': acquisition * rng.uniform(0.95, 1.35), 'floorplan_rate': rng.uniform(0, 12),
+        'days_in_inventory': rng.randint(0, 150),
+        'wholesale_price': rng.choice([0, acquisition * rng.uniform(0.8, 1.1)]),
+        'comp_low': rng.choice([0, comp_low]), 'comp_high': rng.choice([0, comp_low * rng.uniform(1, 1.3)]),
+        'competing_units': rng.randint(0, 30), 'demand_signal': rng.choice(['high', 'soft', 'normal']),
+        'views_7': rng.randint(0, 300), 'views_30': rng.randint(0, 1000),
+        'leads_7': rng.randint(0, 10), 'leads_30': rng.randint(0, 30),
+        'test_drives_7': rng.randint(0, 5), 'test_drives_30': rng.randint(0, 10),
+        'min_gross': rng.choice([0, 1000, 1500]),
+    }
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1234)
+
+
+@pytest.fixture
+def vehicles(rng):
+    """200 built vehicle records (not stored)."""
+    return [main.build_vehicle_record(None, random_vehicle(rng)) for _ in range(200)]
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def empty_stores():
+    """Every test starts and ends with empty stores."""
+    stores = (main.vehicles_db, main.reports_db, main.report_curves_db, main.comps_db, main.meta_db)
+    for store in stores:
+        store.clear()
+    yield
+    for store in stores:
+        store.clear()
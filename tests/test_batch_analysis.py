@@ -0,0 +1,48 @@
+import main
+
+
+def test_batch_matches_analyze_vehicle(vehicles):
+    results = main.analyze_batch(vehicles)
+    assert len(results) == len(vehicles)
+    for vehicle, batch in zip(vehicles, results):
+        single = main.analyze_vehicle(vehicle)
+        assert batch['vehicle_id'] == vehicle['id']
+        for section in ('financials', 'market_position', 'engagement', 'aging'):
+            assert batch[section] == single[section], section
+        assert batch['sale_probability'] == {
+            k: single['sale_probability'][k] for k in ('prob_30_day', 'prob_60_day', 'prob_90_day')
+        }
+
+
+def test_batch_endpoint_reports_bad_items(client, vehicles):
+    for vehicle in vehicles[:3]:
+        main.vehicles_db[vehicle['id']] = vehicle
+    by_id = client.post('/api/analyze/batch', json={'vehicle_ids': [vehicles[0]['id'], 'missing']}).get_json()
+    assert by_id['count'] == 1
+    assert by_id['errors'] == [{'vehicle_id': 'missing', 'error': 'Vehicle not found'}]
+
+    lot = client.post('/api/analyze/batch', json={}).get_json()
+    assert sorted(r['vehicle_id'] for r in lot['results']) == sorted(v['id'] for v in vehicles[:3])
+
+    raw = client.post('/api/analyze/batch', json={'vehicles': [{'year': 2020}]}).get_json()
+    assert raw['count'] == 0 and raw['errors'][0]['error'].startswith('Missing required field')
+
+
+def test_batch_endpoint_rejects_malformed_bodies(client, vehicles):
+    for body in ([vehicles[0]], {'vehicle_ids': 'abc'}, {'vehicles': 'x'}, {'vehicles': {'year': 2020}}):
+        response = client.post('/api/analyze/batch', json=body)
+        assert response.status_code == 400, body
+        assert 'error' in response.get_json()
+
+    good = {k: v for k, v in vehicles[0].items() if k != 'id'}
+    body = {'vehicles': [5, dict(good, list_price='abc'), good, None, dict(good, mileage=[1])]}
+    response = client.post('/api/analyze/batch', json=body)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['count'] == 1
+    assert [e['index'] for e in result['errors']] == [0, 1, 3, 4]
+    assert result['errors'][1]['error'].startswith('Invalid vehicle')
+
+    ids = client.post('/api/analyze/batch', json={'vehicle_ids': [1, 'missing']}).get_json()
+    assert ids['errors'] == [{'index': 0, 'error': 'vehicle_id must be a string'},
+                             {'vehicle_id': 'missing', 'error': 'Vehicle not found'}]
@@ -0,0 +1,34 @@
+import main
+
+ARGS = (2020, 'Honda', 'Accord', 'EX', 30000, 24000, 22000, 26000, 5)
+
+
+def without_timestamp(analysis):
+    return {k: v for k, v in analysis.items() if k != 'generated_at'}
+
+
+def test_cached_answer_matches_uncached_and_is_reused(monkeypatch):
+    monkeypatch.setattr(main, 'comp_fetcher', main.CompFetcher([]))
+    hits = main.comp_cache_stats['hits']
+    first = main.cached_comp_analysis(*ARGS)
+    assert without_timestamp(first) == without_timestamp(main.generate_comp_analysis(*ARGS))
+
+    again = main.cached_comp_analysis(2020, ' honda', 'ACCORD ', 'ex', 30000, 24000.0, 22000, 26000, 5)
+    assert again == first
+    assert main.comp_cache_stats['hits'] == hits + 1
+    assert len(main.comps_db) == 1
+
+
+def test_expired_and_excess_entries_are_dropped(monkeypatch):
+    monkeypatch.setattr(main, 'comp_fetcher', main.CompFetcher([]))
+    monkeypatch.setattr(main, 'COMP_CACHE_SIZE', 3)
+    first = main.cached_comp_analysis(*ARGS)
+    key = main.comp_cache_key(*ARGS)
+    main.comps_db[key] = dict(main.comps_db[key], expires_at=0)
+    misses = main.comp_cache_stats['misses']
+    assert without_timestamp(main.cached_comp_analysis(*ARGS)) == without_timestamp(first)
+    assert main.comp_cache_stats['misses'] == misses + 1
+
+    for mileage in range(40000, 46000, 1000):
+        main.cached_comp_analysis(2020, 'Honda', 'Accord', 'EX', mileage, 24000, 22000, 26000, 5)
+    assert len(main.comps_db) == 3
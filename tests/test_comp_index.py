@@ -0,0 +1,97 @@
+import main
+
+ORIGINS = [(33.75, -84.39), (40.75, -73.99), (89.6, 10.0), (12.0, 179.9), (0.0, 0.0)]
+
+
+def sale(rng, key, lat, lon):
+    return key, (rng.choice(['completed', 'active']), rng.uniform(9000, 40000), rng.randint(0, 150000),
+                 rng.randint(0, 90), 'auction', '', lat, lon, '2026-01-01')
+
+
+def scan_nearest(rows, mileage, origin, radius, band):
+    """Linear-scan reference: every row of the block, same ranking as CompIndex.nearest."""
+    rows = sorted(rows, key=lambda row: row[2])
+    hits = []
+    for position, row in enumerate(rows):
+        if abs(row[2] - mileage) > band:
+            continue
+        distance = None
+        if origin is not None:
+            if row[6] is None:
+                continue
+            distance = float(main.haversine_miles(*origin, row[6], row[7]))
+            if distance > radius:
+                continue
+        gap = abs(row[2] - mileage) / band
+        hits.append((gap + (distance / radius if origin is not None else 0), gap, position, row, distance))
+    hits.sort(key=lambda hit: hit[:3])
+    return [(row[0], row[2], None if d is None else int(round(d))) for *_, row, d in hits]
+
+
+def test_grid_search_matches_linear_scan(monkeypatch, rng):
+    key = (2020, 'honda', 'accord')
+    rows = []
+    for _ in range(4000):
+        if rng.random() < 0.1:
+            lat = lon = None
+        else:
+            lat0, lon0 = rng.choice(ORIGINS)
+            lat = max(-90.0, min(90.0, lat0 + rng.gauss(0, 3)))
+            lon = (lon0 + rng.gauss(0, 4) + 180) % 360 - 180
+        rows.append(sale(rng, key, lat, lon))
+    index = main.CompIndex(main.MemoryCompTable())
+    index.add_many(rows)
+
+    for _ in range(200):
+        origin = rng.choice(ORIGINS + [None])
+        monkeypatch.setattr(main, 'zip_location', lambda zip_code: origin)
+        mileage, radius, band = rng.randint(0, 150000), rng.choice([25, 150, 600]), rng.choice([5000, 15000])
+        completed, active = index.nearest(2020, 'Honda', 'Accord', mileage, '30301', radius=radius,
+                                          mileage_band=band, completed_limit=10 ** 6, active_limit=10 ** 6)
+        expected = scan_nearest([row for _, row in rows], mileage, origin, radius, band)
+        assert [(c['mileage'], c['distance_miles']) for c in completed] == \
+            [(m, d) for kind, m, d in expected if kind == 'completed']
+        assert [(c['mileage'], c['distance_miles']) for c in active] == \
+            [(m, d) for kind, m, d in expected if kind == 'active']
+
+
+def test_ingest_only_invalidates_its_block(rng):
+    accord, civic = (2020, 'honda', 'accord'), (2020, 'honda', 'civic')
+    accord_key = main.comp_cache_key(2020, 'Honda', 'Accord', '', 30000, 24000, 0, 0, 3)
+    civic_key = main.comp_cache_key(2020, 'Honda', 'Civic', '', 30000, 24000, 0, 0, 3)
+
+    main.comp_index.add_many([sale(rng, accord, 33.7, -84.4)])
+
+    assert main.comp_index.version(accord) == 1 and main.comp_index.version(civic) == 0
+    assert main.comp_cache_key(2020, 'Honda', 'Accord', '', 30000, 24000, 0, 0, 3) != accord_key
+    assert main.comp_cache_key(2020, 'Honda', 'Civic', '', 30000, 24000, 0, 0, 3) == civic_key
+
+
+GAZETTEER = ('GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG                 \n'
+             '30303\t1\t0\t0\t0\t33.752879\t-84.392357   \n'
+             '10001\t1\t0\t0\t0\t40.750649\t-73.997298   \n')
+
+
+def test_discover_needs_centroids_for_zip_searches(monkeypatch, tmp_path, client, rng):
+    main.zip_centroids.cache_clear()
+    monkeypatch.setattr(main, 'comp_fetcher', main.CompFetcher([]))
+    monkeypatch.setattr(main, 'comp_index', main.CompIndex(main.MemoryCompTable()))
+    body = {'year': 2020, 'make': 'Honda', 'model': 'Accord', 'mileage': 40000, 'list_price': 24000}
+    assert client.post('/api/comps/discover', json=body).status_code == 200
+    response = client.post('/api/comps/discover', json=dict(body, zip_code='30303'))
+    assert response.status_code == 400
+    assert 'ZIP_CENTROIDS_PATH' in response.get_json()['error']
+
+    path = tmp_path / '2023_Gaz_zcta_national.txt'
+    path.write_text(GAZETTEER)
+    monkeypatch.setattr(main, 'ZIP_CENTROIDS_PATH', str(path))
+    main.zip_centroids.cache_clear()
+    try:
+        assert main.zip_location('30303') == (33.752879, -84.392357)
+        main.comp_index.add_many([sale(rng, (2020, 'honda', 'accord'), 33.75 + rng.gauss(0, 0.3), -84.39)
+                                  for _ in range(40)])
+        comps = client.post('/api/comps/discover', json=dict(body, zip_code='30303')).get_json()['comp_analysis']
+        assert comps['completed_sales'] and all(s['distance_miles'] is not None for s in comps['completed_sales'])
+        assert client.post('/api/comps/discover', json=dict(body, zip_code='99999')).status_code == 400
+    finally:
+        main.zip_centroids.cache_clear()
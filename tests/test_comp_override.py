@@ -0,0 +1,34 @@
+import json
+
+import main
+
+
+def test_bulk_override_matches_single_vehicle_path(client, vehicles, rng):
+    banded = [v for v in vehicles if v['comp_low'] and v['comp_high']][:15]
+    main.vehicles_db.put_many(banded)
+    rows, manual = [], {}
+    for vehicle in banded:
+        midpoint = (vehicle['comp_low'] + vehicle['comp_high']) / 2
+        comps = [{'price': round(midpoint * rng.uniform(0.7, 1.3)), 'days_to_sale': rng.randint(5, 60)}
+                 for _ in range(rng.randint(1, 6))]
+        manual[vehicle['id']] = comps
+        rows.extend(dict(comp, vehicle_id=vehicle['id']) for comp in comps)
+    rng.shuffle(rows)
+    rows.append({'vehicle_id': 'no-such-vehicle', 'price': 1000})
+
+    body = '\n'.join(map(json.dumps, rows))
+    result = client.post('/api/comps/override', data=body, content_type='application/x-ndjson').get_json()
+
+    assert result['errors'] == [{'vehicle_id': 'no-such-vehicle', 'error': 'Vehicle not found'}]
+    assert len(result['results']) == len(banded)
+    for entry in result['results']:
+        vehicle = next(v for v in banded if v['id'] == entry['vehicle_id'])
+        auto = {'median_sale_price': (vehicle['comp_low'] + vehicle['comp_high']) / 2}
+        single = client.post('/api/comps/override', json={
+            'manual_comps': manual[vehicle['id']], 'auto_comps': auto
+        }).get_json()
+        assert entry['comparison'] == single['comparison']
+
+        stored = main.vehicles_db[vehicle['id']]
+        assert (stored['comp_low'], stored['comp_high']) == (entry['comp_low'], entry['comp_high'])
+        assert dict(stored, comp_low=0, comp_high=0) == dict(vehicle, comp_low=0, comp_high=0)
@@ -0,0 +1,45 @@
+import socket
+
+import main
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_provider_outage_is_not_cached(monkeypatch):
+    dead = main.HTTPCompProvider('auction', 'completed', f'http://127.0.0.1:{closed_port()}/comps', timeout=1)
+    monkeypatch.setattr(main, 'comp_fetcher', main.CompFetcher([dead]))
+    analysis = main.cached_comp_analysis(2020, 'Honda', 'Accord', 'EX', 30000, 24000, 22000, 26000, 5)
+
+    assert analysis['sources'][0]['error']
+    assert 'Live — 0/1' in analysis['data_freshness']
+    assert len(main.comps_db) == 0
+
+
+def test_stub_providers_are_cached(monkeypatch):
+    monkeypatch.setattr(main, 'comp_fetcher', main.CompFetcher(main.configure_comp_providers('stub')))
+    first = main.cached_comp_analysis(2021, 'Ford', 'F-150', 'XLT', 41000, 39000, 36000, 42000, 8)
+    second = main.cached_comp_analysis(2021, 'Ford', 'F-150', 'XLT', 41000, 39000, 36000, 42000, 8)
+
+    assert not any(s['error'] for s in first['sources'])
+    assert len(main.comps_db) == 1
+    assert second == first
+
+
+def test_close_releases_session_and_loop(monkeypatch):
+    fetcher = main.CompFetcher(main.configure_comp_providers('stub'))
+    monkeypatch.setattr(main, 'comp_fetcher', fetcher)
+    main.cached_comp_analysis(2019, 'Toyota', 'Camry', 'SE', 52000, 19000, 17000, 21000, 4)
+    session, loop, thread = fetcher._session, fetcher._loop, fetcher._thread
+
+    main.close_comp_fetchers()
+
+    assert session.closed
+    assert loop.is_closed()
+    assert not thread.is_alive()
+    assert fetcher not in main._running_comp_fetchers
+    assert main.cached_comp_analysis(2019, 'Toyota', 'Camry', 'SE', 52000, 19000, 17000, 21000, 5)['sources']
+    fetcher.close()
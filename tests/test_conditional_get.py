@@ -0,0 +1,82 @@
+import gzip
+import json
+import threading
+
+import main
+
+
+def uncached(view, **kwargs):
+    """Body of the undecorated view: the path every request took before @versioned."""
+    with main.app.test_request_context():
+        return json.loads(main.app.make_response(view.__wrapped__(**kwargs)).get_data())
+
+
+def test_cached_bodies_match_the_view(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:20])
+    for vehicle in vehicles[:20]:
+        first = client.get(f"/api/vehicles/{vehicle['id']}")
+        again = client.get(f"/api/vehicles/{vehicle['id']}")
+        assert first.get_json() == again.get_json() == uncached(main.get_vehicle, vehicle_id=vehicle['id'])
+        assert first.headers['ETag'] == again.headers['ETag']
+
+    report = main.build_report('r-1', vehicles[0], main.analyze_vehicle(vehicles[0]))
+    main.reports_db['r-1'] = report
+    response = client.get('/api/reports/r-1', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == uncached(main.get_report, report_id='r-1')
+
+
+def test_if_none_match_and_writes(client, vehicles):
+    vehicle = vehicles[0]
+    main.vehicles_db[vehicle['id']] = vehicle
+    url = f"/api/vehicles/{vehicle['id']}"
+    etag = client.get(url).headers['ETag'].strip('"')
+
+    not_modified = client.get(url, headers={'If-None-Match': f'"{etag}"'})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+
+    client.patch(url, json={'list_price': vehicle['list_price'] + 100})
+    changed = client.get(url, headers={'If-None-Match': f'"{etag}"'})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'].strip('"') != etag
+    assert changed.get_json() == uncached(main.get_vehicle, vehicle_id=vehicle['id'])
+    assert changed.get_json()['vehicle']['list_price'] == vehicle['list_price'] + 100
+
+
+def test_etag_names_the_content_coding(client, vehicles):
+    vehicle = vehicles[0]
+    main.reports_db['r-1'] = main.build_report('r-1', vehicle, main.analyze_vehicle(vehicle))
+    plain = client.get('/api/reports/r-1').headers['ETag']
+    zipped = client.get('/api/reports/r-1', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert plain != zipped
+    assert client.get('/api/reports/r-1', headers={'If-None-Match': zipped}).status_code == 200
+
+
+def test_missing_records_are_not_cached(client, vehicles):
+    vehicle = vehicles[0]
+    assert client.get(f"/api/vehicles/{vehicle['id']}").status_code == 404
+    main.vehicles_db[vehicle['id']] = vehicle
+    assert client.get(f"/api/vehicles/{vehicle['id']}").get_json() == {'vehicle': vehicle}
+
+
+def test_concurrent_requests_count_every_hit(vehicles):
+    vehicle = vehicles[0]
+    main.reports_db['r-1'] = main.build_report('r-1', vehicle, main.analyze_vehicle(vehicle))
+    before = dict(main.response_cache_stats)
+    bodies = []
+
+    def fetch():
+        client = main.app.test_client()
+        for _ in range(25):
+            bodies.append(client.get('/api/reports/r-1', headers={'Accept-Encoding': 'gzip'}).data)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    served = sum(main.response_cache_stats[k] - before[k] for k in ('hits', 'misses'))
+    assert served == len(bodies) == 200
+    assert len(set(bodies)) == 1
@@ -0,0 +1,55 @@
+import main
+
+
+def scalar_summary(vehicles):
+    """The original full-scan dashboard computation."""
+    active = [v for v in vehicles if v.get('status') == 'active']
+    total_invested = sum(v['acquisition_cost'] + v['recon_cost'] for v in active)
+    total_list = sum(v['list_price'] for v in active)
+    avg_days = sum(v['days_in_inventory'] for v in active) / len(active) if active else 0
+    daily_burn = sum((v['acquisition_cost'] + v['recon_cost']) * v['floorplan_rate'] / 100 / 365 for v in active)
+    return {
+        'total_vehicles': len(active),
+        'total_invested': round(total_invested),
+        'total_list_value': round(total_list),
+        'total_potential_gross': round(total_list - total_invested),
+        'avg_days_in_inventory': round(avg_days),
+        'daily_floorplan_burn': round(daily_burn, 2),
+        'monthly_floorplan_burn': round(daily_burn * 30),
+        'aging_breakdown': {
+            'healthy': len([v for v in active if v['days_in_inventory'] <= 30]),
+            'at_risk': len([v for v in active if 30 < v['days_in_inventory'] <= 60]),
+            'danger': len([v for v in active if v['days_in_inventory'] > 60]),
+        }
+    }
+
+
+def test_summary_tracks_writes(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:150])
+    for vehicle in vehicles[:20]:
+        client.patch(f"/api/vehicles/{vehicle['id']}", json={'status': 'sold'})
+    for vehicle in vehicles[20:30]:
+        client.delete(f"/api/vehicles/{vehicle['id']}")
+    for vehicle in vehicles[30:60]:
+        client.patch(f"/api/vehicles/{vehicle['id']}", json={'days_in_inventory': 45, 'list_price': 31000})
+
+    summary = client.get('/api/dashboard/summary').get_json()['summary']
+    assert summary == scalar_summary(main.vehicles_db.values())
+
+
+def test_summary_read_is_side_effect_free(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:10])
+    main.meta_db['aging_clock'] = {'id': 'aging_clock', 'as_of': '2000-01-01'}
+    version = main.vehicles_db.collection_version()
+
+    first = client.get('/api/dashboard/summary')
+    again = client.get('/api/dashboard/summary', headers={'If-None-Match': first.headers['ETag']})
+
+    assert again.status_code == 304
+    assert main.vehicles_db.collection_version() == version
+    assert main.meta_db['aging_clock']['as_of'] == '2000-01-01'
+
+    client.patch(f"/api/vehicles/{vehicles[0]['id']}", json={'days_in_inventory': 99})
+    changed = client.get('/api/dashboard/summary', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.get_json()['summary'] == scalar_summary(main.vehicles_db.values())
@@ -0,0 +1,36 @@
+import re
+
+import main
+
+
+def scalar_identify(text):
+    """The original keyword loops over the same tables."""
+    detected_make = detected_model = None
+    make_confidence = 0
+    for make, keywords in main.VEHICLE_MAKES.items():
+        for kw in keywords:
+            if kw in text:
+                if kw == make:
+                    if make_confidence < 90:
+                        detected_make, make_confidence = make, 90
+                elif make_confidence < 85:
+                    detected_make, detected_model, make_confidence = make, kw, 85
+    trim = next((label for kw, label in main.TRIM_KEYWORDS.items()
+                 if re.search(r'\b' + re.escape(kw) + r'\b', text)), None)
+    body = None
+    for style, keywords in main.BODY_STYLES.items():
+        if any(kw in text for kw in keywords):
+            body = style
+    color = next((c.title() for c in main.VEHICLE_COLORS if c in text), None)
+    return {'make': detected_make, 'model': detected_model, 'make_confidence': make_confidence,
+            'trim': trim, 'body_style': body, 'color': color}
+
+
+def test_single_pass_matches_keyword_loops(rng):
+    vocabulary = sorted({kw for kws in main.VEHICLE_MAKES.values() for kw in kws} | set(main.TRIM_KEYWORDS)
+                        | {kw for kws in main.BODY_STYLES.values() for kw in kws} | set(main.VEHICLE_COLORS))
+    noise = ['', ' ', '-', '/', '.', 'x', '2019', 'clean title', 'awd', 'https://cars.example.com/']
+    for _ in range(3000):
+        parts = [rng.choice(vocabulary if rng.random() < 0.7 else noise) for _ in range(rng.randint(0, 8))]
+        text = ''.join(part + rng.choice(['', ' ', ' ', '-', ', ']) for part in parts)
+        assert main.vehicle_text_matcher.identify(text) == scalar_identify(text), text
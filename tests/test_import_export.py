@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+import main
+
+RAW_FIELDS = ('year', 'make', 'model', 'trim', 'mileage', 'acquisition_cost', 'list_price', 'days_in_inventory')
+
+
+def without_identity(vehicle):
+    return {k: v for k, v in vehicle.items() if k not in ('id', 'created_at')}
+
+
+@pytest.mark.parametrize('fmt, mimetype', [('ndjson', 'application/x-ndjson'), ('csv', 'text/csv')])
+def test_export_then_import_round_trips(client, vehicles, fmt, mimetype):
+    main.vehicles_db.put_many(vehicles)
+    client.patch(f"/api/vehicles/{vehicles[0]['id']}", json={'status': 'sold'})
+    before = sorted(main.vehicles_db.values(), key=lambda v: v['id'])
+
+    body = client.get('/api/vehicles/export', query_string={'format': fmt}).get_data()
+    main.vehicles_db.clear()
+    result = client.post('/api/vehicles/import', data=body, content_type=mimetype).get_json()
+
+    assert (result['imported'], result['errors']) == (len(vehicles), [])
+    assert sorted(main.vehicles_db.values(), key=lambda v: v['id']) == before
+
+
+def test_import_matches_single_create(client, vehicles):
+    rows = [{field: v[field] for field in RAW_FIELDS} for v in vehicles[:30]]
+    body = '\n'.join(map(json.dumps, rows[:10] + [{'make': 'Honda'}] + rows[10:]))
+    result = client.post('/api/vehicles/import', data=body, content_type='application/x-ndjson').get_json()
+    assert result['imported'] == 30
+    assert result['errors'] == [{'index': 10, 'error': 'Missing required field: year'}]
+
+    imported = sorted(main.vehicles_db.values(), key=lambda v: (v['mileage'], v['list_price']))
+    main.vehicles_db.clear()
+    for row in rows:
+        client.post('/api/vehicles', json=row)
+    created = sorted(main.vehicles_db.values(), key=lambda v: (v['mileage'], v['list_price']))
+    assert list(map(without_identity, imported)) == list(map(without_identity, created))
@@ -0,0 +1,34 @@
+import main
+
+CHANGES = {
+    'views_7': lambda rng: rng.randint(0, 300), 'leads_7': lambda rng: rng.randint(0, 10),
+    'test_drives_7': lambda rng: rng.randint(0, 5), 'list_price': lambda rng: rng.uniform(15000, 60000),
+    'days_in_inventory': lambda rng: rng.randint(0, 150), 'competing_units': lambda rng: rng.randint(0, 30),
+    'demand_signal': lambda rng: rng.choice(['high', 'soft', 'normal']), 'floorplan_rate': lambda rng: rng.uniform(0, 12),
+}
+
+
+def comparable(analysis):
+    summary = {k: v for k, v in analysis['summary'].items() if k != 'generated_at'}
+    return dict(analysis, summary=summary)
+
+
+def test_incremental_reanalysis_matches_full_run(vehicles, rng):
+    main.analysis_section_cache.clear()
+    hits = main.analysis_cache_stats['hits']
+    for vehicle in vehicles[:100]:
+        main.analyze_vehicle(vehicle)
+        fields = rng.sample(sorted(CHANGES), rng.randint(1, 2))
+        vehicle = main.build_vehicle_record(vehicle['id'], dict(vehicle, **{f: CHANGES[f](rng) for f in fields}))
+        incremental = main.analyze_vehicle(vehicle)
+        full = main.analyze_vehicle(dict(vehicle, id=None))
+        assert comparable(incremental) == comparable(full), fields
+    assert main.analysis_cache_stats['hits'] > hits
+
+
+def test_deleted_vehicle_drops_its_sections(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:1])
+    client.post(f"/api/vehicles/{vehicles[0]['id']}/analyze")
+    assert vehicles[0]['id'] in main.analysis_section_cache
+    client.delete(f"/api/vehicles/{vehicles[0]['id']}")
+    assert vehicles[0]['id'] not in main.analysis_section_cache
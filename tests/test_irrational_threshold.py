@@ -0,0 +1,49 @@
+import main
+
+
+def scan_irrational_day(di, daily_floorplan, potential_gross, prob30, wholesale_price, total_invested, wholesale_net_today):
+    """The original 150-day linear scan."""
+    irrational_day = di
+    for day in range(di, di + 150):
+        fp = daily_floorplan * day
+        retail_net = (potential_gross - fp) - 750
+        day_prob = main.clamp(prob30 * (0.98 ** (day - di)), 0.05, 0.95)
+        ws_at_day = wholesale_price - total_invested - fp
+        if retail_net * day_prob < max(ws_at_day, wholesale_net_today) or retail_net < 0:
+            return day
+        irrational_day = day
+    return irrational_day
+
+
+def test_solvers_match_linear_scan(vehicles, rng):
+    # Push some vehicles to thin margins so the crossing lands mid-horizon
+    lot = vehicles + [dict(v, list_price=v['acquisition_cost'] + v['recon_cost'] + rng.uniform(800, 6000),
+                           floorplan_rate=rng.uniform(5, 30)) for v in vehicles]
+    c = main.vehicle_columns(lot)
+    core = main.batch_analysis_core(c)
+    batch = main.batch_irrational_days(c, core, chunk_size=64).tolist()
+    days = set()
+    for i in range(len(lot)):
+        args = (int(c['days_in_inventory'][i]), float(core['daily_floorplan'][i]), float(core['potential_gross'][i]),
+                float(core['prob30'][i]), float(c['wholesale_price'][i]), float(core['total_invested'][i]),
+                float(core['wholesale_net_today'][i]))
+        expected = scan_irrational_day(*args)
+        assert main.solve_irrational_day(*args) == expected
+        assert batch[i] == expected
+        days.add(expected - args[0])
+    assert len(days) > 10  # crossings spread over the horizon, not just day 0
+
+
+def test_threshold_endpoint_reports_malformed_rows(client, vehicles):
+    good = {k: v for k, v in vehicles[0].items() if k != 'id'}
+    response = client.post('/api/threshold', json={'vehicles': [dict(good, floorplan_rate='x'), good]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['errors'] == [{'index': 0, 'error': body['errors'][0]['error']}]
+    assert body['errors'][0]['error'].startswith('Invalid vehicle')
+    expected = main.analyze_vehicle(dict(good, id=None))['aging']['irrationality_threshold']
+    assert [(r['irrationality_day'], r['days_remaining']) for r in body['results']] == [
+        (expected['day'], expected['days_remaining'])]
+
+    assert client.post('/api/threshold', json={'vehicles': 'x'}).status_code == 400
+    assert client.post('/api/threshold', json=[good]).status_code == 400
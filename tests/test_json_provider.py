@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import main
+
+
+def flask_dumps(obj):
+    """What Flask's default provider sends for a non-debug response."""
+    return DefaultJSONProvider(main.app).dumps(obj, separators=(',', ':'))
+
+
+def without_timestamp(analysis):
+    summary = {k: v for k, v in analysis['summary'].items() if k != 'generated_at'}
+    return dict(analysis, summary=summary)
+
+
+def payloads(vehicles):
+    for vehicle in vehicles[:30]:
+        analysis = main.analyze_vehicle(vehicle)
+        yield {'vehicle': vehicle, 'analysis': analysis}
+        yield main.build_report('r-' + vehicle['id'], vehicle, analysis)
+    yield {'deep': {'nested': {'analysis': main.analyze_vehicle(vehicles[0])}}, 'n': [1, 2.5, None, 'é']}
+
+
+def test_stdlib_encoding_matches_flask(vehicles):
+    provider = main.ResponseJSONProvider(main.app, 'stdlib')
+    for payload in payloads(vehicles):
+        expected = flask_dumps(payload)
+        assert provider.encode_response(payload).decode() == expected
+        assert provider.encode_response(payload).decode() == expected  # sections now pre-encoded
+
+
+def test_orjson_encoding_matches_flask(vehicles):
+    pytest.importorskip('orjson')
+    provider = main.ResponseJSONProvider(main.app, 'orjson')
+    for payload in payloads(vehicles):
+        expected = json.loads(flask_dumps(payload))
+        assert json.loads(provider.encode_response(payload)) == expected
+        assert json.loads(provider.encode_response(payload)) == expected
+
+
+def test_large_responses_are_gzipped(client, vehicles):
+    vehicle = dict(vehicles[0], id=None)
+    plain = client.post('/api/analyze', json=vehicle)
+    zipped = client.post('/api/analyze', json=vehicle, headers={'Accept-Encoding': 'gzip'})
+    assert len(plain.data) >= main.COMPRESS_MIN_BYTES
+    assert 'Content-Encoding' not in plain.headers
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    body = json.loads(gzip.decompress(zipped.data))
+    assert without_timestamp(body['report']['analysis']) == without_timestamp(plain.get_json()['report']['analysis'])
+
+
+def test_small_responses_stay_plain(client):
+    response = client.post('/api/analyze', json={}, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 400
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'error': 'No data provided'}
@@ -0,0 +1,35 @@
+import main
+
+
+def test_report_filters_match_full_scan(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:60])
+    for vehicle in vehicles[:60]:
+        client.post(f"/api/vehicles/{vehicle['id']}/analyze")
+    reports = client.get('/api/reports').get_json()['reports']
+    assert len(reports) == 60
+
+    for zone, stored in (('healthy', 'HEALTHY'), ('at_risk', 'AT-RISK'), ('AT-RISK', 'AT-RISK'), ('danger', 'DANGER')):
+        page = client.get('/api/reports', query_string={'zone': zone, 'fields': 'summary'}).get_json()
+        expected = [r['id'] for r in reports if r['analysis']['summary']['aging_zone'] == stored]
+        assert [r['id'] for r in page['reports']] == expected
+        assert all(list(r['analysis']) == ['summary'] for r in page['reports'])
+
+
+def test_keyset_pages_cover_the_full_list(client, vehicles):
+    main.vehicles_db.put_many(vehicles)
+    everything = client.get('/api/vehicles').get_json()['vehicles']
+    seen, after = [], None
+    while True:
+        page = client.get('/api/vehicles', query_string={'limit': 17, **({'after': after} if after else {})}).get_json()
+        seen.extend(page['vehicles'])
+        after = page['next_cursor']
+        if not after:
+            break
+    assert seen == everything
+
+
+def test_unknown_zone_is_rejected(client):
+    for path in ('/api/vehicles', '/api/reports'):
+        response = client.get(path, query_string={'zone': 'purple'})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'zone must be healthy, at_risk or danger'
@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+
+import main
+
+
+def scalar_paths(rng, params, paths):
+    """Path-by-path reference for simulate_paths, consuming the same draws."""
+    n = len(params['cdf'])
+    u = rng.random((n, paths))
+    list_price = params['list_price'][:, None]
+    transaction = rng.uniform(list_price - 1000, list_price - 500, size=(n, paths))
+    out = []
+    for i in range(n):
+        cdf, tail_days, hazard = params['cdf'][i].tolist(), int(params['tail_days'][i]), params['tail_hazard'][i]
+        start, di = int(params['tail_start'][i]), int(params['days_in_inventory'][i])
+        for j in range(paths):
+            day = next((d + 1 for d, c in enumerate(cdf) if u[i, j] < c), None)
+            if day is None:
+                v = (u[i, j] - cdf[-1]) / (1 - cdf[-1])
+                k = math.floor(math.log1p(-v) / math.log1p(-hazard)) + 1
+                day = start + k if k <= tail_days else None
+            sold = day is not None
+            day = day if sold else start + tail_days + main.WHOLESALE_EXIT_DAYS
+            floorplan = params['daily_floorplan'][i] * day
+            proceeds = transaction[i, j] if sold else params['wholesale_price'][i]
+            out.append((day - di, proceeds - params['total_invested'][i] - floorplan, sold))
+    return out
+
+
+def test_vectorized_paths_match_scalar(vehicles):
+    lot = vehicles[:30] + [dict(vehicles[0], days_in_inventory=di) for di in (75, 90, 140)]
+    params = main.sale_timing_params(lot)
+    days, gross, _, sold = main.simulate_paths(np.random.default_rng(11), params, 40)
+    expected = scalar_paths(np.random.default_rng(11), params, 40)
+    assert list(zip(days.ravel().tolist(), sold.ravel().tolist())) == [(d, s) for d, _, s in expected]
+    assert np.allclose(gross.ravel(), [g for _, g, _ in expected])
+
+
+def test_aged_vehicle_still_retails_at_its_30_day_rate(vehicles):
+    aged = dict(vehicles[0], days_in_inventory=150)
+    params = main.sale_timing_params([aged])
+    days, _, _, sold = main.simulate_paths(np.random.default_rng(5), params, 200000)
+    prob30 = main.batch_analysis_core(main.vehicle_columns([aged]))['prob30'][0]
+    assert abs(sold.mean() - prob30) < 0.005
+    assert days[sold].max() <= main.MONTE_CARLO_MIN_WINDOW_DAYS
+    assert (days[~sold] == main.MONTE_CARLO_MIN_WINDOW_DAYS + main.WHOLESALE_EXIT_DAYS).all()
+
+
+def test_seed_replays_across_worker_counts(monkeypatch, client, vehicles):
+    main.vehicles_db.put_many(vehicles[:5])
+    body = {'vehicle_id': vehicles[0]['id'], 'paths': 60000, 'seed': 99}
+    monkeypatch.setattr(main, 'WORKER_PROCESSES', 1)
+    inline = client.post('/api/simulate/sale-timing', json=body).get_json()
+    monkeypatch.setattr(main, 'WORKER_PROCESSES', 2)
+    pooled = client.post('/api/simulate/sale-timing', json=body).get_json()
+    assert inline == pooled
@@ -0,0 +1,84 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+def today():
+    return datetime.utcnow().date().isoformat()
+
+
+def without_timestamp(analysis):
+    """Copy of an analysis minus summary.generated_at; cached sections are never mutated."""
+    summary = {k: v for k, v in analysis['summary'].items() if k != 'generated_at'}
+    return dict(analysis, summary=summary)
+
+
+def test_failed_run_is_reclaimed():
+    main.meta_db['nightly_run'] = {'id': 'nightly_run', 'date': today(), 'status': 'failed', 'started_ts': 0}
+    assert main.claim_nightly_run(today())['status'] == 'running'
+
+    main.meta_db['nightly_run'] = dict(main.meta_db['nightly_run'], status='done')
+    assert main.claim_nightly_run(today()) is None
+
+
+def test_failing_run_backs_off_then_gives_up(monkeypatch):
+    def broken():
+        raise OSError('disk full')
+    monkeypatch.setattr(main, 'roll_forward_aging', broken)
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, 'time', lambda: clock[0])
+
+    delays = []
+    for attempt in range(1, main.NIGHTLY_MAX_ATTEMPTS + 1):
+        with pytest.raises(OSError):
+            main.run_nightly_rescore()
+        run = main.meta_db['nightly_run']
+        assert (run['status'], run['attempts']) == ('failed', attempt)
+        assert main.run_nightly_rescore() is None  # not due yet
+        if run['retry_ts'] is None:
+            break
+        delays.append(run['retry_ts'] - clock[0])
+        clock[0] = run['retry_ts']
+    assert delays == [main.NIGHTLY_RETRY_BASE_SECONDS * 2 ** k for k in range(main.NIGHTLY_MAX_ATTEMPTS - 1)]
+
+    clock[0] += 86400
+    assert main.claim_nightly_run(today()) is None  # given up until the date changes
+    assert main.claim_nightly_run('2999-01-01')['attempts'] == 1
+
+
+def test_rescore_from_thread_matches_inline(monkeypatch, vehicles):
+    active = vehicles[:40]
+    main.vehicles_db.put_many(active)
+    monkeypatch.setattr(main, 'WORKER_PROCESSES', 2)
+    monkeypatch.setattr(main, 'RESCORE_CHUNK_SIZE', 10)
+    runs = []
+    thread = threading.Thread(target=lambda: runs.append(main.run_nightly_rescore(force=True)))
+    thread.start()
+    thread.join(120)
+    assert not thread.is_alive()
+    assert runs[0]['status'] == 'done'
+
+    for vehicle in active:
+        stored = main.vehicles_db[vehicle['id']]
+        report = main.reports_db[f"nightly-{vehicle['id']}"]
+        inline = main.build_report(report['id'], stored, main.analyze_vehicle(stored))
+        assert without_timestamp(report['analysis']) == without_timestamp(inline['analysis'])
+
+
+def test_post_hands_the_run_to_the_scheduler(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:20])
+    response = client.post('/api/jobs/nightly/run?force=true')
+    assert response.status_code == 202
+    assert response.get_json()['last_run']['status'] == 'running'
+    assert main._scheduler['thread'].is_alive()
+
+    deadline = time.time() + 120
+    while main.meta_db['nightly_run']['status'] == 'running' and time.time() < deadline:
+        time.sleep(0.05)
+    run = main.meta_db['nightly_run']
+    assert (run['status'], run['reports']) == ('done', 20)
+    assert client.post('/api/jobs/nightly/run').status_code == 409
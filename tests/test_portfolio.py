@@ -0,0 +1,73 @@
+import itertools
+
+import numpy as np
+
+import main
+
+
+def brute_force(gross, cost, budget, cap):
+    """Best total gross over every plan that fits the budget and lane, or None."""
+    n, k = gross.shape
+    best = None
+    for plan in itertools.product(range(k), repeat=n):
+        plan = np.array(plan)
+        if cost[np.arange(n), plan].sum() <= budget and (plan == k - 1).sum() <= cap:
+            total = gross[np.arange(n), plan].sum()
+            best = total if best is None else max(best, total)
+    return best
+
+
+def random_instance(rng):
+    n = int(rng.integers(2, 6))
+    gross = rng.normal(0, 100, (n, 4))
+    cost = np.abs(rng.normal(50, 30, (n, 4)))
+    cost[:, 3] = rng.uniform(0, 20, n)
+    budget = float(cost.min(axis=1).sum() + rng.uniform(0, 1) * cost.sum() / 3)
+    return gross, cost, budget, int(rng.integers(0, n))
+
+
+def test_unbounded_budget_is_optimal():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        gross, cost, _, cap = random_instance(rng)
+        choice, status = main.solve_portfolio(gross, cost, float('inf'), cap)
+        assert status == 'feasible'
+        assert np.isclose(gross[np.arange(len(gross)), choice].sum(), brute_force(gross, cost, float('inf'), cap))
+
+
+def test_constrained_plans_are_feasible_and_leave_no_improving_move():
+    rng = np.random.default_rng(6)
+    for _ in range(200):
+        gross, cost, budget, cap = random_instance(rng)
+        n, wholesale = len(gross), 3
+        choice, status = main.solve_portfolio(gross, cost, budget, cap)
+        optimum = brute_force(gross, cost, budget, cap)
+        assert (status == 'feasible') == (optimum is not None)
+        assert (choice == wholesale).sum() <= cap
+        if optimum is None:
+            continue
+        spent = cost[np.arange(n), choice].sum()
+        lane_free = (choice == wholesale).sum() < cap
+        assert spent <= budget
+        for i, option in itertools.product(range(n), range(4)):
+            fits = spent - cost[i, choice[i]] + cost[i, option] <= budget
+            allowed = option != wholesale or choice[i] == wholesale or lane_free
+            assert not (gross[i, option] > gross[i, choice[i]] and fits and allowed)
+
+
+def test_endpoint_checks_targets_and_limits(client, vehicles):
+    main.vehicles_db.put_many(vehicles[:20])
+    url = '/api/optimize/portfolio'
+    plain = client.post(url, json={}).get_json()
+    assert plain['status'] == 'feasible'
+    best = plain['totals']['expected_gross']
+
+    reachable = client.post(url, json={'gross_target': best - 1}).get_json()
+    assert (reachable['status'], reachable['totals']['meets_gross_target']) == ('feasible', True)
+    missed = client.post(url, json={'gross_target': 1e9}).get_json()
+    assert (missed['status'], missed['totals']['meets_gross_target']) == ('gross_infeasible', False)
+    assert missed['decisions'] == plain['decisions']
+
+    for body in ({'wholesale_units_per_week': -3}, {'floorplan_budget': -1}, {'gross_target': 'lots'}):
+        assert client.post(url, json=body).status_code == 400, body
+    assert client.post(url, json={'wholesale_units_per_week': 0}).get_json()['totals']['wholesale_units'] == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import main
+
+
+def scalar_sweep(vehicle, prices):
+    """One analyze_vehicle call per candidate price."""
+    rows = []
+    for price in prices:
+        analysis = main.analyze_vehicle(dict(vehicle, list_price=float(price), id=None))
+        fin = analysis['financials']
+        expected_gross = (price - 750) - fin['total_invested'] - fin['daily_floorplan_cost'] * 20
+        rows.append({
+            'percentile': analysis['market_position']['percentile'],
+            'prob_30_day': analysis['sale_probability']['prob_30_day'],
+            'prob_60_day': analysis['sale_probability']['prob_60_day'],
+            'prob_90_day': analysis['sale_probability']['prob_90_day'],
+            'irrationality_day': analysis['aging']['irrationality_threshold']['day'],
+            'days_remaining': analysis['aging']['irrationality_threshold']['days_remaining'],
+            'expected_gross': expected_gross,
+            'wholesale_net_today': fin['wholesale_net_today'],
+        })
+    return rows
+
+
+def test_sweep_matches_analyze_vehicle_per_price(vehicles):
+    for vehicle in vehicles[:30]:
+        prices = np.linspace(vehicle['list_price'] * 0.8, vehicle['list_price'] * 1.2, 7)
+        sweep = main.price_sweep(vehicle, prices)
+        expected = scalar_sweep(vehicle, prices)
+        assert sweep['count'] == len(prices)
+        assert sweep['wholesale_net_today'] == expected[0]['wholesale_net_today']
+        for i, row in enumerate(expected):
+            for column in ('percentile', 'prob_30_day', 'prob_60_day', 'prob_90_day',
+                           'irrationality_day', 'days_remaining'):
+                assert sweep['sweep'][column][i] == row[column], (column, i)
+            assert sweep['sweep']['expected_gross'][i] == pytest.approx(row['expected_gross'], abs=0.5)
+        weighted = sweep['sweep']['prob_weighted_gross']
+        assert sweep['best']['prob_weighted_gross'] == max(weighted)
+        assert sweep['best']['price'] == sweep['sweep']['price'][weighted.index(max(weighted))]
+        assert sweep['best']['beats_wholesale'] == (max(weighted) > sweep['wholesale_net_today'])
+
+
+def test_endpoint_accepts_stored_and_inline_vehicles(client, vehicles):
+    vehicle = vehicles[0]
+    main.vehicles_db[vehicle['id']] = vehicle
+    prices = [vehicle['list_price'] * 0.9, vehicle['list_price'], vehicle['list_price'] * 1.1]
+    stored = client.post('/api/simulate/price-sweep', json={'vehicle_id': vehicle['id'], 'prices': prices})
+    inline = client.post('/api/simulate/price-sweep', json={'vehicle': dict(vehicle), 'prices': prices})
+    assert stored.status_code == inline.status_code == 200
+    body = stored.get_json()
+    assert body['sweep'] == inline.get_json()['sweep']
+    assert body['sweep'] == main.price_sweep(vehicle, np.array(prices))['sweep']
+    assert body['current_list_price'] == vehicle['list_price']
+
+
+def test_endpoint_rejects_bad_grids(client, vehicles):
+    vehicle = vehicles[0]
+    main.vehicles_db[vehicle['id']] = vehicle
+    url = '/api/simulate/price-sweep'
+    assert client.post(url, json={}).status_code == 400
+    assert client.post(url, json={'vehicle_id': 'nope'}).status_code == 404
+    assert client.post(url, json={'vehicle_id': vehicle['id'], 'low': 10, 'high': 5}).status_code == 400
+    assert client.post(url, json={'vehicle_id': vehicle['id'], 'low': 5, 'high': 10, 'steps': 1}).status_code == 400
+    assert client.post(url, json={'vehicle_id': vehicle['id'], 'prices': ['x']}).status_code == 400
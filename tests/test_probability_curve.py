@@ -0,0 +1,79 @@
+import itertools
+import math
+
+import main
+
+# Composites are products of the sale-probability multipliers
+DEMAND, COMPETITION, AGING = (1.2, 0.75, 1.0), (1.3, 1.1, 0.9, 0.7), (1.2, 1.0, 0.85, 0.65, 0.45)
+ENGAGEMENT, PRICE = (1.2, 1.0, 0.8, 0.6), (0.7, 0.85, 1.0, 1.15, 1.25)
+
+
+def scalar_curve(prob30, prob60, prob90, current_day, composite_factor):
+    """The original day-by-day loop."""
+    curve, cumulative = [], 0
+    ramp_speed = 0.15 * min(composite_factor, 1.5)
+    peak_day = max(8, min(30, round(20 / max(composite_factor, 0.3))))
+    peak_height = min(0.045, 0.025 * composite_factor)
+    decay_rate = 0.02 + (0.01 * (1 / max(composite_factor, 0.3)))
+    for day in range(1, 91):
+        if day <= peak_day:
+            daily_prob = peak_height * (1 / (1 + math.exp(-ramp_speed * (day - peak_day * 0.6))))
+        else:
+            daily_prob = peak_height * math.exp(-decay_rate * (day - peak_day))
+        if day <= current_day:
+            daily_prob = 0
+        daily_prob = max(0, min(0.06, daily_prob))
+        conditional_daily = daily_prob * (1 - cumulative)
+        cumulative = min(0.98, cumulative + conditional_daily)
+        curve.append({'day': day, 'daily_probability': round(conditional_daily * 100, 2),
+                      'cumulative_probability': round(cumulative * 100, 1)})
+
+    cum_30, cum_60, cum_90 = (curve[d - 1]['cumulative_probability'] for d in (30, 60, 90))
+    if cum_90 > 0:
+        scale = prob90 * 100 / cum_90
+    elif cum_60 > 0:
+        scale = prob60 * 100 / cum_60
+    elif cum_30 > 0:
+        scale = prob30 * 100 / cum_30
+    else:
+        scale = 1
+    scaled_cum = 0
+    for point in curve:
+        scaled_daily = max(0, min(0.08, point['daily_probability'] / 100 * scale))
+        scaled_cum = min(0.98, scaled_cum + scaled_daily)
+        point['daily_probability'] = round(scaled_daily * 100, 2)
+        point['cumulative_probability'] = round(scaled_cum * 100, 1)
+    return curve
+
+
+def composites():
+    for factors in itertools.product(DEMAND, COMPETITION, AGING, ENGAGEMENT, PRICE):
+        yield math.prod(factors)
+
+
+def test_curve_matches_scalar_loop(rng):
+    for composite in rng.sample(sorted(set(composites())), 150):
+        prob30 = main.clamp(0.35 * composite, 0.05, 0.95)
+        prob60 = main.clamp(0.55 * composite * 1.1, 0.10, 0.97)
+        prob90 = main.clamp(0.72 * composite * 1.15, 0.20, 0.98)
+        for current_day in (0, 1, 17, 45, 89, 90, 120):
+            assert main.generate_daily_probability_curve(prob30, prob60, prob90, current_day, composite) == \
+                scalar_curve(prob30, prob60, prob90, current_day, composite)
+
+
+def test_cached_shapes_match_uncached_and_are_shared():
+    main.cached_curve_shape.cache_clear()
+    composite = 1.2 * 1.1 * 0.85 * 1.0 * 1.15
+    for current_day in (0, 30, 90, 91, 400):
+        curve = main.probability_curve_arrays(0.4, 0.6, 0.8, current_day, composite)
+        daily, milestones = main.probability_curve_shape(min(current_day, 90), composite)
+        cached_daily, cached_milestones = main.cached_curve_shape(composite, min(current_day, 90))
+        assert (cached_daily == daily).all() and cached_milestones == tuple(milestones.tolist())
+        assert main.generate_daily_probability_curve(0.4, 0.6, 0.8, current_day, composite) == \
+            scalar_curve(0.4, 0.6, 0.8, current_day, composite)
+        assert curve[1].tolist() == [p['daily_probability'] for p in scalar_curve(0.4, 0.6, 0.8, current_day, composite)]
+
+    info = main.cached_curve_shape.cache_info()
+    assert info.currsize == 3  # days 91 and 400 share the day-90 bucket
+    assert info.hits >= 2
+    assert not main.cached_curve_shape(composite, 30)[0].flags.writeable
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import main
+
+
+def plain(analysis):
+    return json.loads(json.dumps(analysis))
+
+
+@pytest.mark.parametrize('curve_format', ['records', 'arrays'])
+def test_reports_round_trip_through_the_codec(vehicles, curve_format):
+    for vehicle in vehicles[:40]:
+        report = plain(main.build_report('r-' + vehicle['id'], vehicle, main.analyze_vehicle(vehicle, curve_format)))
+        packed = main.pack_report(report)
+        assert packed[:1] == main.REPORT_FORMAT_V1
+        assert len(packed) < len(json.dumps(report)) / 4
+        assert main.unpack_report(packed) == report
+        assert main.unpack_report(json.dumps(report)) == report  # rows written before the codec
+
+
+def test_identical_curves_are_stored_once(vehicles):
+    vehicle = vehicles[0]
+    reports = [plain(main.build_report(f'r-{i}', vehicle, main.analyze_vehicle(dict(vehicle, id=None))))
+               for i in range(5)]
+    for report in reports:
+        main.reports_db[report['id']] = report
+    assert len(main.report_curves_db) == 1
+    assert [main.reports_db[report['id']] for report in reports] == reports
+
+
+def test_curves_that_do_not_pack_stay_inline():
+    days = list(range(1, 91))
+    odd = [{'day': d, 'daily_probability': 0.123456, 'cumulative_probability': 1.0} for d in days]
+    assert main.pack_curve(odd) is None
+    assert main.pack_curve([{'day': d, 'daily_probability': 1, 'cumulative_probability': 1.0} for d in days]) is None
+    report = {'id': 'x', 'analysis': {'sale_probability': {'daily_curve': odd}}}
+    assert main.unpack_report(main.pack_report(report)) == report
+
+
+def test_nightly_sweep_keeps_curve_count_flat(monkeypatch, vehicles):
+    monkeypatch.setattr(main, 'REPORT_CURVE_GRACE_SECONDS', 0)
+    monkeypatch.setattr(main, 'WORKER_PROCESSES', 1)
+    lot = vehicles[:50]
+    counts = []
+    for night in range(3):
+        main.vehicles_db.put_many([dict(v, days_in_inventory=v['days_in_inventory'] + night) for v in lot])
+        run = main.run_nightly_rescore(force=True)
+        assert run['status'] == 'done'
+        reports = main.reports_db.values()
+        assert len(reports) == 50
+        digests = {main.packed_curve(r['analysis']['sale_probability']['daily_curve'])[0] for r in reports}
+        assert set(main.report_curves_db) == digests
+        counts.append(len(main.report_curves_db))
+    assert max(counts) <= 50
+    assert run['curves_swept'] > 0
+
+
+def test_sweep_spares_recent_and_used_curves(vehicles):
+    for vehicle in vehicles[:3]:
+        main.reports_db['r-' + vehicle['id']] = main.build_report('r-' + vehicle['id'], vehicle, main.analyze_vehicle(vehicle))
+    del main.reports_db['r-' + vehicles[0]['id']]
+    stored = len(main.report_curves_db)
+    assert main.sweep_report_curves() == 0  # the orphan is still inside the grace window
+    assert len(main.report_curves_db) == stored
+
+    for digest in main.report_curves_db:
+        main.report_curves_db[digest] = dict(main.report_curves_db[digest], stored_ts=0)
+    assert main.sweep_report_curves() == stored - 2
+    assert [main.reports_db['r-' + v['id']]['vehicle_id'] for v in vehicles[1:3]] == [v['id'] for v in vehicles[1:3]]
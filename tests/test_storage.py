@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return main.ConnectionPool(str(tmp_path / 'test.db'))
+
+
+def filled(stores, vehicles):
+    for store in stores:
+        store.put_many(vehicles[:150])
+        for vehicle in vehicles[150:]:
+            store[vehicle['id']] = vehicle
+        for vehicle in vehicles[:20]:
+            del store[vehicle['id']]
+    return stores
+
+
+def test_sqlite_store_matches_memory_store(pool, vehicles):
+    memory, sqlite = filled((main.MemoryStore('vehicles'), main.SQLiteStore(pool, 'vehicles')), vehicles)
+    assert len(sqlite) == len(memory) == 180
+    assert sqlite[vehicles[50]['id']] == memory[vehicles[50]['id']]
+    for filters in ([], [('make', 'nocase', 'HONDA')], [('days_in_inventory', '>', 30), ('days_in_inventory', '<=', 60)]):
+        assert sqlite.scan(filters) == memory.scan(filters)
+        page = memory.scan(filters, limit=7)
+        after = (page[-1]['created_at'], page[-1]['id'])
+        assert sqlite.scan(filters, after=after, limit=7) == memory.scan(filters, after=after, limit=7)
+    assert sqlite.aggregates() == pytest.approx(memory.aggregates())
+
+
+def test_transaction_rolls_back_every_write(pool, vehicles):
+    store = main.SQLiteStore(pool, 'vehicles')
+    store.put_many(vehicles[:5])
+    with pytest.raises(RuntimeError):
+        with pool.transaction():
+            store[vehicles[0]['id']] = dict(vehicles[0], list_price=1)
+            with pool.transaction():  # nested calls join the outer transaction
+                del store[vehicles[1]['id']]
+                assert vehicles[1]['id'] not in store
+            raise RuntimeError('boom')
+    assert store[vehicles[0]['id']]['list_price'] == vehicles[0]['list_price']
+    assert vehicles[1]['id'] in store
+
+
+def test_records_are_shared_across_pools(pool, tmp_path, vehicles):
+    main.SQLiteStore(pool, 'vehicles').put_many(vehicles[:3])
+    other = main.SQLiteStore(main.ConnectionPool(str(tmp_path / 'test.db')), 'vehicles')
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(other[vehicles[2]['id']]))
+    thread.start()
+    thread.join()
+    assert seen == [vehicles[2]]
+
+
+def test_stores_open_the_database_on_first_use(pool, tmp_path, vehicles):
+    vehicles_store = main.SQLiteStore(pool, 'vehicles')
+    main.SQLiteCompTable(pool)
+    assert not (tmp_path / 'test.db').exists()
+    vehicles_store.put_many(vehicles[:2])
+    assert (tmp_path / 'test.db').exists()
+    late = main.SQLiteStore(pool, 'reports')
+    late['r-1'] = {'id': 'r-1'}
+    assert late['r-1'] == {'id': 'r-1'}
+    assert len(vehicles_store) == 2
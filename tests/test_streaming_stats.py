@@ -0,0 +1,55 @@
+import math
+
+import pytest
+
+import main
+
+
+def scalar_std_dev(values):
+    """The original two-pass sample standard deviation."""
+    if len(values) < 2:
+        return 0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((x - mean) ** 2 for x in values) / (len(values) - 1))
+
+
+def test_running_stats_match_two_pass(rng):
+    values = [rng.uniform(5000, 60000) for _ in range(2000)]
+    whole = main.RunningStats()
+    parts = [main.RunningStats() for _ in range(3)]
+    for i, x in enumerate(values):
+        whole.add(x)
+        parts[i % 3].add(x)
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+    for stats in (whole, merged):
+        assert stats.count == len(values)
+        assert stats.average == pytest.approx(sum(values) / len(values))
+        assert stats.std_dev == pytest.approx(scalar_std_dev(values), rel=1e-9)
+        assert (stats.min, stats.max) == (min(values), max(values))
+    assert main.RunningStats().std_dev == 0
+
+
+def test_small_digests_are_exact(rng):
+    for n in (1, 2, 3, 10, 499):
+        values = [rng.randint(5000, 60000) for _ in range(n)]
+        stats = main.StreamingStats(values)
+        assert stats.median == sorted(values)[n // 2]
+        for q in (0.1, 0.25, 0.9):
+            assert stats.quantile(q) == sorted(values)[int(q * n)]
+
+
+def test_large_digests_stay_close_to_exact_quantiles(rng):
+    values = [rng.lognormvariate(10, 0.4) for _ in range(50000)]
+    digest, halves = main.QuantileDigest(), (main.QuantileDigest(), main.QuantileDigest())
+    for i, x in enumerate(values):
+        digest.add(x)
+        halves[i % 2].add(x)
+    merged = halves[0].merge(halves[1])
+    ordered = sorted(values)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        # Within half a percent of rank of the exact quantile
+        low = ordered[int((q - 0.005) * len(ordered))]
+        high = ordered[min(int((q + 0.005) * len(ordered)), len(ordered) - 1)]
+        assert low <= digest.quantile(q) <= high
+        assert low <= merged.quantile(q) <= high
+    assert len(digest.centroids) < 500
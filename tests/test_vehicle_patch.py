@@ -0,0 +1,42 @@
+import json
+
+import main
+
+
+def stored(vehicles):
+    main.vehicles_db.put_many(vehicles)
+    return [v['id'] for v in vehicles]
+
+
+def test_bulk_ndjson_patch_matches_single_patches(client, vehicles):
+    ids = stored(vehicles[:20])
+    twins = stored([dict(v, id=f"twin-{v['id']}") for v in vehicles[:20]])
+    deltas = [{'views_7': 10 + i, 'leads_7': i % 4, 'list_price': 20000 + i * 100} for i in range(20)]
+    deltas[3] = {'views_7': 'lots'}
+
+    rows = [dict(delta, id=vehicle_id) for vehicle_id, delta in zip(ids, deltas)]
+    rows.insert(5, {'id': 'no-such-vehicle', 'views_7': 1})
+    body = '\n'.join(map(json.dumps, rows)) + '\n{broken\n'
+    result = client.patch('/api/vehicles', data=body, content_type='application/x-ndjson').get_json()
+
+    assert result['updated'] == 19
+    assert [(e['index'], e['error']) for e in result['errors']] == [
+        (3, "Invalid value for views_7: 'lots'"), (5, 'Vehicle not found'), (21, result['errors'][2]['error'])
+    ]
+    for vehicle_id, twin_id, delta in zip(ids, twins, deltas):
+        client.patch(f'/api/vehicles/{twin_id}', json=delta)
+        bulk, single = main.vehicles_db[vehicle_id], main.vehicles_db[twin_id]
+        assert dict(bulk, id=None) == dict(single, id=None)
+
+
+def test_put_after_delete_is_not_found(client, vehicles):
+    vehicle_id, = stored(vehicles[:1])
+    created_at = main.vehicles_db[vehicle_id]['created_at']
+    payload = {k: v for k, v in vehicles[0].items() if k in main.VEHICLE_FIELDS}
+
+    updated = client.put(f'/api/vehicles/{vehicle_id}', json=dict(payload, views_7=99)).get_json()['vehicle']
+    assert updated['views_7'] == 99 and updated['created_at'] == created_at
+
+    client.delete(f'/api/vehicles/{vehicle_id}')
+    assert client.put(f'/api/vehicles/{vehicle_id}', json=payload).status_code == 404
+    assert vehicle_id not in main.vehicles_db
@@ -0,0 +1,32 @@
+import sys
+
+import main
+
+
+def test_compact_record_behaves_like_the_dict(vehicles):
+    for vehicle in vehicles[:50]:
+        plain = dict(vehicle, notes='extra field kept')
+        del plain['mileage']
+        record = main.VehicleRecord(plain)
+        assert record.to_dict() == plain
+        assert dict(record) == plain and len(record) == len(plain) and list(record) == list(plain)
+        assert record.get('mileage') is None and 'mileage' not in record
+        assert record['notes'] == 'extra field kept'
+        assert not hasattr(record, '__dict__')
+
+
+def test_repeated_strings_are_interned(vehicles):
+    records = [main.VehicleRecord(dict(v, make=''.join(v['make']))) for v in vehicles]
+    makes = {r['make']: r['make'] for r in records}
+    assert all(r['make'] is makes[r['make']] for r in records)
+    assert sys.intern(records[0]['make']) is records[0]['make']
+
+
+def test_store_and_analysis_see_plain_records(vehicles):
+    main.vehicles_db.put_many(vehicles[:20])
+    for vehicle in vehicles[:20]:
+        stored = main.vehicles_db[vehicle['id']]
+        assert type(stored) is dict and stored == vehicle
+        compact = main.analyze_vehicle(main.VehicleRecord(dict(vehicle, id=None)))
+        plain = main.analyze_vehicle(dict(vehicle, id=None))
+        assert compact['pricing'] == plain['pricing'] and compact['exit_path'] == plain['exit_path']
@@ -0,0 +1,41 @@
+import json
+import threading
+
+import main
+
+LISTINGS = [
+    '2019 Honda Accord EX-L in white, clean carfax', 'red ford f150 lariat crew cab 2021',
+    {'description': 'Toyota Camry SE 2018 silver sedan'}, {'url': 'https://example.com/2017-bmw-x5-xdrive35i'},
+    'chevy silverado 1500 LTZ black 4x4', {'description': '', 'url': ''}, 42,
+]
+
+
+def test_batch_matches_single_identify(monkeypatch, client):
+    monkeypatch.setattr(main, 'WORKER_PROCESSES', 2)
+    monkeypatch.setattr(main, 'IDENTIFY_CHUNK_SIZE', 5)
+    listings = LISTINGS * 6
+    body = '\n'.join(map(json.dumps, listings)) + '\n{not json\n'
+    response = client.post('/api/vision/identify/batch', data=body, content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [line['index'] for line in lines] == list(range(len(listings) + 1))
+    assert lines[-1]['error'].startswith('Invalid JSON')
+    for listing, line in zip(listings, lines):
+        payload = {'description': listing} if isinstance(listing, str) else listing
+        single = client.post('/api/vision/identify', json=payload if isinstance(payload, dict) else {})
+        if single.status_code == 200:
+            assert line['identification'] == single.get_json()['identification']
+        else:
+            assert line['error']
+
+
+def test_pool_is_created_once_under_concurrency(monkeypatch):
+    monkeypatch.setattr(main, '_process_pool', None)
+    pools = []
+    threads = [threading.Thread(target=lambda: pools.append(main.get_process_pool())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(pool) for pool in pools}) == 1
+    pools[0].shutdown()